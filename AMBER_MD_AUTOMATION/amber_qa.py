@@ -28,6 +28,20 @@ import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 
+# Native readers shared with the rest of the repository (optional)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    from amber_native.dcd import concatenate_dcd
+    from amber_native.prmtop import read_prmtop
+    from amber_native.mask import validate_masks
+    from amber_native.segments import SegmentedTrajectory, TrajectorySegment
+except ImportError:
+    concatenate_dcd = None
+    read_prmtop = None
+    validate_masks = None
+    SegmentedTrajectory = None
+    TrajectorySegment = None
+
 # ==========================================
 # --- CONFIGURATION SECTION (EDIT THIS) ---
 # ==========================================
@@ -51,6 +65,8 @@ REPORT_DIR = "QA_REPORT"
 PLOTS_DIR = os.path.join(REPORT_DIR, "Plots")
 PDB_DIR = os.path.join(REPORT_DIR, "PDB_Snapshots")
 PROD_DCD_DIR = "PROD_DCD"
+# Global frame <-> (file, local frame, time) map of the production segments
+PROD_MANIFEST = os.path.join(PROD_DCD_DIR, "production_manifest.json")
 
 # 4. SIMULATION STEPS ORDER
 STEPS_ORDER = [
@@ -545,6 +561,15 @@ def merge_dcd_files(dcd_list):
     output_merged = os.path.join(PROD_DCD_DIR, "merged_production.dcd")
     print(f"\n--- Merging {len(dcd_list)} DCD files into {output_merged} ---")
 
+    # Segments are already imaged by generate_dcd(): concatenate the frame blocks directly
+    if concatenate_dcd is not None:
+        try:
+            n_frames = concatenate_dcd(dcd_list, output_merged)
+            print(f"    -> Merge successful ({n_frames} frames, native concatenation).")
+            return
+        except (ValueError, OSError) as e:
+            print(f"    [Warn] Native DCD concatenation not possible ({e}). Falling back to cpptraj.")
+
     script_lines = [f"parm {TOPOLOGY_FILE}"]
     for dcd in dcd_list:
         script_lines.append(f"trajin {dcd}")
@@ -595,10 +620,28 @@ def main():
     cumulative_offset_struct = 0.0 # Track structure time separately
     
     generated_dcd_paths = []
+    prod_segments = []
+    topology = None
     
     has_topology = os.path.exists(TOPOLOGY_FILE)
     if not has_topology:
         print(f"Warning: Topology '{TOPOLOGY_FILE}' not found. Skipping structural analysis.")
+    elif read_prmtop is not None:
+        try:
+            topology = read_prmtop(TOPOLOGY_FILE)
+            print(f"Topology: {topology.n_atoms} atoms, {topology.n_residues} residues.")
+            # Catch wrong masks now instead of after every cpptraj run
+            mask_problems = validate_masks(topology, {
+                'COMPLEX_MASK': COMPLEX_MASK,
+                'RECEPTOR_MASK': RECEPTOR_MASK,
+                'LIGAND_MASK': LIGAND_MASK,
+            })
+            for label, problem in mask_problems.items():
+                print(f"    [Warn] {label} {problem}")
+        except (ValueError, OSError) as e:
+            print(f"Warning: Topology '{TOPOLOGY_FILE}' could not be parsed ({e}). Skipping structural analysis.")
+            has_topology = False
+            topology = None
 
     files_to_process = find_files_to_process()
     if not files_to_process:
@@ -643,6 +686,18 @@ def main():
             struct_tool.generate_pdb_snapshot()
             df_struct = struct_tool.run_analysis()
             
+            # Exact frame timing (ntwx * dt, NetCDF time) instead of spreading frames over the step
+            segment = None
+            if TrajectorySegment is not None and topology is not None and struct_tool.trajectory:
+                try:
+                    segment = TrajectorySegment(struct_tool.trajectory, n_atoms=topology.n_atoms,
+                                                out_file=out_file, box_angles=topology.box[3:] if topology.box is not None else None)
+                    if is_prod_step(step_name):
+                        prod_segments.append(segment)
+                except (ValueError, OSError) as e:
+                    print(f"    [Warn] Could not index {os.path.basename(struct_tool.trajectory)} ({e}).")
+                    segment = None
+
             # DCD Generation
             if is_prod_step(step_name):
                 dcd_path = struct_tool.generate_dcd()
@@ -687,6 +742,12 @@ def main():
                 n_frames = len(df_struct)
                 if n_frames > 0:
                     dt_struct = actual_duration / n_frames
+                    if segment is not None:
+                        try:
+                            if segment.n_frames == n_frames and segment.resolve_dt():
+                                dt_struct = segment.dt_ps
+                        except (ValueError, OSError):
+                            pass
                     struct_time_vector = np.arange(1, n_frames + 1) * dt_struct
                     df_struct['Cum_Time_ns'] = (struct_time_vector + cumulative_offset_struct) / 1000.0
                     
@@ -703,7 +764,17 @@ def main():
         
         report.plot_production_global(final_thermo, final_struct)
 
-    # 5. DCD Merging
+    # 5. Production manifest (virtual trajectory over all segments, no merged copy needed)
+    if prod_segments:
+        try:
+            if not os.path.exists(PROD_DCD_DIR): os.makedirs(PROD_DCD_DIR)
+            production = SegmentedTrajectory(prod_segments)
+            production.save_manifest(PROD_MANIFEST)
+            print(f"Production manifest: {len(prod_segments)} segments, {production.n_frames} frames -> {PROD_MANIFEST}")
+        except (ValueError, OSError) as e:
+            print(f"    [Warn] Production manifest not written ({e}).")
+
+    # 6. DCD Merging
     if generated_dcd_paths:
         print(f"\n--- Processing {len(generated_dcd_paths)} DCD files ---")
         final_dcd_list = []
@@ -0,0 +1,8 @@
+"""
+amber_native
+============
+
+Pure-Python (NumPy) readers and analysis kernels for Amber files, shared by
+the scripts of this repository so that simple trajectory/topology operations
+do not need a cpptraj process or a loaded AMBER module.
+"""
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Presence time series stored as packed bitsets (one bit per frame).
+
+Each row (an H-bond, a contact, ...) is a packed uint8 vector in np.packbits
+bit order, so 1M frames take 125 kB per row. Occupancies, lag correlations
+and co-occurrences are popcounts of bitwise ANDs; continuous lifetimes are
+found block by block from the 0 -> 1 / 1 -> 0 transitions, carrying only the
+open run of every row between blocks.
+"""
+
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+# Dense boolean cells unpacked at a time when scanning runs
+DENSE_BUDGET = 16 * 1024 ** 2
+
+if hasattr(np, "bitwise_count"):
+    def popcount(packed: np.ndarray) -> np.ndarray:
+        """Set bits of every byte."""
+        return np.bitwise_count(packed)
+else:
+    _POPCOUNT_TABLE = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+    def popcount(packed: np.ndarray) -> np.ndarray:
+        """Set bits of every byte (lookup table for NumPy < 2.0)."""
+        return _POPCOUNT_TABLE[packed]
+
+
+def shift_bits(packed: np.ndarray, lag: int) -> np.ndarray:
+    """Rows shifted so that bit f of the result is bit f + lag of the input (zeros past the end)."""
+    n_bytes = packed.shape[1]
+    whole, bits = divmod(lag, 8)
+    shifted = np.zeros_like(packed)
+    if whole >= n_bytes:
+        return shifted
+    source = packed[:, whole:]
+    if bits == 0:
+        shifted[:, :n_bytes - whole] = source
+        return shifted
+    shifted[:, :n_bytes - whole] = source << bits
+    shifted[:, :n_bytes - whole - 1] |= source[:, 1:] >> (8 - bits)
+    return shifted
+
+
+class BitSeries:
+    """
+    Packed presence time series of many rows.
+
+    Args:
+        packed: (n_rows, ceil(n_frames / 8)) uint8 bitsets.
+        n_frames: Number of frames (bits) per row.
+    """
+
+    def __init__(self, packed: np.ndarray, n_frames: int):
+        self.packed = np.ascontiguousarray(packed, dtype=np.uint8)
+        self.n_frames = int(n_frames)
+
+    @classmethod
+    def from_events(cls, rows: Sequence[int], frames: Sequence[int], n_rows: int, n_frames: int) -> "BitSeries":
+        """Builds the bitsets from (row, frame) presence events (0-based)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        frames = np.asarray(frames, dtype=np.int64)
+        packed = np.zeros((n_rows, (n_frames + 7) // 8), dtype=np.uint8)
+        np.bitwise_or.at(packed, (rows, frames >> 3), (128 >> (frames & 7)).astype(np.uint8))
+        return cls(packed, n_frames)
+
+    @property
+    def n_rows(self) -> int:
+        return self.packed.shape[0]
+
+    def counts(self) -> np.ndarray:
+        """Frames in which every row is present."""
+        return popcount(self.packed).sum(axis=1, dtype=np.int64)
+
+    def occupancy(self) -> np.ndarray:
+        """Fraction of frames in which every row is present."""
+        return self.counts() / max(self.n_frames, 1)
+
+    def lifetimes(self, block: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        Continuous presence runs of every row.
+
+        Args:
+            block: Frames unpacked at a time (multiple of 8); sized from DENSE_BUDGET if None.
+
+        Returns:
+            Dict: 'runs' (number of runs), 'mean' and 'max' run length in frames
+            (runs still open at the last frame are closed there).
+        """
+        n_rows = self.n_rows
+        block = max(8, (block or DENSE_BUDGET // max(n_rows, 1)) // 8 * 8)
+        runs = np.zeros(n_rows, dtype=np.int64)
+        total = np.zeros(n_rows, dtype=np.int64)
+        longest = np.zeros(n_rows, dtype=np.int64)
+        open_start = np.full(n_rows, -1, dtype=np.int64)
+
+        def _close(rows, lengths):
+            np.add.at(runs, rows, 1)
+            np.add.at(total, rows, lengths)
+            np.maximum.at(longest, rows, lengths)
+
+        for first in range(0, self.n_frames, block):
+            last = min(first + block, self.n_frames)
+            bits = np.unpackbits(self.packed[:, first // 8:(last + 7) // 8], axis=1, count=last - first)
+            previous = (open_start >= 0).astype(np.int8)[:, None]
+            steps = np.diff(np.concatenate([previous, bits.astype(np.int8)], axis=1), axis=1)
+            rows, columns = np.nonzero(steps)
+            kinds = steps[rows, columns]
+            positions = columns + first
+
+            # Runs alternate start/end within a row: an end's start is the previous event
+            # of the same row, or the run carried from the previous block
+            ends = np.flatnonzero(kinds < 0)
+            same_row = (ends > 0) & (rows[np.maximum(ends - 1, 0)] == rows[ends])
+            starts = np.where(same_row, positions[np.maximum(ends - 1, 0)], open_start[rows[ends]])
+            _close(rows[ends], positions[ends] - starts)
+
+            # Rows whose last event is a start stay open; rows whose last event is an end close
+            if len(rows):
+                last_event = np.flatnonzero(np.append(rows[1:] != rows[:-1], True))
+                open_start[rows[last_event]] = np.where(kinds[last_event] > 0, positions[last_event], -1)
+
+        still_open = np.flatnonzero(open_start >= 0)
+        _close(still_open, self.n_frames - open_start[still_open])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / runs
+        return {"runs": runs, "mean": mean, "max": longest}
+
+    def lag_counts(self, max_lag: int) -> np.ndarray:
+        """(n_rows, max_lag + 1) number of origins t0 with presence at t0 and t0 + lag."""
+        counts = np.zeros((self.n_rows, max_lag + 1), dtype=np.int64)
+        for lag in range(min(max_lag, self.n_frames - 1) + 1):
+            counts[:, lag] = popcount(self.packed & shift_bits(self.packed, lag)).sum(axis=1, dtype=np.int64)
+        return counts
+
+    def autocorrelation(self, max_lag: int) -> np.ndarray:
+        """
+        Intermittent autocorrelation C(t) = <h(0) h(t)> / <h> summed over all rows.
+
+        Every lag is averaged over its N - t time origins; C(0) = 1 and presence
+        may be interrupted between 0 and t (unlike the continuous lifetime).
+        """
+        counts = self.lag_counts(max_lag).sum(axis=0)
+        origins = np.maximum(self.n_frames - np.arange(max_lag + 1), 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            correlation = (counts / origins) / (counts[0] / max(self.n_frames, 1))
+        correlation[np.arange(max_lag + 1) >= self.n_frames] = np.nan
+        return correlation
+
+    def co_occurrence(self, rows: Optional[Sequence[int]] = None) -> np.ndarray:
+        """(k, k) frames in which both rows i and j are present (diagonal: counts)."""
+        packed = self.packed if rows is None else self.packed[np.asarray(rows, dtype=np.int64)]
+        matrix = np.empty((len(packed), len(packed)), dtype=np.int64)
+        for i in range(len(packed)):
+            matrix[i, i:] = popcount(packed[i] & packed[i:]).sum(axis=1, dtype=np.int64)
+            matrix[i:, i] = matrix[i, i:]
+        return matrix
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Frame-wise set algebra over boolean frame x item matrices.
+
+Rows of K FrameSparseMatrix objects (same frames, same item columns) are
+packed block by block straight from their CSR entries into bitsets (one bit
+per item) and combined with vectorised AND / OR / NOT. "At least m of K" adds
+the K bitsets into bit-sliced counters (one packed plane per count bit) and
+compares them with m, so no input is unpacked. Only the non-zero bytes of the
+result are expanded into the returned sparse matrix, whose row lengths are
+the per-frame counts.
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .sparse import FrameSparseMatrix, SparseFrameWriter
+
+OPERATIONS = ("intersection", "union", "difference", "at_least")
+# Packed bytes per input combined at a time (frames per block = PACKED_BUDGET // bytes per row)
+PACKED_BUDGET = 16 * 1024 ** 2
+
+# Item offset (0-7) of every set bit of a byte, in np.packbits order
+_BIT_TABLE = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).astype(bool)
+
+
+def pack_rows(matrix: FrameSparseMatrix, first: int, last: int) -> np.ndarray:
+    """Rows [first, last) of a boolean matrix as packed bitsets (n_rows, ceil(n_items / 8))."""
+    n_bytes = (matrix.n_items + 7) // 8
+    start, stop = matrix.indptr[first], matrix.indptr[last]
+    rows = np.repeat(np.arange(last - first), np.diff(matrix.indptr[first:last + 1]))
+    columns = matrix.indices[start:stop]
+    # Distinct (row, item) entries set distinct bits, so summing them per byte is an OR
+    bits = np.bincount(rows * n_bytes + (columns >> 3), weights=0x80 >> (columns & 7),
+                       minlength=(last - first) * n_bytes)
+    return bits.astype(np.uint8).reshape(last - first, n_bytes)
+
+
+def count_planes(bitsets: Sequence[np.ndarray]) -> List[np.ndarray]:
+    """Per-bit counts of K bitsets as packed bit planes (least significant first), by ripple-carry adds."""
+    planes: List[np.ndarray] = []
+    for packed in bitsets:
+        carry = packed
+        for k, plane in enumerate(planes):
+            planes[k], carry = plane ^ carry, plane & carry
+        if carry.any():
+            planes.append(carry)
+    return planes
+
+
+def at_least(planes: Sequence[np.ndarray], min_count: int, shape) -> np.ndarray:
+    """Bits whose count (bit planes) is >= min_count, compared from the most significant plane down."""
+    if min_count >= 1 << len(planes):
+        return np.zeros(shape, dtype=np.uint8)
+    greater = np.zeros(shape, dtype=np.uint8)
+    equal = np.full(shape, 0xFF, dtype=np.uint8)
+    for k in reversed(range(len(planes))):
+        if (min_count >> k) & 1:
+            equal &= planes[k]
+        else:
+            greater |= equal & planes[k]
+            equal &= ~planes[k]
+    return greater | equal
+
+
+def unpack_entries(packed: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(rows, items) of the set bits, row-major; only the non-zero bytes are expanded."""
+    rows, byte_columns = np.nonzero(packed)
+    entry, offsets = np.divmod(np.flatnonzero(_BIT_TABLE[packed[rows, byte_columns]]), 8)
+    return rows[entry], byte_columns[entry] * 8 + offsets
+
+
+def combine(matrices: Sequence[FrameSparseMatrix], operation: str = "intersection",
+            min_count: Optional[int] = None, block: Optional[int] = None) -> FrameSparseMatrix:
+    """
+    Combines K aligned boolean matrices frame by frame.
+
+    Args:
+        matrices: Matrices with the same frames (rows) and items (columns).
+        operation: 'intersection' (in all), 'union' (in any), 'difference'
+            (in the first but in none of the others) or 'at_least' (in at
+            least `min_count` of the K matrices).
+        min_count: Threshold m for 'at_least'.
+        block: Frames combined at a time; sized from PACKED_BUDGET if None.
+
+    Returns:
+        FrameSparseMatrix: Boolean result with the frames and items of the inputs.
+    """
+    if operation not in OPERATIONS:
+        raise ValueError(f"Unknown operation '{operation}' (choose from {', '.join(OPERATIONS)})")
+    if not matrices:
+        raise ValueError("At least one matrix is needed")
+    reference = matrices[0]
+    for k, matrix in enumerate(matrices[1:], start=2):
+        if matrix.n_frames != reference.n_frames or not np.array_equal(matrix.frames, reference.frames):
+            raise ValueError(f"Frame mismatch between input 1 and input {k}")
+        if matrix.n_items != reference.n_items:
+            raise ValueError(f"Item columns of input {k} differ from input 1")
+    if operation == "at_least" and not min_count:
+        raise ValueError("'at_least' needs min_count >= 1")
+
+    block = block or max(1, PACKED_BUDGET // max(1, (reference.n_items + 7) // 8))
+    writer = SparseFrameWriter(reference.labels, {"operation": operation, "min_count": min_count},
+                               store_values=False)
+    for first in range(0, reference.n_frames, block):
+        last = min(first + block, reference.n_frames)
+        bitsets = [pack_rows(matrix, first, last) for matrix in matrices]
+
+        if operation == "intersection":
+            result = np.bitwise_and.reduce(bitsets)
+        elif operation == "union":
+            result = np.bitwise_or.reduce(bitsets)
+        elif operation == "difference":
+            others = np.bitwise_or.reduce(bitsets[1:]) if len(bitsets) > 1 else np.zeros_like(bitsets[0])
+            result = bitsets[0] & ~others
+        else:
+            result = at_least(count_planes(bitsets), min_count, bitsets[0].shape)
+
+        # Padding bits past the last item are never set (NOT only acts through AND with an input)
+        rows, items = unpack_entries(result)
+        writer.append_rows(reference.frames[first:last], rows, items)
+    return writer.finish()
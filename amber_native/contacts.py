@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Per-frame contact store shared by the distance_tools suite.
+
+A store is a directory with a JSON manifest, the item metadata taken from the
+prmtop (label, residue name and residue number of every column) and one
+compressed CSR chunk per block of frames. Columns always cover the whole
+topology (all residues or all atoms), so stores of different targets of the
+same system line up column by column: molecule_counter.py counts by residue
+name, intersector_counter.py intersects targets and bindingpattern_grouper.py
+groups frames straight from the integer columns, with no string parsing.
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .sparse import FrameSparseMatrix, SparseFrameWriter
+
+PathLike = Union[str, Path]
+
+CONTACT_STORE_VERSION = 1
+MANIFEST_NAME = "contacts.json"
+ITEMS_NAME = "items.npz"
+# Frames per chunk file
+CHUNK_FRAMES = 4096
+
+ITEM_RESIDUE = "residue"
+ITEM_ATOM = "atom"
+
+
+def item_metadata(topology, item_kind: str = ITEM_RESIDUE) -> Dict[str, np.ndarray]:
+    """
+    Label, residue name and 1-based residue number of every column.
+
+    Labels follow distance_analyzer.py: 'WAT_123' for residues and
+    'O@WAT_123_atom_4567' for atoms.
+    """
+    residue_names = np.asarray(topology.residue_labels, dtype=str)
+    if item_kind == ITEM_RESIDUE:
+        residues = np.arange(1, topology.n_residues + 1)
+        labels = np.char.add(np.char.add(residue_names, "_"), residues.astype(str))
+        return {"labels": labels, "names": residue_names, "residues": residues}
+    if item_kind == ITEM_ATOM:
+        residues = np.asarray(topology.atom_residues) + 1
+        names = residue_names[residues - 1]
+        atoms = np.arange(1, topology.n_atoms + 1)
+        labels = [f"{atom}@{name}_{residue}_atom_{number}"
+                  for atom, name, residue, number in zip(topology.atom_names, names, residues, atoms)]
+        return {"labels": np.asarray(labels, dtype=str), "names": names, "residues": residues}
+    raise ValueError(f"Unknown item kind '{item_kind}' (choose '{ITEM_RESIDUE}' or '{ITEM_ATOM}')")
+
+
+def is_contact_store(path: PathLike) -> bool:
+    """True for a store directory or its manifest file."""
+    path = Path(path)
+    return (path / MANIFEST_NAME).is_file() or (path.name == MANIFEST_NAME and path.is_file())
+
+
+class ContactStoreWriter:
+    """
+    Writes a contact store chunk by chunk.
+
+    Args:
+        path: Store directory (created; an existing store is replaced).
+        topology: Parsed prmtop providing the item metadata.
+        item_kind: ITEM_RESIDUE or ITEM_ATOM columns.
+        metadata: JSON-serialisable description (mode, target, range, ...).
+        store_values: Keep the distance of every contact (float32).
+        chunk_frames: Frames per chunk file.
+    """
+
+    def __init__(self, path: PathLike, topology, item_kind: str = ITEM_RESIDUE, metadata: Optional[Dict] = None,
+                 store_values: bool = True, chunk_frames: int = CHUNK_FRAMES):
+        self.path = Path(path)
+        self.items = item_metadata(topology, item_kind)
+        self.item_kind = item_kind
+        self.metadata = dict(metadata or {})
+        self.store_values = store_values
+        self.chunk_frames = chunk_frames
+        self.topology_hash = getattr(topology, "hash", "")
+        self._chunks: List[Dict] = []
+        self._buffer = self._new_buffer()
+        self._buffered = 0
+
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self.path.mkdir(parents=True)
+        with open(self.path / ITEMS_NAME, "wb") as f:
+            np.savez_compressed(f, **self.items)
+
+    @property
+    def n_items(self) -> int:
+        return len(self.items["labels"])
+
+    def _new_buffer(self) -> SparseFrameWriter:
+        return SparseFrameWriter([], store_values=self.store_values)
+
+    def append(self, frames: np.ndarray, columns: np.ndarray, mask: np.ndarray,
+               values: Optional[np.ndarray] = None) -> None:
+        """
+        Adds a block of frames.
+
+        Args:
+            frames: 1-based frame numbers of the rows.
+            columns: 0-based topology item (residue or atom) of every mask column.
+            mask: (n_rows, len(columns)) contacts to keep.
+            values: (n_rows, len(columns)) distances (ignored if store_values is False).
+        """
+        rows, local = np.nonzero(mask)
+        columns = np.asarray(columns, dtype=np.int64)
+        self._buffer.append_rows(frames, rows, columns[local],
+                                 values[rows, local] if self.store_values else None)
+        self._buffered += len(frames)
+        if self._buffered >= self.chunk_frames:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._buffered == 0:
+            return
+        chunk = self._buffer.finish()
+        name = f"chunk_{len(self._chunks):06d}.npz"
+        payload = {
+            "indptr": chunk.indptr,
+            "indices": chunk.indices.astype(np.int32 if self.n_items < 2 ** 31 else np.int64),
+            "frames": chunk.frames,
+        }
+        if chunk.data is not None:
+            payload["data"] = chunk.data
+        with open(self.path / name, "wb") as f:
+            np.savez_compressed(f, **payload)
+        self._chunks.append({"file": name, "n_frames": chunk.n_frames, "nnz": chunk.nnz,
+                             "first_frame": int(chunk.frames[0]), "last_frame": int(chunk.frames[-1])})
+        self._buffer = self._new_buffer()
+        self._buffered = 0
+
+    def close(self) -> "ContactStore":
+        """Flushes the last chunk and writes the manifest (atomically)."""
+        self._flush()
+        manifest = {
+            "version": CONTACT_STORE_VERSION,
+            "item_kind": self.item_kind,
+            "n_items": self.n_items,
+            "n_frames": sum(chunk["n_frames"] for chunk in self._chunks),
+            "has_values": self.store_values,
+            "topology_hash": self.topology_hash,
+            "metadata": self.metadata,
+            "chunks": self._chunks,
+        }
+        manifest_file = self.path / MANIFEST_NAME
+        partial = manifest_file.with_name(f"{manifest_file.name}.{os.getpid()}.part")
+        with open(partial, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(partial, manifest_file)
+        return ContactStore(self.path)
+
+
+class ContactStore:
+    """
+    Read access to a contact store.
+
+    Args:
+        path: Store directory (or its contacts.json manifest).
+    """
+
+    def __init__(self, path: PathLike):
+        path = Path(path)
+        self.path = path.parent if path.name == MANIFEST_NAME else path
+        with open(self.path / MANIFEST_NAME) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != CONTACT_STORE_VERSION:
+            raise ValueError(f"{self.path}: unsupported contact store version {self.manifest.get('version')}")
+        with np.load(self.path / ITEMS_NAME, allow_pickle=False) as f:
+            self.labels = f["labels"]
+            self.names = f["names"]
+            self.residues = f["residues"]
+        self.item_kind = self.manifest["item_kind"]
+        self.metadata = self.manifest.get("metadata", {})
+
+    @property
+    def n_frames(self) -> int:
+        return int(self.manifest["n_frames"])
+
+    @property
+    def n_items(self) -> int:
+        return len(self.labels)
+
+    @property
+    def nnz(self) -> int:
+        return sum(chunk["nnz"] for chunk in self.manifest["chunks"])
+
+    def iter_chunks(self) -> Iterator[FrameSparseMatrix]:
+        """Yields every chunk as a FrameSparseMatrix over all item columns."""
+        for chunk in self.manifest["chunks"]:
+            with np.load(self.path / chunk["file"], allow_pickle=False) as f:
+                yield FrameSparseMatrix(f["indptr"], f["indices"], f["data"] if "data" in f else None,
+                                        self.labels, f["frames"], self.metadata)
+
+    def to_matrix(self, values: bool = True) -> FrameSparseMatrix:
+        """The whole store as one FrameSparseMatrix (boolean if `values` is False)."""
+        counts, indices, data, frames = [], [], [], []
+        for chunk in self.iter_chunks():
+            counts.append(np.diff(chunk.indptr))
+            indices.append(chunk.indices)
+            frames.append(chunk.frames)
+            if values and chunk.data is not None:
+                data.append(chunk.data)
+        indptr = np.concatenate([[0], np.cumsum(np.concatenate(counts))]) if counts else np.zeros(1, dtype=np.int64)
+        return FrameSparseMatrix(indptr,
+                                 np.concatenate(indices) if indices else np.empty(0, dtype=np.int64),
+                                 np.concatenate(data) if data else None,
+                                 self.labels,
+                                 np.concatenate(frames) if frames else np.empty(0, dtype=np.int64),
+                                 self.metadata)
+
+    def name_codes(self, names: Sequence[str]) -> np.ndarray:
+        """Index into `names` of every item column's residue name (-1 if not requested)."""
+        lookup = {name: k for k, name in enumerate(names)}
+        unique, inverse = np.unique(self.names, return_inverse=True)
+        return np.array([lookup.get(str(name), -1) for name in unique], dtype=np.int64)[inverse]
+
+    def count_by_name(self, names: Sequence[str]) -> Iterator[Tuple[FrameSparseMatrix, np.ndarray, np.ndarray]]:
+        """
+        Per-frame counts of contacts by residue name.
+
+        Args:
+            names: Residue names to count (e.g. ['WAT', 'K+', 'Cl-']).
+
+        Yields:
+            Tuple: (chunk, codes, counts) with the chunk, the name index of
+            every stored contact (-1 if not requested) and the
+            (n_frames, len(names)) counts.
+        """
+        item_codes = self.name_codes(names)
+        k = max(1, len(names))
+        for chunk in self.iter_chunks():
+            codes = item_codes[chunk.indices]
+            keep = codes >= 0
+            flat = chunk.row_ids()[keep] * k + codes[keep]
+            counts = np.bincount(flat, minlength=chunk.n_frames * k).reshape(chunk.n_frames, k)
+            yield chunk, codes, counts[:, :len(names)]
+
+    def contacted_items(self, names: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Item columns in contact in at least one frame (optionally only those named `names`)."""
+        seen = np.zeros(self.n_items, dtype=bool)
+        for chunk in self.iter_chunks():
+            seen[chunk.indices] = True
+        if names is not None:
+            seen &= self.name_codes(names) >= 0
+        return np.flatnonzero(seen)
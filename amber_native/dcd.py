@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+CHARMM/NAMD DCD trajectories (as written by cpptraj ``trajout ... dcd``).
+
+The file is a sequence of Fortran unformatted records:
+
+    [CORD + 20 int32 ICNTRL]  [NTITLE + titles]  [NATOM]
+    per frame: [unit cell, 6 float64] (optional)  [X]  [Y]  [Z]
+
+Because every frame has the same byte size, segments that share topology and
+header settings can be concatenated by copying their frame blocks verbatim, and
+the coordinates of any frame can be addressed directly in a memory map.
+"""
+
+import math
+import os
+import struct
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+PathLike = Union[str, Path]
+
+# ICNTRL indices (0-based) inside the first record
+ICNTRL_NSET = 0
+ICNTRL_ISTART = 1
+ICNTRL_NSAVC = 2
+ICNTRL_NSTEP = 3
+ICNTRL_NAMNF = 8
+ICNTRL_DELTA = 9
+ICNTRL_UNITCELL = 10
+ICNTRL_4D = 11
+ICNTRL_CHARMM_VERSION = 19
+
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+
+
+class DCDHeader:
+    """Parsed DCD header plus the layout information needed to seek frames."""
+
+    def __init__(self, path: PathLike):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            probe = f.read(12)
+            self.endian, self.marker_size = self._detect_layout(probe)
+
+            f.seek(0)
+            icntrl_record = self._read_record(f)
+            if icntrl_record[:4] != b"CORD" or len(icntrl_record) != 84:
+                raise ValueError(f"{self.path}: not a CHARMM/NAMD DCD file")
+            self.icntrl = list(struct.unpack(f"{self.endian}20i", icntrl_record[4:]))
+            self.delta = struct.unpack(f"{self.endian}f", icntrl_record[4 + 4 * ICNTRL_DELTA:8 + 4 * ICNTRL_DELTA])[0]
+
+            title_record = self._read_record(f)
+            ntitle = struct.unpack(f"{self.endian}i", title_record[:4])[0]
+            self.titles = [title_record[4 + 80 * i:84 + 80 * i].decode("ascii", errors="replace").rstrip()
+                           for i in range(ntitle)]
+
+            natom_record = self._read_record(f)
+            self.n_atoms = struct.unpack(f"{self.endian}i", natom_record[:4])[0]
+
+            self.header_size = f.tell()
+            f.seek(0)
+            self.raw = f.read(self.header_size)
+
+        if self.icntrl[ICNTRL_NAMNF] != 0:
+            raise ValueError(f"{self.path}: DCD files with fixed atoms (NAMNF > 0) are not supported")
+
+        is_charmm = self.icntrl[ICNTRL_CHARMM_VERSION] != 0
+        self.has_unitcell = is_charmm and self.icntrl[ICNTRL_UNITCELL] == 1
+        self.has_4d = is_charmm and self.icntrl[ICNTRL_4D] == 1
+
+        coord_record = 2 * self.marker_size + 4 * self.n_atoms
+        self.frame_size = 3 * coord_record
+        if self.has_unitcell:
+            self.frame_size += 2 * self.marker_size + 48
+        if self.has_4d:
+            self.frame_size += coord_record
+
+        file_size = self.path.stat().st_size
+        # Trust the file size over NSET: a crashed writer may not have updated it
+        self.n_frames = (file_size - self.header_size) // self.frame_size
+        self.trailing_bytes = (file_size - self.header_size) % self.frame_size
+
+    @property
+    def nset(self) -> int:
+        return self.icntrl[ICNTRL_NSET]
+
+    @property
+    def istart(self) -> int:
+        return self.icntrl[ICNTRL_ISTART]
+
+    @property
+    def nsavc(self) -> int:
+        return self.icntrl[ICNTRL_NSAVC]
+
+    @staticmethod
+    def _detect_layout(probe: bytes):
+        """Returns (struct endian prefix, Fortran record marker size)."""
+        for endian in ("<", ">"):
+            if len(probe) >= 8 and struct.unpack(f"{endian}i", probe[:4])[0] == 84 and probe[4:8] == b"CORD":
+                return endian, 4
+            if len(probe) >= 12 and struct.unpack(f"{endian}q", probe[:8])[0] == 84 and probe[8:12] == b"CORD":
+                return endian, 8
+        raise ValueError("Unrecognised DCD header (bad record marker or missing CORD tag)")
+
+    def _read_record(self, f) -> bytes:
+        fmt = f"{self.endian}{'i' if self.marker_size == 4 else 'q'}"
+        head = f.read(self.marker_size)
+        if len(head) != self.marker_size:
+            raise ValueError(f"{self.path}: truncated DCD header")
+        length = struct.unpack(fmt, head)[0]
+        payload = f.read(length)
+        tail = f.read(self.marker_size)
+        if len(payload) != length or len(tail) != self.marker_size or struct.unpack(fmt, tail)[0] != length:
+            raise ValueError(f"{self.path}: corrupted Fortran record in DCD header")
+        return payload
+
+    def patched_header(self, nset: int, istart: int) -> bytes:
+        """Returns the raw header bytes with NSET/ISTART (and NSTEP) rewritten."""
+        icntrl = list(self.icntrl)
+        icntrl[ICNTRL_NSET] = nset
+        icntrl[ICNTRL_ISTART] = istart
+        if icntrl[ICNTRL_NSTEP] != 0:
+            icntrl[ICNTRL_NSTEP] = istart + nset * max(self.nsavc, 1)
+        # DELTA is a float32 living in the int32 slot, keep its original bytes
+        start = self.marker_size + 4
+        packed = bytearray(struct.pack(f"{self.endian}20i", *icntrl))
+        packed[4 * ICNTRL_DELTA:4 * ICNTRL_DELTA + 4] = self.raw[start + 4 * ICNTRL_DELTA:start + 4 * ICNTRL_DELTA + 4]
+        return self.raw[:start] + bytes(packed) + self.raw[start + 80:]
+
+
+def validate_dcd_headers(headers: Sequence[DCDHeader]) -> None:
+    """
+    Checks that DCD segments can be concatenated byte-for-byte.
+
+    Raises:
+        ValueError: if NATOM, unit cell flag, timestep, save frequency or the
+            binary layout differ between segments.
+    """
+    reference = headers[0]
+    for header in headers[1:]:
+        name = header.path.name
+        if header.n_atoms != reference.n_atoms:
+            raise ValueError(f"{name}: NATOM {header.n_atoms} differs from {reference.n_atoms} in {reference.path.name}")
+        if header.has_unitcell != reference.has_unitcell:
+            raise ValueError(f"{name}: unit cell flag differs from {reference.path.name}")
+        if header.has_4d != reference.has_4d:
+            raise ValueError(f"{name}: 4D flag differs from {reference.path.name}")
+        if not math.isclose(header.delta, reference.delta, rel_tol=1e-6, abs_tol=1e-12):
+            raise ValueError(f"{name}: timestep {header.delta} differs from {reference.delta} in {reference.path.name}")
+        if header.nsavc != reference.nsavc:
+            raise ValueError(f"{name}: NSAVC {header.nsavc} differs from {reference.nsavc} in {reference.path.name}")
+        if (header.endian, header.marker_size) != (reference.endian, reference.marker_size):
+            raise ValueError(f"{name}: byte order or record marker size differs from {reference.path.name}")
+
+
+def _copy_range(src_fd: int, dst_fd: int, offset: int, count: int) -> None:
+    """Copies `count` bytes from `src_fd` at `offset` to the current position of `dst_fd`."""
+    if hasattr(os, "sendfile"):
+        try:
+            while count > 0:
+                sent = os.sendfile(dst_fd, src_fd, offset, min(count, 0x7FFFF000))
+                if sent == 0:
+                    raise ValueError("Unexpected end of file while copying DCD frames")
+                offset += sent
+                count -= sent
+            return
+        except OSError:
+            # e.g. filesystems without sendfile support; continue from where it stopped
+            pass
+
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    while count > 0:
+        chunk = os.read(src_fd, min(count, COPY_BUFFER_SIZE))
+        if not chunk:
+            raise ValueError("Unexpected end of file while copying DCD frames")
+        view = memoryview(chunk)
+        while view:
+            written = os.write(dst_fd, view)
+            view = view[written:]
+        count -= len(chunk)
+
+
+def concatenate_dcd(dcd_files: Sequence[PathLike], output_file: PathLike) -> int:
+    """
+    Concatenates already-imaged DCD segments without cpptraj.
+
+    Headers are validated first; then the frame blocks are streamed with
+    ``os.sendfile`` (buffered copy as fallback) and the header of the first
+    segment is written once with the final NSET/ISTART.
+
+    Args:
+        dcd_files: Segments in chronological order.
+        output_file: Path of the merged DCD.
+
+    Returns:
+        int: Number of frames written.
+    """
+    if not dcd_files:
+        raise ValueError("No DCD files to concatenate")
+
+    output_path = Path(output_file)
+    resolved_inputs = {Path(p).resolve() for p in dcd_files}
+    if output_path.resolve() in resolved_inputs:
+        raise ValueError(f"Output {output_path} is also one of the input segments")
+
+    headers: List[DCDHeader] = [DCDHeader(p) for p in dcd_files]
+    validate_dcd_headers(headers)
+
+    total_frames = sum(h.n_frames for h in headers)
+    first = headers[0]
+
+    partial_path = output_path.with_name(output_path.name + ".part")
+    try:
+        with open(partial_path, "wb", buffering=0) as dst:
+            dst.write(first.patched_header(total_frames, first.istart))
+            for header in headers:
+                with open(header.path, "rb", buffering=0) as src:
+                    _copy_range(src.fileno(), dst.fileno(), header.header_size,
+                                header.n_frames * header.frame_size)
+        os.replace(partial_path, output_path)
+    except BaseException:
+        # Never leave a part-written copy of the whole run behind (the disk may be full)
+        partial_path.unlink(missing_ok=True)
+        raise
+
+    return total_frames
+
+
+class DCDReader:
+    """
+    Memory-mapped DCD trajectory with random frame access.
+
+    ``xyz`` is a zero-copy strided view of shape (n_frames, n_atoms, 3) over the
+    file: X, Y and Z records of a frame are simply three different strides into
+    the map. Slicing or fancy indexing it only touches the pages of the frames
+    that are requested.
+    """
+
+    def __init__(self, path: PathLike):
+        self.header = DCDHeader(path)
+        self.path = self.header.path
+        self.n_atoms = self.header.n_atoms
+        self.n_frames = self.header.n_frames
+
+        h = self.header
+        coord_record = 2 * h.marker_size + 4 * h.n_atoms
+        first_coord = h.header_size + h.marker_size
+        cell_offset = None
+        if h.has_unitcell:
+            cell_offset = first_coord
+            first_coord += 2 * h.marker_size + 48
+
+        if self.n_frames == 0:
+            self._map = None
+            self.xyz = np.empty((0, self.n_atoms, 3), dtype=np.float32)
+            self._raw_cells = np.empty((0, 6), dtype=np.float64) if h.has_unitcell else None
+            return
+
+        self._map = np.memmap(self.path, dtype=np.uint8, mode="r")
+        self.xyz = np.ndarray(
+            shape=(self.n_frames, self.n_atoms, 3),
+            dtype=np.dtype(f"{h.endian}f4"),
+            buffer=self._map,
+            offset=first_coord,
+            strides=(h.frame_size, 4, coord_record),
+        )
+        self._raw_cells = None
+        if cell_offset is not None:
+            self._raw_cells = np.ndarray(
+                shape=(self.n_frames, 6),
+                dtype=np.dtype(f"{h.endian}f8"),
+                buffer=self._map,
+                offset=cell_offset,
+                strides=(h.frame_size, 8),
+            )
+
+    def __len__(self) -> int:
+        return self.n_frames
+
+    def __getitem__(self, key) -> np.ndarray:
+        """Coordinates of the selected frames as a native float32 array."""
+        return np.asarray(self.xyz[key], dtype=np.float32)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        """Drops the views; the map is released once no slice refers to it."""
+        self.xyz = None
+        self._raw_cells = None
+        self._map = None
+
+    @property
+    def has_unitcell(self) -> bool:
+        return self._raw_cells is not None
+
+    def unit_cells(self, key=slice(None)) -> Optional[np.ndarray]:
+        """
+        Unit cells of the selected frames as (a, b, c, alpha, beta, gamma).
+
+        DCD stores them as (A, gamma, B, beta, alpha, C); angles written as
+        cosines (CHARMM >= c25) are converted back to degrees, like VMD does.
+        """
+        if self._raw_cells is None:
+            return None
+        raw = np.asarray(self._raw_cells[key], dtype=np.float64)
+        cells = raw[..., [0, 2, 5, 4, 3, 1]].copy()
+        angles = cells[..., 3:]
+        if angles.size and np.all(np.abs(angles) <= 1.0):
+            cells[..., 3:] = np.degrees(np.arccos(angles))
+        return cells
+
+    def iter_chunks(self, chunk_size: int = 512, indices: Optional[np.ndarray] = None):
+        """Yields (frame_indices, xyz) blocks of at most `chunk_size` frames."""
+        frames = np.arange(self.n_frames) if indices is None else np.asarray(indices)
+        for start in range(0, len(frames), chunk_size):
+            block = frames[start:start + chunk_size]
+            yield block, self[block]
+
+
+def extract_dcd_frames(dcd_file: PathLike, frame_indices: Sequence[int], output_file: PathLike) -> int:
+    """
+    Writes the selected frames (0-based, in the given order) to a new DCD.
+
+    Frame blocks are copied byte-for-byte, so coordinates and unit cells are
+    preserved exactly and nothing is decoded.
+
+    Returns:
+        int: Number of frames written.
+    """
+    header = DCDHeader(dcd_file)
+    indices = np.asarray(frame_indices, dtype=np.int64)
+    if indices.size and (indices.min() < 0 or indices.max() >= header.n_frames):
+        raise ValueError(f"{header.path.name}: frame index out of range (trajectory has {header.n_frames} frames)")
+
+    output_path = Path(output_file)
+    if output_path.resolve() == header.path.resolve():
+        raise ValueError(f"Output {output_path} is the input trajectory")
+
+    partial_path = output_path.with_name(output_path.name + ".part")
+    with open(partial_path, "wb", buffering=0) as dst, open(header.path, "rb", buffering=0) as src:
+        dst.write(header.patched_header(len(indices), header.istart))
+        # Merge runs of consecutive frames into a single copy
+        run_start = 0
+        for i in range(1, len(indices) + 1):
+            if i == len(indices) or indices[i] != indices[i - 1] + 1:
+                offset = header.header_size + int(indices[run_start]) * header.frame_size
+                _copy_range(src.fileno(), dst.fileno(), offset, (i - run_start) * header.frame_size)
+                run_start = i
+    os.replace(partial_path, output_path)
+
+    return len(indices)
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Vectorised dihedral angles and circular state classification (the engine
+behind multi_dihedral_analyzer.py).
+
+All configured torsions of a chunk of frames are computed at once from the
+bond vectors b1, b2, b3 (cross products and arctan2, as cpptraj `dihedral`
+with `range360`). Every torsion's circular states (any number, from a JSON
+state table or discovered from the minima of the angle histogram) are
+compiled into sorted bin edges plus a lookup table of mixed-radix place
+values, so a frame's whole conformation is one integer: a sum of one
+np.digitize lookup per torsion. Labels (e.g. 'AAKLRRYY') are only built for
+the distinct codes.
+
+State table (JSON):
+
+    {
+      "dihedrals": [
+        {"name": "dihedral_1R1", "atoms": [1, 2, 15, 16], "states": "dihedral_1"},
+        {"name": "dihedral_5R1", "atoms": [19, 21, 22, 23], "states": "dihedral_5"}
+      ],
+      "states": {
+        "dihedral_1": [{"label": "A", "range": [271, 90]}, {"label": "B", "range": [91, 270]}],
+        "dihedral_5": {"auto": {"max_states": 3, "labels": ["P", "S", "T"]}}
+      }
+    }
+
+Atoms are 1-based; ranges are half-open [low, high) degrees and wrap if
+low > high; earlier states win where ranges overlap and angles outside every
+range are labelled 'X'. Torsions sharing a state set (symmetric arms) pool
+their histograms for the automatic discovery.
+"""
+
+import json
+import string
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .pbc import minimum_image
+
+# Frames read per chunk
+CHUNK_FRAMES = 4096
+# Label of angles outside every range
+UNASSIGNED = "X"
+# Automatic state discovery: histogram bin width (degrees), most states per
+# torsion, and smallest peak kept (fraction of the highest one)
+AUTO_BIN_WIDTH = 5.0
+AUTO_MAX_STATES = 4
+AUTO_MIN_PEAK = 0.05
+
+PathLike = Union[str, Path]
+
+
+def dihedral_angles(xyz: np.ndarray, quads: np.ndarray, boxes: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Dihedral angles of many atom quadruplets in many frames.
+
+    Args:
+        xyz: (n_frames, n_atoms, 3) coordinates.
+        quads: (n_dihedrals, 4) atom indices into axis 1 of `xyz`.
+        boxes: Optional (n_frames, 6) boxes (bond vectors are minimum-imaged).
+
+    Returns:
+        np.ndarray: (n_frames, n_dihedrals) angles in degrees, in [0, 360).
+    """
+    quads = np.asarray(quads, dtype=np.int64).reshape(-1, 4)
+    points = np.asarray(xyz, dtype=np.float64)[:, quads]  # (n_frames, n_dihedrals, 4, 3)
+    n_frames, n_dihedrals = points.shape[:2]
+    bonds = np.diff(points, axis=2).reshape(n_frames, n_dihedrals * 3, 3)
+    b1, b2, b3 = np.moveaxis(minimum_image(bonds, boxes).reshape(n_frames, n_dihedrals, 3, 3), 2, 0)
+
+    n1 = np.cross(b1, b2)
+    n2 = np.cross(b2, b3)
+    x = np.einsum("...k,...k->...", n1, n2)
+    y = np.linalg.norm(b2, axis=-1) * np.einsum("...k,...k->...", b1, n2)
+    return np.degrees(np.arctan2(y, x)) % 360.0
+
+
+def iter_dihedrals(trajectory, quads: np.ndarray, chunk_frames: int = CHUNK_FRAMES, start: int = 0,
+                   stop: Optional[int] = None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Streams the dihedral angles of a trajectory, reading only the atoms involved.
+
+    Args:
+        trajectory: Any reader with iter_chunks() (SegmentedTrajectory, NetCDFTrajectory).
+        quads: (n_dihedrals, 4) atom indices (0-based).
+        chunk_frames: Frames per chunk.
+        start, stop: Frame range (0-based, stop exclusive).
+
+    Yields:
+        Tuple: (0-based trajectory frames, (n_frames, n_dihedrals) angles in degrees).
+    """
+    atoms, local = np.unique(np.asarray(quads, dtype=np.int64), return_inverse=True)
+    local = local.reshape(-1, 4)
+    for frames, xyz, boxes in trajectory.iter_chunks(chunk_frames, start=start, stop=stop, atom_indices=atoms):
+        yield frames, dihedral_angles(xyz, local, boxes)
+
+
+def circular_histogram(angles: np.ndarray, bin_width: float = AUTO_BIN_WIDTH) -> np.ndarray:
+    """(n_dihedrals, 360 / bin_width) counts of (n_frames, n_dihedrals) angles in [0, 360)."""
+    angles = np.asarray(angles).reshape(len(angles), -1)
+    n_bins = int(round(360.0 / bin_width))
+    bins = np.minimum((angles % 360.0 / (360.0 / n_bins)).astype(np.int64), n_bins - 1)
+    bins += np.arange(angles.shape[1]) * n_bins
+    return np.bincount(bins.ravel(), minlength=angles.shape[1] * n_bins).reshape(-1, n_bins)
+
+
+def in_circular_range(angles, low: float, high: float):
+    """[low, high) on the circle (e.g. (271, 90) means [271, 360) U [0, 90))."""
+    if low <= high:
+        return (angles >= low) & (angles < high)
+    return (angles >= low) | (angles < high)
+
+
+class CircularBins:
+    """
+    Circular state ranges of one torsion compiled into a digitize lookup.
+
+    The range bounds split [0, 360) into elementary intervals; each interval
+    belongs to the first range containing it (or to none), so classifying is
+    np.digitize plus one table lookup.
+
+    Args:
+        ranges: (low, high) of every state in degrees, half-open [low, high), wrapping
+            if low > high; (0, 360) is the full circle.
+        labels: Label of every state.
+    """
+
+    def __init__(self, ranges: Sequence[Tuple[float, float]], labels: Sequence[str]):
+        if len(ranges) != len(labels):
+            raise ValueError(f"{len(ranges)} ranges but {len(labels)} labels")
+        if len(set(labels)) != len(labels) or UNASSIGNED in labels:
+            raise ValueError(f"State labels must be distinct and not '{UNASSIGNED}': {list(labels)}")
+        self.ranges = [(float(low) % 360.0, 360.0 if float(high) == 360.0 else float(high) % 360.0)
+                       for low, high in ranges]
+        self.labels = list(labels)
+        bounds = np.array([0.0] + [bound for pair in self.ranges for bound in pair])
+        self.edges = np.unique(bounds[bounds < 360.0])
+        midpoints = (self.edges + np.append(self.edges[1:], 360.0)) / 2
+        self.lookup = np.full(len(self.edges), self.n_states, dtype=np.int64)
+        for state in reversed(range(self.n_states)):
+            self.lookup[in_circular_range(midpoints, *self.ranges[state])] = state
+
+    @classmethod
+    def discover(cls, counts: np.ndarray, labels: Optional[Sequence[str]] = None,
+                 max_states: int = AUTO_MAX_STATES, min_peak: float = AUTO_MIN_PEAK) -> "CircularBins":
+        """
+        States separated at the minima of a circular angle histogram.
+
+        The histogram is smoothed over three bins; its peaks (at most `max_states`,
+        each at least `min_peak` of the highest) become states whose boundaries are
+        at the lowest point between consecutive peaks: the centre of the longest
+        run of lowest bins (e.g. an empty valley), or the parabolic vertex around
+        a single lowest bin. States are labelled in angle
+        order ('A', 'B', ... unless `labels` is given).
+
+        Args:
+            counts: Circular histogram over [0, 360) (see circular_histogram()).
+            labels: Optional labels, at least as many as the states found.
+            max_states: Most states kept (highest peaks first).
+            min_peak: Smallest peak height, as a fraction of the highest peak.
+        """
+        counts = np.asarray(counts, dtype=np.float64)
+        n_bins = len(counts)
+        width = 360.0 / n_bins
+        smooth = (np.roll(counts, 1) + counts + np.roll(counts, -1)) / 3
+        peaks = np.flatnonzero((smooth > np.roll(smooth, 1)) & (smooth >= np.roll(smooth, -1)) &
+                               (smooth >= min_peak * smooth.max()) & (smooth > 0))
+        peaks = np.sort(peaks[np.argsort(-smooth[peaks], kind="stable")][:max_states])
+
+        if len(peaks) <= 1:
+            ranges = [(0.0, 360.0)]
+        else:
+            # Boundary after every peak: centre of the longest run of lowest bins before the next peak
+            boundaries = []
+            for peak, following in zip(peaks, np.roll(peaks, -1)):
+                arc = (peak + 1 + np.arange((following - peak - 1) % n_bins)) % n_bins
+                if len(arc) == 0:
+                    boundaries.append(following * width)
+                    continue
+                lowest = np.concatenate([[0], smooth[arc] == smooth[arc].min(), [0]]).astype(np.int8)
+                starts, ends = np.flatnonzero(np.diff(lowest) == 1), np.flatnonzero(np.diff(lowest) == -1)
+                run = np.argmax(ends - starts)
+                centre = arc[starts[run]] + (ends[run] - starts[run]) / 2
+                if ends[run] - starts[run] == 1:
+                    # Single lowest bin: vertex of the parabola through it and its neighbours
+                    left, middle, right = smooth[(arc[starts[run]] + np.array([-1, 0, 1])) % n_bins]
+                    curvature = left - 2 * middle + right
+                    if curvature > 0:
+                        centre += np.clip(0.5 * (left - right) / curvature, -0.5, 0.5)
+                boundaries.append(centre * width % 360.0)
+            ranges = list(zip(np.roll(boundaries, 1), boundaries))
+
+        labels = list(labels) if labels is not None else list(string.ascii_uppercase)
+        if len(labels) < len(ranges):
+            raise ValueError(f"{len(ranges)} states found but only {len(labels)} labels given")
+        return cls(ranges, labels[:len(ranges)])
+
+    @property
+    def n_states(self) -> int:
+        return len(self.labels)
+
+    def classify(self, angles: np.ndarray) -> np.ndarray:
+        """State index of every angle (n_states for angles outside every range)."""
+        return self.lookup[np.digitize(np.asarray(angles) % 360.0, self.edges) - 1]
+
+
+class ConformationClassifier:
+    """
+    Mixed-radix conformation codes of several torsions.
+
+    Torsion k has n_states_k + 1 digits (the last one is 'unassigned'); the
+    first torsion is the most significant digit. Every torsion's lookup table
+    is pre-multiplied by its place value, so encoding a chunk is one digitize,
+    one lookup and one addition per torsion.
+
+    Args:
+        bins: One CircularBins per torsion, in column order.
+    """
+
+    def __init__(self, bins: Sequence[CircularBins]):
+        self.bins = list(bins)
+        self.radices = np.array([b.n_states + 1 for b in self.bins], dtype=np.int64)
+        if np.sum(np.log2(self.radices.astype(np.float64))) >= 63:
+            raise ValueError("Too many torsions/states for a 64-bit conformation code")
+        self.place_values = np.append(np.cumprod(self.radices[::-1])[::-1][1:], 1).astype(np.int64)
+        self._weighted = [b.lookup * place for b, place in zip(self.bins, self.place_values)]
+
+    @property
+    def n_conformations(self) -> int:
+        """Number of possible codes (including unassigned digits)."""
+        return int(np.prod(self.radices))
+
+    def encode(self, angles: np.ndarray) -> np.ndarray:
+        """int64 conformation code of every row of (n_frames, n_torsions) angles."""
+        angles = np.asarray(angles).reshape(-1, len(self.bins)) % 360.0
+        codes = np.zeros(len(angles), dtype=np.int64)
+        for column, (bins, weighted) in enumerate(zip(self.bins, self._weighted)):
+            codes += weighted[np.digitize(angles[:, column], bins.edges) - 1]
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """(n, n_torsions) state index of every torsion (n_states = unassigned)."""
+        codes = np.asarray(codes, dtype=np.int64)
+        return (codes[:, None] // self.place_values) % self.radices
+
+    def label(self, code: int) -> str:
+        """Conformation label of one code (e.g. 'AAKLRRYY'; 'X' = unassigned)."""
+        digits = self.decode(np.array([code]))[0]
+        return "".join(bins.labels[digit] if digit < bins.n_states else UNASSIGNED
+                       for bins, digit in zip(self.bins, digits))
+
+    def labels(self, codes: np.ndarray) -> Tuple[List[str], np.ndarray]:
+        """
+        Conformation labels of many frames.
+
+        Returns:
+            Tuple: (distinct labels, index of every frame's label), built from the
+            distinct codes only.
+        """
+        unique, inverse = np.unique(np.asarray(codes, dtype=np.int64), return_inverse=True)
+        return [self.label(code) for code in unique], inverse.ravel()
+
+
+class StateTable:
+    """
+    Torsions and state definitions of a JSON state table (format in the module docstring).
+
+    Args:
+        config_file: Path to the JSON file.
+    """
+
+    def __init__(self, config_file: PathLike):
+        self.path = Path(config_file)
+        with open(self.path) as f:
+            config = json.load(f)
+        try:
+            dihedrals = config["dihedrals"]
+            self.states: Dict[str, object] = config["states"]
+        except KeyError as exc:
+            raise ValueError(f"{self.path}: missing '{exc.args[0]}' section") from None
+
+        self.names = [str(d["name"]) for d in dihedrals]
+        self.state_sets = [str(d["states"]) for d in dihedrals]
+        self.quads = np.array([d["atoms"] for d in dihedrals], dtype=np.int64).reshape(-1, 4) - 1
+        if len(self.quads) != len(self.names) or np.any(self.quads < 0):
+            raise ValueError(f"{self.path}: every dihedral needs four 1-based atom numbers")
+        missing = sorted(set(self.state_sets) - set(self.states))
+        if missing:
+            raise ValueError(f"{self.path}: undefined state sets {missing}")
+
+    def auto_sets(self) -> List[str]:
+        """State sets to be discovered from the angle histograms."""
+        return sorted({name for name in self.state_sets
+                       if isinstance(self.states[name], dict) and "auto" in self.states[name]})
+
+    def auto_bin_width(self, name: str) -> float:
+        return float(self.states[name]["auto"].get("bin_width", AUTO_BIN_WIDTH))
+
+    def classifier(self, histograms: Optional[Dict[str, np.ndarray]] = None) -> ConformationClassifier:
+        """
+        Compiles the table.
+
+        Args:
+            histograms: Circular histogram of every automatic state set (pooled over
+                the torsions sharing it); needed if the table has automatic sets.
+        """
+        compiled: Dict[str, CircularBins] = {}
+        for name in sorted(set(self.state_sets)):
+            spec = self.states[name]
+            if name in self.auto_sets():
+                if histograms is None or name not in histograms:
+                    raise ValueError(f"State set '{name}' is automatic: its angle histogram is needed")
+                options = spec["auto"]
+                compiled[name] = CircularBins.discover(histograms[name], options.get("labels"),
+                                                       int(options.get("max_states", AUTO_MAX_STATES)),
+                                                       float(options.get("min_peak", AUTO_MIN_PEAK)))
+            else:
+                compiled[name] = CircularBins([state["range"] for state in spec], [state["label"] for state in spec])
+        return ConformationClassifier([compiled[name] for name in self.state_sets])
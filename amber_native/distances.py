@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Vectorised target-to-everything distances (the engine behind
+distance_tools/distance_analyzer.py).
+
+Each trajectory chunk is read once and the distances from the target to all
+residues (centre of mass, as cpptraj `distance`, or geometric centre, as with
+`geom`) or to all atoms are computed as a single NumPy broadcast, with minimum
+imaging when the trajectory has a box (like cpptraj `distance`). Minimum heavy-atom residue distances are reduced
+per residue with np.minimum.reduceat over the prmtop residue pointers.
+"""
+
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from .mask import select_mask
+from .neighbors import find_pairs
+from .pbc import minimum_image
+
+MODE_RESIDUE_RESIDUE = 1
+MODE_ATOM_RESIDUE = 2
+MODE_ATOM_ATOM = 3
+MODE_MIN_HEAVY = 4
+
+HEAVY_ATOM_MASK = "!(@/H|@/EP)"
+
+# Working memory per chunk (coordinates + displacements) used to size chunks
+MEMORY_BUDGET = 256 * 1024 ** 2
+
+
+def group_centers(xyz: np.ndarray, starts: np.ndarray, weights: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Centres of contiguous atom groups (residues) for a block of frames.
+
+    Args:
+        xyz: (n_frames, n_atoms, 3) coordinates.
+        starts: Group start indices with a final n_atoms sentinel (topology.residue_starts).
+        weights: Optional per-atom weights (masses) for centres of mass.
+
+    Returns:
+        np.ndarray: (n_frames, n_groups, 3) centres.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    if weights is None:
+        sums = np.add.reduceat(xyz, starts[:-1], axis=1, dtype=np.float64)
+        return sums / np.diff(starts)[None, :, None]
+    weights = np.asarray(weights, dtype=np.float64)
+    sums = np.add.reduceat(xyz * weights[None, :, None], starts[:-1], axis=1)
+    totals = np.add.reduceat(weights, starts[:-1])
+    return sums / np.where(totals > 0, totals, 1.0)[None, :, None]
+
+
+def distances_from(origin: np.ndarray, points: np.ndarray, boxes: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Distances from one point per frame to many points per frame.
+
+    Args:
+        origin: (n_frames, 3) target position.
+        points: (n_frames, M, 3) positions.
+        boxes: Optional (n_frames, 6) boxes for minimum imaging.
+
+    Returns:
+        np.ndarray: (n_frames, M) distances.
+    """
+    delta = minimum_image(points - origin[:, None, :], boxes)
+    return np.sqrt(np.einsum("ijk,ijk->ij", delta, delta))
+
+
+def heavy_atoms(topology) -> np.ndarray:
+    """Indices of all atoms that are neither hydrogens nor extra points."""
+    return select_mask(topology, HEAVY_ATOM_MASK)
+
+
+def chunk_frames_for(n_atoms: int, budget: int = MEMORY_BUDGET) -> int:
+    """Frames per chunk so that coordinates and float64 work arrays fit in `budget` bytes."""
+    return max(1, budget // max(1, n_atoms * 3 * 8 * 4))
+
+
+class TargetDistanceEngine:
+    """
+    Distances from one target to every residue or atom of the system.
+
+    Args:
+        topology: Parsed prmtop (amber_native.prmtop.Topology).
+        mode: MODE_RESIDUE_RESIDUE, MODE_ATOM_RESIDUE, MODE_ATOM_ATOM or MODE_MIN_HEAVY.
+        target: Target residue (modes 1, 4) or atom (modes 2, 3), 1-based as in Amber.
+        mass_weighted: Residue centres of mass (cpptraj default); False uses
+            geometric centres (cpptraj `geom`).
+    """
+
+    def __init__(self, topology, mode: int, target: int, mass_weighted: bool = True):
+        self.topology = topology
+        self.mode = mode
+        self.target = target - 1
+        self.weights = np.asarray(topology.masses, dtype=np.float64) if mass_weighted else None
+
+        if mode in (MODE_RESIDUE_RESIDUE, MODE_MIN_HEAVY):
+            if not 0 <= self.target < topology.n_residues:
+                raise ValueError(f"Residue {target} does not exist (topology has {topology.n_residues} residues)")
+            self.items = np.delete(np.arange(topology.n_residues), self.target)
+            if mode == MODE_MIN_HEAVY:
+                self._setup_min_heavy()
+        elif mode in (MODE_ATOM_RESIDUE, MODE_ATOM_ATOM):
+            if not 0 <= self.target < topology.n_atoms:
+                raise ValueError(f"Atom {target} does not exist (topology has {topology.n_atoms} atoms)")
+            if mode == MODE_ATOM_RESIDUE:
+                self.items = np.arange(topology.n_residues)
+            else:
+                self.items = np.delete(np.arange(topology.n_atoms), self.target)
+        else:
+            raise ValueError(f"Unknown computing mode {mode}")
+
+    def _setup_min_heavy(self) -> None:
+        heavy = heavy_atoms(self.topology)
+        residues = self.topology.atom_residues[heavy]
+        self.target_atoms = heavy[residues == self.target]
+        if len(self.target_atoms) == 0:
+            raise ValueError(f"Residue {self.target + 1} has no heavy atoms")
+        self.other_atoms = heavy[residues != self.target]
+        other_residues = residues[residues != self.target]
+
+        # Heavy atoms are sorted by residue: one reduceat group per residue that has any
+        present = np.unique(other_residues)
+        self.group_starts = np.searchsorted(other_residues, present)
+        self.group_columns = np.searchsorted(self.items, present)
+
+    def _reduce_min_heavy(self, atom_min: np.ndarray) -> np.ndarray:
+        """Per-residue minimum of per-atom minimum distances; NaN for residues without heavy atoms."""
+        distances = np.full((atom_min.shape[0], len(self.items)), np.nan)
+        distances[:, self.group_columns] = np.minimum.reduceat(atom_min, self.group_starts, axis=1)
+        return distances
+
+    def _compute_min_heavy(self, xyz: np.ndarray, boxes: Optional[np.ndarray], cutoff: Optional[float]) -> np.ndarray:
+        if cutoff is None:
+            # Exact for every residue: running minimum over the (few) target heavy atoms
+            others = xyz[:, self.other_atoms]
+            atom_min = np.full(others.shape[:2], np.inf)
+            for atom in self.target_atoms:
+                np.minimum(atom_min, distances_from(xyz[:, atom].astype(np.float64), others, boxes), out=atom_min)
+            return self._reduce_min_heavy(atom_min)
+
+        # Only pairs within the cutoff (neighbour search); residues beyond it are +inf
+        atom_min = np.full((xyz.shape[0], len(self.other_atoms)), np.inf)
+        for frame in range(xyz.shape[0]):
+            box = None if boxes is None else boxes[frame]
+            _, j, d = find_pairs(xyz[frame, self.target_atoms], cutoff, box, xyz[frame, self.other_atoms])
+            np.minimum.at(atom_min[frame], j, d)
+        return self._reduce_min_heavy(atom_min)
+
+    def compute(self, xyz: np.ndarray, boxes: Optional[np.ndarray] = None, cutoff: Optional[float] = None) -> np.ndarray:
+        """
+        (n_frames, n_items) distances for a block of frames.
+
+        In MODE_MIN_HEAVY a `cutoff` restricts the search to neighbouring atoms:
+        residues farther than it get +inf instead of their exact distance.
+        """
+        if self.mode == MODE_MIN_HEAVY:
+            return self._compute_min_heavy(xyz, boxes, cutoff)
+        if self.mode == MODE_ATOM_ATOM:
+            return distances_from(xyz[:, self.target].astype(np.float64), xyz[:, self.items], boxes)
+
+        centers = group_centers(xyz, self.topology.residue_starts, self.weights)
+        if self.mode == MODE_RESIDUE_RESIDUE:
+            origin = centers[:, self.target]
+        else:
+            origin = xyz[:, self.target].astype(np.float64)
+        return distances_from(origin, centers[:, self.items], boxes)
+
+    def run(self, trajectory, chunk_frames: Optional[int] = None,
+            cutoff: Optional[float] = None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Streams the trajectory once.
+
+        Args:
+            trajectory: Any reader with iter_chunks() yielding (frames, xyz, boxes).
+            chunk_frames: Frames per chunk; sized from MEMORY_BUDGET if None.
+            cutoff: Optional neighbour-search cutoff (MODE_MIN_HEAVY only).
+
+        Yields:
+            Tuple: (0-based frame indices, (n, n_items) distances).
+        """
+        chunk_frames = chunk_frames or chunk_frames_for(self.topology.n_atoms)
+        for frames, xyz, boxes in trajectory.iter_chunks(chunk_frames):
+            yield frames, self.compute(xyz, boxes, cutoff)
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Per-residue pairwise nonbonded interaction energies (electrostatic and
+Lennard-Jones) between two atom sets, straight from the prmtop parameters.
+
+Charges come from CHARGE (prmtop units, so q_i * q_j / r is in kcal/mol) and
+the 12-6 coefficients from ATOM_TYPE_INDEX, NONBONDED_PARM_INDEX and
+LENNARD_JONES_ACOEF/BCOEF. In every frame the cell-list search of
+neighbors.py gives the atom pairs within the cutoff; both terms are evaluated
+for all pairs at once and summed into a (set A residue x set B residue)
+matrix with np.bincount. As in cpptraj `lie`, plain cutoffs are used (no
+switching, no long-range correction) and bonded atoms are not excluded, so
+the matrix entries of covalently linked residues include their 1-2/1-3/1-4
+pairs.
+
+A trajectory is read once; the result is the per-frame matrices (streamed,
+or written to a .npy file) or their running mean, variance and EELEC-EVDW
+covariance, optionally over several processes by frame blocks whose
+accumulators are merged exactly.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+from .mask import select_mask
+from .neighbors import find_pairs
+from .stats import RunningCovariance, RunningMoments
+
+PathLike = Union[str, Path]
+
+# cpptraj `lie` defaults: cutoffs (Å) and dielectric constant
+ELEC_CUTOFF = 12.0
+VDW_CUTOFF = 8.0
+DIELECTRIC = 1.0
+# Frames read per chunk
+CHUNK_FRAMES = 64
+
+
+class EnergyEngine:
+    """
+    Vectorised residue-pair interaction energies between two disjoint atom sets.
+
+    Args:
+        topology: Parsed prmtop (amber_native.prmtop.Topology).
+        mask_a: Amber mask of the first set (e.g. the ligand, ':1').
+        mask_b: Amber mask of the second set (e.g. the receptor, ':2-25').
+        elec_cutoff: Electrostatic cutoff (Å).
+        vdw_cutoff: Lennard-Jones cutoff (Å).
+        dielectric: Dielectric constant.
+    """
+
+    def __init__(self, topology, mask_a: str, mask_b: str, elec_cutoff: float = ELEC_CUTOFF,
+                 vdw_cutoff: float = VDW_CUTOFF, dielectric: float = DIELECTRIC):
+        self.topology = topology
+        self.elec_cutoff = elec_cutoff
+        self.vdw_cutoff = vdw_cutoff
+        self.dielectric = dielectric
+        atoms_a = np.asarray(select_mask(topology, mask_a), dtype=np.int64)
+        atoms_b = np.asarray(select_mask(topology, mask_b), dtype=np.int64)
+        if len(atoms_a) == 0 or len(atoms_b) == 0:
+            raise ValueError(f"Empty atom selection: '{mask_a}' ({len(atoms_a)} atoms), "
+                             f"'{mask_b}' ({len(atoms_b)} atoms)")
+        if len(np.intersect1d(atoms_a, atoms_b)):
+            raise ValueError(f"The masks '{mask_a}' and '{mask_b}' share atoms")
+
+        residues = np.asarray(topology.atom_residues)
+        self.residues_a = np.unique(residues[atoms_a])
+        self.residues_b = np.unique(residues[atoms_b])
+        self._cell_a = np.searchsorted(self.residues_a, residues[atoms_a]) * len(self.residues_b)
+        self._cell_b = np.searchsorted(self.residues_b, residues[atoms_b])
+
+        charges = np.asarray(topology.charges_amber, dtype=np.float64)
+        self._charges_a = charges[atoms_a] / dielectric
+        self._charges_b = charges[atoms_b]
+        n_types = int(topology.arrays["pointers"][1])
+        types = np.asarray(topology.atom_type_index, dtype=np.int64) - 1
+        self._types_a = types[atoms_a] * n_types
+        self._types_b = types[atoms_b]
+        # Negative NONBONDED_PARM_INDEX entries point to 10-12 terms: no 12-6 energy
+        self._parm_index = np.asarray(topology.nonbonded_parm_index, dtype=np.int64) - 1
+        self._acoef = np.append(np.asarray(topology.lj_acoef, dtype=np.float64), 0.0)
+        self._bcoef = np.append(np.asarray(topology.lj_bcoef, dtype=np.float64), 0.0)
+
+        # Only the atoms involved are read from the trajectory
+        self.atoms = np.union1d(atoms_a, atoms_b)
+        self._local_a = np.searchsorted(self.atoms, atoms_a)
+        self._local_b = np.searchsorted(self.atoms, atoms_b)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """(residues in set A, residues in set B) of every energy matrix."""
+        return len(self.residues_a), len(self.residues_b)
+
+    def _frame(self, xyz: np.ndarray, box: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Flattened (elec, vdw) residue-pair matrices of one frame."""
+        size = self.shape[0] * self.shape[1]
+        i, j, d = find_pairs(xyz[self._local_a], max(self.elec_cutoff, self.vdw_cutoff), box,
+                             xyz[self._local_b])
+        cells = self._cell_a[i] + self._cell_b[j]
+
+        near = d <= self.elec_cutoff
+        elec = np.bincount(cells[near], weights=self._charges_a[i[near]] * self._charges_b[j[near]] / d[near],
+                           minlength=size)
+
+        near = d <= self.vdw_cutoff
+        i, j = i[near], j[near]
+        parm = self._parm_index[self._types_a[i] + self._types_b[j]]
+        parm[parm < 0] = -1  # -> the appended zero coefficient
+        inv_r6 = d[near] ** -6
+        vdw = np.bincount(cells[near], weights=(self._acoef[parm] * inv_r6 - self._bcoef[parm]) * inv_r6,
+                          minlength=size)
+        return elec, vdw
+
+    def compute(self, xyz: np.ndarray, boxes: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Energy matrices of a block of frames.
+
+        Args:
+            xyz: (n_frames, len(self.atoms), 3) coordinates of `self.atoms`.
+            boxes: Optional (n_frames, 6) boxes.
+
+        Returns:
+            Tuple: (elec, vdw), each (n_frames, *self.shape) in kcal/mol.
+        """
+        elec = np.zeros((xyz.shape[0],) + self.shape)
+        vdw = np.zeros((xyz.shape[0],) + self.shape)
+        for frame in range(xyz.shape[0]):
+            e, v = self._frame(xyz[frame], None if boxes is None else boxes[frame])
+            elec[frame] = e.reshape(self.shape)
+            vdw[frame] = v.reshape(self.shape)
+        return elec, vdw
+
+    def run(self, trajectory, chunk_frames: int = CHUNK_FRAMES, start: int = 0,
+            stop: Optional[int] = None) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Streams the trajectory once.
+
+        Args:
+            trajectory: Any reader with iter_chunks() (SegmentedTrajectory, NetCDFTrajectory).
+            chunk_frames: Frames per chunk.
+            start, stop: Frame range (0-based, stop exclusive).
+
+        Yields:
+            Tuple: (0-based trajectory frames, elec, vdw) of every chunk.
+        """
+        for frames, xyz, boxes in trajectory.iter_chunks(chunk_frames, start=start, stop=stop,
+                                                         atom_indices=self.atoms):
+            elec, vdw = self.compute(xyz, boxes)
+            yield frames, elec, vdw
+
+
+class EnergyStatistics:
+    """
+    Running statistics of the residue-pair energy matrices, with the EELEC-EVDW
+    covariance so that the total (EELEC + EVDW) standard deviation is exact.
+
+    Args:
+        residues_a, residues_b: Residue indices (0-based) of the matrix rows and columns.
+    """
+
+    def __init__(self, residues_a: np.ndarray, residues_b: np.ndarray):
+        self.residues_a = np.asarray(residues_a, dtype=np.int64)
+        self.residues_b = np.asarray(residues_b, dtype=np.int64)
+        self.moments = RunningCovariance((len(self.residues_a), len(self.residues_b)))
+
+    @property
+    def n_frames(self) -> int:
+        return self.moments.count
+
+    @property
+    def elec(self) -> RunningMoments:
+        return self.moments.x
+
+    @property
+    def vdw(self) -> RunningMoments:
+        return self.moments.y
+
+    def total_mean(self) -> np.ndarray:
+        return self.moments.sum_mean()
+
+    def total_std(self) -> np.ndarray:
+        return self.moments.sum_std()
+
+    def update(self, elec: np.ndarray, vdw: np.ndarray) -> "EnergyStatistics":
+        """Adds a block of (n_frames, n_a, n_b) energy matrices."""
+        self.moments.update(elec, vdw)
+        return self
+
+    def merge(self, other: "EnergyStatistics") -> "EnergyStatistics":
+        """Adds the frames of another block (exact, in any order)."""
+        self.moments.merge(other.moments)
+        return self
+
+
+def _run_block(args) -> EnergyStatistics:
+    """Worker: energy statistics of the frames [start, stop), optionally written to `frames_file`."""
+    from .prmtop import read_prmtop
+    from .segments import open_trajectory
+
+    topology_file, trajectory_file, options, start, stop, chunk_frames, frames_file = args
+    topology = read_prmtop(topology_file)
+    engine = EnergyEngine(topology, **options)
+    statistics = EnergyStatistics(engine.residues_a, engine.residues_b)
+    per_frame = None if frames_file is None else np.load(frames_file, mmap_mode="r+")
+    with open_trajectory(trajectory_file, topology) as trajectory:
+        for frames, elec, vdw in engine.run(trajectory, chunk_frames, start, stop):
+            statistics.update(elec, vdw)
+            if per_frame is not None:
+                per_frame[frames, 0] = elec
+                per_frame[frames, 1] = vdw
+    if per_frame is not None:
+        per_frame.flush()
+    return statistics
+
+
+def interaction_energies(topology_file: PathLike, trajectory_file: PathLike, mask_a: str, mask_b: str,
+                         elec_cutoff: float = ELEC_CUTOFF, vdw_cutoff: float = VDW_CUTOFF,
+                         dielectric: float = DIELECTRIC, processes: int = 1, chunk_frames: int = CHUNK_FRAMES,
+                         frames_file: Optional[PathLike] = None) -> EnergyStatistics:
+    """
+    Residue-pair interaction energies over a whole trajectory, in one pass.
+
+    Args:
+        topology_file: Path to the prmtop.
+        trajectory_file: Trajectory (.nc, .dcd, .mdcrd) or segment manifest (.json).
+        mask_a, mask_b: Amber masks of the two (disjoint) sets.
+        elec_cutoff, vdw_cutoff: Cutoffs (Å).
+        dielectric: Dielectric constant.
+        processes: Worker processes (frame blocks are split evenly).
+        chunk_frames: Frames per chunk inside every worker.
+        frames_file: Optional .npy written with the per-frame matrices, float32
+            (n_frames, 2, n_a, n_b) with [:, 0] EELEC and [:, 1] EVDW.
+
+    Returns:
+        EnergyStatistics: Mean, variance and EELEC-EVDW covariance of every residue pair.
+    """
+    from .prmtop import read_prmtop
+    from .segments import open_trajectory
+
+    topology = read_prmtop(topology_file)
+    options = {"mask_a": mask_a, "mask_b": mask_b, "elec_cutoff": elec_cutoff, "vdw_cutoff": vdw_cutoff,
+               "dielectric": dielectric}
+    engine = EnergyEngine(topology, **options)
+    with open_trajectory(trajectory_file, topology) as trajectory:
+        n_frames = trajectory.n_frames
+    if frames_file is not None:
+        frames_file = str(frames_file)
+        np.lib.format.open_memmap(frames_file, mode="w+", dtype=np.float32,
+                                  shape=(n_frames, 2) + engine.shape).flush()
+
+    bounds = np.linspace(0, n_frames, min(max(processes, 1), max(n_frames, 1)) + 1).astype(int)
+    jobs = [(str(topology_file), str(trajectory_file), options, int(first), int(last), chunk_frames, frames_file)
+            for first, last in zip(bounds[:-1], bounds[1:]) if last > first]
+    if processes <= 1:
+        blocks = [_run_block(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            blocks = list(pool.map(_run_block, jobs))
+
+    statistics = EnergyStatistics(engine.residues_a, engine.residues_b)
+    for block in blocks:
+        statistics.merge(block)
+    return statistics
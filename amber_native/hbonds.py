@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Geometric hydrogen-bond detection (the engine behind hbond_average.py and
+total_hbond_interactions.py).
+
+Donors, hydrogens and acceptors come from the prmtop, as in cpptraj `hbond`:
+acceptors are N, O and F atoms, donors are N, O and F atoms bonded to a
+hydrogen (one donor-H site per bond). In every frame the cell-list search of
+neighbors.py gives all acceptor-donor pairs within the distance cutoff; the
+D-H...A angle is then evaluated for all candidate pairs at once. The result is
+a sparse (frame, donor-H, acceptor) table with the D...A distance and the
+D-H...A angle of every H-bond. Frame blocks can be spread over processes.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .mask import select_mask
+from .neighbors import find_pairs
+from .pbc import minimum_image
+
+PathLike = Union[str, Path]
+
+HBOND_FORMAT_VERSION = 1
+# cpptraj defaults: D...A distance (Å) and D-H...A angle (degrees)
+DISTANCE_CUTOFF = 3.0
+ANGLE_CUTOFF = 135.0
+# Frames read per chunk
+CHUNK_FRAMES = 256
+
+ACCEPTOR_MASK = "@/N|@/O|@/F"
+
+
+def hbond_sites(topology, mask: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Donor-H sites and acceptors of the topology.
+
+    Args:
+        topology: Parsed prmtop (amber_native.prmtop.Topology).
+        mask: Optional Amber mask restricting donors and acceptors (e.g. ':1-25').
+
+    Returns:
+        Tuple: (donor heavy atom, hydrogen) of every donor-H site, sorted by
+        donor, and the acceptor atoms.
+    """
+    electronegative = np.zeros(topology.n_atoms, dtype=bool)
+    electronegative[select_mask(topology, ACCEPTOR_MASK)] = True
+    hydrogen = np.zeros(topology.n_atoms, dtype=bool)
+    hydrogen[select_mask(topology, "@/H")] = True
+    if mask:
+        selected = np.zeros(topology.n_atoms, dtype=bool)
+        selected[select_mask(topology, mask)] = True
+        electronegative &= selected
+        hydrogen &= selected
+
+    bonds = np.asarray(topology.bonds, dtype=np.int64).reshape(-1, 2)
+    # Orient every bond as (heavy, H) and keep the N/O/F-H ones
+    flip = hydrogen[bonds[:, 0]]
+    heavy = np.where(flip, bonds[:, 1], bonds[:, 0])
+    light = np.where(flip, bonds[:, 0], bonds[:, 1])
+    keep = electronegative[heavy] & hydrogen[light]
+    order = np.lexsort((light[keep], heavy[keep]))
+    return heavy[keep][order], light[keep][order], np.flatnonzero(electronegative)
+
+
+def molecule_ids(topology) -> Optional[np.ndarray]:
+    """Molecule of every atom (from ATOMS_PER_MOLECULE), or None if the prmtop lacks it."""
+    sizes = topology.arrays.get("atoms_per_molecule")
+    if sizes is None:
+        return None
+    return np.repeat(np.arange(len(sizes)), sizes)
+
+
+class HBondTable:
+    """
+    Sparse table of H-bonds: one row per (frame, donor-H, acceptor).
+
+    Args:
+        frames: 0-based trajectory frame of every row.
+        donors, hydrogens, acceptors: Atom indices (0-based) of every row.
+        distances: D...A distances (Å).
+        angles: D-H...A angles (degrees).
+        n_frames: Frames analysed (including those without H-bonds).
+    """
+
+    def __init__(self, frames, donors, hydrogens, acceptors, distances, angles, n_frames: int):
+        self.frames = np.asarray(frames, dtype=np.int64)
+        self.donors = np.asarray(donors, dtype=np.int64)
+        self.hydrogens = np.asarray(hydrogens, dtype=np.int64)
+        self.acceptors = np.asarray(acceptors, dtype=np.int64)
+        self.distances = np.asarray(distances, dtype=np.float32)
+        self.angles = np.asarray(angles, dtype=np.float32)
+        self.n_frames = int(n_frames)
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    @classmethod
+    def concatenate(cls, tables: List["HBondTable"]) -> "HBondTable":
+        """Joins tables of consecutive frame blocks (frames are already trajectory frames)."""
+        return cls(np.concatenate([t.frames for t in tables]),
+                   np.concatenate([t.donors for t in tables]),
+                   np.concatenate([t.hydrogens for t in tables]),
+                   np.concatenate([t.acceptors for t in tables]),
+                   np.concatenate([t.distances for t in tables]),
+                   np.concatenate([t.angles for t in tables]),
+                   sum(t.n_frames for t in tables))
+
+    def select(self, rows: np.ndarray) -> "HBondTable":
+        """Table with only the given rows (boolean mask or indices)."""
+        return HBondTable(self.frames[rows], self.donors[rows], self.hydrogens[rows], self.acceptors[rows],
+                          self.distances[rows], self.angles[rows], self.n_frames)
+
+    def between(self, group_a: np.ndarray, group_b: np.ndarray) -> "HBondTable":
+        """H-bonds with the donor in one atom group and the acceptor in the other (e.g. ligand-receptor)."""
+        donor_a, donor_b = np.isin(self.donors, group_a), np.isin(self.donors, group_b)
+        acceptor_a, acceptor_b = np.isin(self.acceptors, group_a), np.isin(self.acceptors, group_b)
+        return self.select((donor_a & acceptor_b) | (donor_b & acceptor_a))
+
+    def frame_counts(self) -> np.ndarray:
+        """Number of H-bonds in every frame."""
+        return np.bincount(self.frames, minlength=self.n_frames)
+
+    def bond_ids(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Distinct H-bonds (hydrogen, acceptor) and the bond id of every row.
+
+        Returns:
+            Tuple: ((n_bonds, 3) donor, hydrogen, acceptor; per-row bond id).
+        """
+        keys = np.stack([self.hydrogens, self.acceptors], axis=1)
+        unique, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        bonds = np.stack([self.donors[first], unique[:, 0], unique[:, 1]], axis=1)
+        return bonds, inverse.ravel()
+
+    def save(self, output_file: PathLike) -> None:
+        """Writes the table to a compressed NPZ (atomically)."""
+        path = Path(output_file)
+        partial = path.with_name(f"{path.name}.{os.getpid()}.part")
+        with open(partial, "wb") as f:
+            np.savez_compressed(f, version=np.int64(HBOND_FORMAT_VERSION), frames=self.frames,
+                                donors=self.donors, hydrogens=self.hydrogens, acceptors=self.acceptors,
+                                distances=self.distances, angles=self.angles, n_frames=np.int64(self.n_frames))
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, input_file: PathLike) -> "HBondTable":
+        with np.load(input_file, allow_pickle=False) as f:
+            if int(f["version"]) != HBOND_FORMAT_VERSION:
+                raise ValueError(f"{input_file}: unsupported H-bond table version {int(f['version'])}")
+            return cls(f["frames"], f["donors"], f["hydrogens"], f["acceptors"], f["distances"], f["angles"],
+                       int(f["n_frames"]))
+
+
+class HBondEngine:
+    """
+    Vectorised geometric H-bond search.
+
+    Args:
+        topology: Parsed prmtop (amber_native.prmtop.Topology).
+        mask: Optional Amber mask for donors and acceptors (cpptraj `hbond <mask>`).
+        distance: D...A distance cutoff (Å).
+        angle: D-H...A angle cutoff (degrees); H-bonds need angle >= cutoff.
+        intramolecular: Keep H-bonds within one molecule (False = cpptraj `nointramol`).
+    """
+
+    def __init__(self, topology, mask: Optional[str] = None, distance: float = DISTANCE_CUTOFF,
+                 angle: float = ANGLE_CUTOFF, intramolecular: bool = True):
+        self.topology = topology
+        self.mask = mask
+        self.distance = distance
+        self.angle = angle
+        self.intramolecular = intramolecular
+        self.donor_h, self.hydrogens, self.acceptors = hbond_sites(topology, mask)
+        self.molecules = None if intramolecular else molecule_ids(topology)
+        if not intramolecular and self.molecules is None:
+            raise ValueError("Excluding intramolecular H-bonds needs ATOMS_PER_MOLECULE in the prmtop")
+
+        # Unique donors with a CSR list of their donor-H sites
+        self.donors, first_site = np.unique(self.donor_h, return_index=True)
+        self.site_ptr = np.append(first_site, len(self.donor_h))
+
+        # Only the atoms involved are read from the trajectory
+        self.atoms = np.unique(np.concatenate([self.donors, self.hydrogens, self.acceptors]))
+        self._local_donors = np.searchsorted(self.atoms, self.donors)
+        self._local_hydrogens = np.searchsorted(self.atoms, self.hydrogens)
+        self._local_acceptors = np.searchsorted(self.atoms, self.acceptors)
+
+    @property
+    def n_sites(self) -> int:
+        return len(self.hydrogens)
+
+    def _frame(self, xyz: np.ndarray, box: Optional[np.ndarray]) -> Tuple[np.ndarray, ...]:
+        """H-bonds of one frame: (site, acceptor index, distance, angle)."""
+        a, d, dist = find_pairs(xyz[self._local_acceptors], self.distance, box, xyz[self._local_donors])
+        keep = self.acceptors[a] != self.donors[d]
+        a, d, dist = a[keep], d[keep], dist[keep]
+
+        # Expand every acceptor-donor pair to the donor's H sites
+        n_h = self.site_ptr[d + 1] - self.site_ptr[d]
+        rows = np.repeat(np.arange(len(d)), n_h)
+        sites = np.repeat(self.site_ptr[d] - np.cumsum(n_h) + n_h, n_h) + np.arange(n_h.sum())
+        a, d, dist = a[rows], d[rows], dist[rows]
+
+        h_pos = xyz[self._local_hydrogens[sites]].astype(np.float64)
+        boxes = None if box is None else np.asarray(box, dtype=np.float64)[None]
+        to_donor = minimum_image((xyz[self._local_donors[d]] - h_pos)[None], boxes)[0]
+        to_acceptor = minimum_image((xyz[self._local_acceptors[a]] - h_pos)[None], boxes)[0]
+        cosine = np.einsum("ij,ij->i", to_donor, to_acceptor) / (
+            np.linalg.norm(to_donor, axis=1) * np.linalg.norm(to_acceptor, axis=1))
+        angles = np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+
+        keep = angles >= self.angle
+        if self.molecules is not None:
+            keep &= self.molecules[self.donor_h[sites]] != self.molecules[self.acceptors[a]]
+        return sites[keep], a[keep], dist[keep], angles[keep]
+
+    def compute(self, xyz: np.ndarray, boxes: Optional[np.ndarray] = None) -> HBondTable:
+        """
+        H-bonds of a block of frames.
+
+        Args:
+            xyz: (n_frames, len(self.atoms), 3) coordinates of `self.atoms`.
+            boxes: Optional (n_frames, 6) boxes.
+
+        Returns:
+            HBondTable: Rows with frames relative to the block.
+        """
+        parts = []
+        for frame in range(xyz.shape[0]):
+            sites, a, dist, angles = self._frame(xyz[frame], None if boxes is None else boxes[frame])
+            parts.append((np.full(len(sites), frame), sites, a, dist, angles))
+        frames, sites, a, dist, angles = (np.concatenate(column) for column in zip(*parts)) if parts else \
+            (np.empty(0, dtype=np.int64),) * 5
+        sites, a = sites.astype(np.int64), a.astype(np.int64)
+        return HBondTable(frames, self.donor_h[sites], self.hydrogens[sites], self.acceptors[a], dist, angles,
+                          xyz.shape[0])
+
+    def run(self, trajectory, chunk_frames: int = CHUNK_FRAMES, start: int = 0,
+            stop: Optional[int] = None) -> Iterator[HBondTable]:
+        """
+        Streams the trajectory once.
+
+        Args:
+            trajectory: Any reader with iter_chunks() (SegmentedTrajectory, NetCDFTrajectory).
+            chunk_frames: Frames per chunk.
+            start, stop: Frame range (0-based, stop exclusive).
+
+        Yields:
+            HBondTable: One table per chunk, with 0-based trajectory frames.
+        """
+        for frames, xyz, boxes in trajectory.iter_chunks(chunk_frames, start=start, stop=stop,
+                                                         atom_indices=self.atoms):
+            table = self.compute(xyz, boxes)
+            table.frames = frames[table.frames]
+            yield table
+
+
+def _run_block(args) -> HBondTable:
+    """Worker: H-bonds of the frames [start, stop) of a trajectory."""
+    from .prmtop import read_prmtop
+    from .segments import open_trajectory
+
+    topology_file, trajectory_file, options, start, stop, chunk_frames = args
+    topology = read_prmtop(topology_file)
+    engine = HBondEngine(topology, **options)
+    with open_trajectory(trajectory_file, topology) as trajectory:
+        tables = list(engine.run(trajectory, chunk_frames, start, stop))
+    table = HBondTable.concatenate(tables) if tables else HBondTable([], [], [], [], [], [], 0)
+    table.n_frames = stop - start
+    return table
+
+
+def find_hbonds(topology_file: PathLike, trajectory_file: PathLike, mask: Optional[str] = None,
+                distance: float = DISTANCE_CUTOFF, angle: float = ANGLE_CUTOFF, intramolecular: bool = True,
+                processes: int = 1, chunk_frames: int = CHUNK_FRAMES) -> HBondTable:
+    """
+    H-bonds of a whole trajectory, optionally over several processes.
+
+    Args:
+        topology_file: Path to the prmtop.
+        trajectory_file: Trajectory (.nc, .dcd, .mdcrd) or segment manifest (.json).
+        mask: Optional Amber mask for donors and acceptors.
+        distance: D...A distance cutoff (Å).
+        angle: D-H...A angle cutoff (degrees).
+        intramolecular: Keep H-bonds within one molecule.
+        processes: Worker processes (frame blocks are split evenly).
+        chunk_frames: Frames per chunk inside every worker.
+
+    Returns:
+        HBondTable: Rows sorted by frame.
+    """
+    from .prmtop import read_prmtop
+    from .segments import open_trajectory
+
+    topology = read_prmtop(topology_file)
+    options = {"mask": mask, "distance": distance, "angle": angle, "intramolecular": intramolecular}
+    with open_trajectory(trajectory_file, topology) as trajectory:
+        n_frames = trajectory.n_frames
+        if processes <= 1:
+            engine = HBondEngine(topology, **options)
+            tables = list(engine.run(trajectory, chunk_frames))
+            table = HBondTable.concatenate(tables) if tables else HBondTable([], [], [], [], [], [], 0)
+            table.n_frames = n_frames
+            return table
+
+    bounds = np.linspace(0, n_frames, min(processes, max(n_frames, 1)) + 1).astype(int)
+    jobs = [(str(topology_file), str(trajectory_file), options, int(first), int(last), chunk_frames)
+            for first, last in zip(bounds[:-1], bounds[1:]) if last > first]
+    if not jobs:
+        return HBondTable([], [], [], [], [], [], n_frames)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        tables = list(pool.map(_run_block, jobs))
+    return HBondTable.concatenate(tables)
+
+
+def atom_label(topology, atom: int) -> str:
+    """cpptraj-style atom label, e.g. 'DG_5@O6'."""
+    residue = int(topology.atom_residues[atom])
+    return f"{topology.residue_name(residue)}_{residue + 1}@{topology.atom_names[atom]}"
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Markov-state kinetics from discrete state sequences (e.g. the per-frame
+conformations of multi_dihedral_analyzer.py).
+
+Transitions are counted at a lag time over any number of independent
+sequences (replicas, or segments of one file) with a single np.bincount of
+(from * n + to) per sequence, never across sequence boundaries. On the
+largest strongly connected set of states the reversible maximum-likelihood
+transition matrix is estimated by the fixed-point iteration of
+Bowman et al. / Prinz et al., which also gives the stationary distribution.
+Implied timescales come from the eigenvalues, mean first-passage times from
+the fundamental matrix, and lifetimes from the diagonal (and, model-free,
+from the dwell runs of the raw sequences).
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Reversible estimator: iterations and convergence tolerance
+MAX_ITERATIONS = 100_000
+TOLERANCE = 1e-12
+
+
+def split_segments(sequence: Sequence[int], segment_frames: int) -> List[np.ndarray]:
+    """Cuts a concatenated sequence into independent segments of `segment_frames` frames (0 = one segment)."""
+    sequence = np.asarray(sequence, dtype=np.int64)
+    if segment_frames <= 0:
+        return [sequence]
+    return [sequence[start:start + segment_frames] for start in range(0, len(sequence), segment_frames)]
+
+
+def transition_counts(sequences: Sequence[Sequence[int]], n_states: int, lag: int = 1,
+                      sliding: bool = True) -> np.ndarray:
+    """
+    Transition count matrix at a lag time.
+
+    Args:
+        sequences: State index (0..n_states-1) of every frame, one array per
+            independent sequence; negative states are missing frames.
+        n_states: Number of states.
+        lag: Lag time in frames.
+        sliding: Count every origin (True) or only every `lag`-th one.
+
+    Returns:
+        np.ndarray: (n_states, n_states) counts C[i, j] of i at t and j at t + lag.
+    """
+    counts = np.zeros(n_states * n_states, dtype=np.int64)
+    step = 1 if sliding else lag
+    for sequence in sequences:
+        sequence = np.asarray(sequence, dtype=np.int64)
+        if len(sequence) <= lag:
+            continue
+        start, end = sequence[:-lag:step], sequence[lag::step]
+        keep = (start >= 0) & (end >= 0)
+        counts += np.bincount(start[keep] * n_states + end[keep], minlength=n_states * n_states)
+    return counts.reshape(n_states, n_states)
+
+
+def _reachable(adjacency: np.ndarray, state: int) -> np.ndarray:
+    reached = np.zeros(len(adjacency), dtype=bool)
+    reached[state] = True
+    frontier = reached.copy()
+    while frontier.any():
+        frontier = adjacency[frontier].any(axis=0) & ~reached
+        reached |= frontier
+    return reached
+
+
+def connected_sets(counts: np.ndarray) -> List[np.ndarray]:
+    """Strongly connected sets of states of a count matrix, largest first."""
+    adjacency = np.asarray(counts) > 0
+    unassigned = np.ones(len(adjacency), dtype=bool)
+    sets = []
+    for state in range(len(adjacency)):
+        if unassigned[state]:
+            members = np.flatnonzero(_reachable(adjacency, state) & _reachable(adjacency.T, state))
+            unassigned[members] = False
+            sets.append(members)
+    return sorted(sets, key=len, reverse=True)
+
+
+def transition_matrix(counts: np.ndarray) -> np.ndarray:
+    """Non-reversible maximum-likelihood estimate (row-normalised counts)."""
+    counts = np.asarray(counts, dtype=np.float64)
+    rows = counts.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(rows > 0, counts / rows, 0.0)
+
+
+def reversible_transition_matrix(counts: np.ndarray, max_iterations: int = MAX_ITERATIONS,
+                                 tolerance: float = TOLERANCE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reversible maximum-likelihood transition matrix (detailed balance).
+
+    Iterates x_ij = (c_ij + c_ji) / (c_i / x_i + c_j / x_j) on the symmetric
+    matrix X; then T_ij = x_ij / x_i and pi_i = x_i / sum(X).
+
+    Args:
+        counts: Count matrix of a strongly connected set (every state has outgoing counts).
+
+    Returns:
+        Tuple: (transition matrix, stationary distribution).
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    symmetric = counts + counts.T
+    row_counts = counts.sum(axis=1)
+    if np.any(row_counts == 0):
+        raise ValueError("Every state needs outgoing transitions (restrict to a connected set)")
+
+    x = symmetric / symmetric.sum()
+    for _ in range(max_iterations):
+        x_rows = x.sum(axis=1)
+        ratio = row_counts / x_rows
+        updated = symmetric / (ratio[:, None] + ratio[None, :])
+        updated /= updated.sum()
+        converged = np.abs(updated - x).max() < tolerance
+        x = updated
+        if converged:
+            break
+    stationary = x.sum(axis=1)
+    return x / stationary[:, None], stationary / stationary.sum()
+
+
+def stationary_distribution(matrix: np.ndarray) -> np.ndarray:
+    """Left eigenvector of eigenvalue 1 of a transition matrix, normalised to 1."""
+    values, vectors = np.linalg.eig(np.asarray(matrix, dtype=np.float64).T)
+    vector = np.abs(np.real(vectors[:, np.argmin(np.abs(values - 1.0))]))
+    return vector / vector.sum()
+
+
+def implied_timescales(matrix: np.ndarray, lag: int, n_timescales: Optional[int] = None) -> np.ndarray:
+    """
+    Implied timescales t_k = -lag / ln|lambda_k| of the non-stationary eigenvalues.
+
+    Returns:
+        np.ndarray: Timescales in frames, slowest first (NaN for lambda_k <= 0).
+    """
+    values = np.linalg.eigvals(np.asarray(matrix, dtype=np.float64))
+    moduli = np.sort(np.abs(values))[::-1][1:]
+    if n_timescales is not None:
+        moduli = np.append(moduli, np.zeros(max(0, n_timescales - len(moduli))))[:n_timescales]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        timescales = -lag / np.log(moduli)
+    timescales[(moduli <= 0) | (moduli >= 1)] = np.nan
+    return timescales
+
+
+def mean_first_passage_times(matrix: np.ndarray, stationary: np.ndarray, lag: int = 1) -> np.ndarray:
+    """
+    Mean first-passage times between all pairs of states.
+
+    Uses the fundamental matrix Z = (I - T + 1 pi^T)^-1: m_ij = (Z_jj - Z_ij) / pi_j.
+
+    Returns:
+        np.ndarray: (n, n) MFPT from i to j in frames (zero diagonal).
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    stationary = np.asarray(stationary, dtype=np.float64)
+    n = len(matrix)
+    fundamental = np.linalg.inv(np.eye(n) - matrix + np.outer(np.ones(n), stationary))
+    passage = (np.diag(fundamental)[None, :] - fundamental) / stationary[None, :]
+    np.fill_diagonal(passage, 0.0)
+    return passage * lag
+
+
+def lifetimes(matrix: np.ndarray, lag: int = 1) -> np.ndarray:
+    """Mean lifetime of every state from the model, lag / (1 - T_ii), in frames."""
+    with np.errstate(divide="ignore"):
+        return lag / (1.0 - np.diag(np.asarray(matrix, dtype=np.float64)))
+
+
+def dwell_times(sequences: Sequence[Sequence[int]], n_states: int,
+                censored: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Model-free dwell runs of every state in the raw sequences.
+
+    Args:
+        sequences: State index of every frame, one array per independent sequence.
+        n_states: Number of states.
+        censored: Also count the runs touching the start or end of a sequence.
+
+    Returns:
+        Tuple: (number of runs, mean run length in frames) per state.
+    """
+    runs = np.zeros(n_states, dtype=np.int64)
+    total = np.zeros(n_states, dtype=np.int64)
+    for sequence in sequences:
+        sequence = np.asarray(sequence, dtype=np.int64)
+        if len(sequence) == 0:
+            continue
+        starts = np.flatnonzero(np.concatenate([[True], sequence[1:] != sequence[:-1]]))
+        lengths = np.diff(np.append(starts, len(sequence)))
+        states = sequence[starts]
+        keep = states >= 0
+        if not censored:
+            keep[[0, -1]] = False
+        runs += np.bincount(states[keep], minlength=n_states)
+        total += np.bincount(states[keep], weights=lengths[keep], minlength=n_states).astype(np.int64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return runs, total / runs
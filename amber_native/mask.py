@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Native Amber atom-mask engine.
+
+Supported grammar (same meaning as in cpptraj):
+
+    :1-10,15,WAT        residue numbers, ranges and names
+    @CA,1-20            atom names and numbers
+    @%CT  @/N           atom type and element selectors
+    ^1-2                molecule numbers
+    :1-10@CA            residue and atom selection in the same term
+    *  ?  =             wildcards in names (= behaves like *, as in :WAT&!@H=)
+    &  |  !  ( )        AND, OR, NOT and grouping
+    <:5.0 >:5.0         residues within / beyond a distance of the preceding mask
+    <@5.0 >@5.0         atoms within / beyond a distance of the preceding mask
+
+Masks are compiled against a prmtop Topology into NumPy index arrays. Masks
+without distance operators are cached in an LRU keyed by (topology hash, mask),
+so repeated selections cost a dictionary lookup.
+"""
+
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from amber_native.prmtop import Topology
+
+CACHE_SIZE = 4096
+# Atoms compared at once in distance selections (bounds the temporary distance matrix)
+DISTANCE_BLOCK = 4096
+
+ELEMENT_SYMBOLS = (
+    "X H He Li Be B C N O F Ne Na Mg Al Si P S Cl Ar K Ca Sc Ti V Cr Mn Fe Co Ni Cu Zn Ga Ge As Se Br Kr "
+    "Rb Sr Y Zr Nb Mo Tc Ru Rh Pd Ag Cd In Sn Sb Te I Xe Cs Ba La Ce Pr Nd Pm Sm Eu Gd Tb Dy Ho Er Tm Yb "
+    "Lu Hf Ta W Re Os Ir Pt Au Hg Tl Pb Bi Po At Rn"
+).split()
+
+_cache: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+
+
+class MaskError(ValueError):
+    """Raised for masks that cannot be parsed or that refer to non-existent atoms/residues."""
+
+
+# ==========================================
+# --- Tokenizer and parser ---
+# ==========================================
+
+_TOKEN_RE = re.compile(r"\s*(?:(?P<op>[&|!()])|(?P<dist>[<>][:@]\s*[0-9]*\.?[0-9]+)|(?P<sel>[^&|!()<>\s]+))")
+
+
+def _tokenize(mask: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    mask = mask.strip()
+    while position < len(mask):
+        match = _TOKEN_RE.match(mask, position)
+        if not match or match.end() == position:
+            raise MaskError(f"Cannot parse mask '{mask}' near '{mask[position:]}'")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """Recursive descent parser producing a nested-tuple syntax tree."""
+
+    def __init__(self, mask: str):
+        self.mask = mask
+        self.tokens = _tokenize(mask)
+        self.position = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise MaskError("Empty mask")
+        tree = self._or()
+        if self.position != len(self.tokens):
+            raise MaskError(f"Unexpected '{self.tokens[self.position][1]}' in mask '{self.mask}'")
+        return tree
+
+    def _peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _or(self):
+        node = self._and()
+        while self._peek() == ("op", "|"):
+            self.position += 1
+            node = ("or", node, self._and())
+        return node
+
+    def _and(self):
+        node = self._unary()
+        while self._peek() == ("op", "&"):
+            self.position += 1
+            node = ("and", node, self._unary())
+        return node
+
+    def _unary(self):
+        if self._peek() == ("op", "!"):
+            self.position += 1
+            return ("not", self._unary())
+        return self._postfix()
+
+    def _postfix(self):
+        node = self._primary()
+        while self._peek() is not None and self._peek()[0] == "dist":
+            text = self._peek()[1].replace(" ", "")
+            self.position += 1
+            node = ("dist", node, text[0], text[1], float(text[2:]))
+        return node
+
+    def _primary(self):
+        token = self._peek()
+        if token is None:
+            raise MaskError(f"Mask '{self.mask}' ends unexpectedly")
+        if token == ("op", "("):
+            self.position += 1
+            node = self._or()
+            if self._peek() != ("op", ")"):
+                raise MaskError(f"Unbalanced parentheses in mask '{self.mask}'")
+            self.position += 1
+            return node
+        if token[0] != "sel":
+            raise MaskError(f"Unexpected '{token[1]}' in mask '{self.mask}'")
+        self.position += 1
+        return ("sel", token[1])
+
+
+# ==========================================
+# --- Evaluation ---
+# ==========================================
+
+def _split_selector(text: str) -> List[Tuple[str, str]]:
+    """Splits e.g. ':1-10@CA,CB' into [(':', '1-10'), ('@', 'CA,CB')]."""
+    if text == "*":
+        return [("*", "")]
+    parts = re.findall(r"([:@^])([^:@^]*)", text)
+    if not parts or "".join(p + s for p, s in parts) != text:
+        raise MaskError(f"Invalid selector '{text}' (expected :residues, @atoms or ^molecules)")
+    return parts
+
+
+def _pattern_regex(pattern: str) -> "re.Pattern":
+    escaped = re.escape(pattern).replace(r"\*", ".*").replace("=", ".*").replace(r"\?", ".")
+    return re.compile(f"^{escaped}$")
+
+
+def _match_names(names: np.ndarray, pattern: str) -> np.ndarray:
+    """Boolean match of a name pattern (with * ? = wildcards) over an array of names."""
+    if not any(c in pattern for c in "*?="):
+        return names == pattern
+    unique, inverse = np.unique(names, return_inverse=True)
+    regex = _pattern_regex(pattern)
+    hits = np.fromiter((bool(regex.match(str(name))) for name in unique), dtype=bool, count=len(unique))
+    return hits[inverse.reshape(-1)]
+
+
+def _number_items(spec: str, count: int, what: str, names: Optional[np.ndarray]) -> np.ndarray:
+    """Evaluates a comma list of numbers, ranges and names against `count` items."""
+    selected = np.zeros(count, dtype=bool)
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        range_match = re.fullmatch(r"(\d+)(?:-(\d+))?", item)
+        if range_match:
+            first = int(range_match.group(1))
+            last = int(range_match.group(2) or first)
+            if first < 1 or last > count or first > last:
+                raise MaskError(f"{what} range '{item}' is outside 1-{count}")
+            selected[first - 1:last] = True
+        elif names is None:
+            raise MaskError(f"{what} selection '{item}' must be a number or range")
+        else:
+            selected |= _match_names(names, item)
+    return selected
+
+
+def _element_symbols(topology: Topology) -> np.ndarray:
+    if "element_symbols" not in topology.arrays:
+        atomic_numbers = np.asarray(topology.atomic_numbers)
+        if atomic_numbers.size and np.any(atomic_numbers > 0):
+            table = np.array(ELEMENT_SYMBOLS + ["EP"], dtype="U2")
+            symbols = table[np.where(atomic_numbers > 0, np.clip(atomic_numbers, 0, len(ELEMENT_SYMBOLS) - 1),
+                                     len(ELEMENT_SYMBOLS))]
+        else:
+            # Old prmtops without ATOMIC_NUMBER: first letter of the atom name
+            symbols = np.char.upper(np.asarray(topology.atom_names).astype("U1"))
+        topology.arrays["element_symbols"] = symbols
+    return topology.arrays["element_symbols"]
+
+
+def _molecule_of_atoms(topology: Topology) -> np.ndarray:
+    sizes = topology.arrays.get("atoms_per_molecule")
+    if sizes is None:
+        raise MaskError("Molecule selections (^) need ATOMS_PER_MOLECULE in the prmtop")
+    return np.repeat(np.arange(len(sizes)), sizes)
+
+
+def _evaluate_selector(topology: Topology, text: str) -> np.ndarray:
+    selected = np.ones(topology.n_atoms, dtype=bool)
+    for prefix, spec in _split_selector(text):
+        if prefix == "*":
+            continue
+        if not spec:
+            raise MaskError(f"Empty selection after '{prefix}' in '{text}'")
+        if prefix == ":":
+            residues = _number_items(spec, topology.n_residues, "Residue", topology.residue_labels)
+            selected &= residues[topology.atom_residues]
+        elif prefix == "^":
+            molecules = _molecule_of_atoms(topology)
+            selected &= _number_items(spec, int(molecules.max()) + 1, "Molecule", None)[molecules]
+        elif spec.startswith("%"):
+            types = np.zeros(topology.n_atoms, dtype=bool)
+            for item in spec[1:].split(","):
+                types |= _match_names(topology.atom_types, item.strip())
+            selected &= types
+        elif spec.startswith("/"):
+            elements = _element_symbols(topology)
+            chosen = np.zeros(topology.n_atoms, dtype=bool)
+            for item in spec[1:].split(","):
+                symbol = item.strip()
+                chosen |= elements == ("EP" if symbol.upper() == "EP" else symbol.capitalize())
+            selected &= chosen
+        else:
+            selected &= _number_items(spec, topology.n_atoms, "Atom", topology.atom_names)
+    return selected
+
+
+def _within(coordinates: np.ndarray, reference: np.ndarray, cutoff: float) -> np.ndarray:
+    """Atoms with any reference atom closer than `cutoff` (plain Euclidean distance)."""
+    result = np.zeros(len(coordinates), dtype=bool)
+    if reference.size == 0:
+        return result
+    ref = coordinates[reference].astype(np.float64)
+    cutoff2 = cutoff * cutoff
+    # Only atoms inside the bounding box of the reference (+cutoff) can be within range
+    low = ref.min(axis=0) - cutoff
+    high = ref.max(axis=0) + cutoff
+    candidates = np.flatnonzero(np.all((coordinates >= low) & (coordinates <= high), axis=1))
+    for start in range(0, len(candidates), DISTANCE_BLOCK):
+        block = candidates[start:start + DISTANCE_BLOCK]
+        xyz = coordinates[block].astype(np.float64)
+        close = np.zeros(len(block), dtype=bool)
+        for ref_start in range(0, len(ref), DISTANCE_BLOCK):
+            diff = xyz[:, None, :] - ref[None, ref_start:ref_start + DISTANCE_BLOCK, :]
+            close |= np.any(np.einsum("ijk,ijk->ij", diff, diff) < cutoff2, axis=1)
+        result[block] = close
+    return result
+
+
+def _evaluate(topology: Topology, node, coordinates: Optional[np.ndarray]) -> np.ndarray:
+    kind = node[0]
+    if kind == "sel":
+        return _evaluate_selector(topology, node[1])
+    if kind == "not":
+        return ~_evaluate(topology, node[1], coordinates)
+    if kind == "and":
+        return _evaluate(topology, node[1], coordinates) & _evaluate(topology, node[2], coordinates)
+    if kind == "or":
+        return _evaluate(topology, node[1], coordinates) | _evaluate(topology, node[2], coordinates)
+    if kind == "dist":
+        if coordinates is None:
+            raise MaskError("Distance selections (<: >: <@ >@) need coordinates")
+        _, child, direction, level, cutoff = node
+        reference = np.flatnonzero(_evaluate(topology, child, coordinates))
+        close = _within(coordinates, reference, cutoff)
+        if level == ":":
+            residues = np.zeros(topology.n_residues, dtype=bool)
+            residues[topology.atom_residues[close]] = True
+            close = residues[topology.atom_residues]
+        return close if direction == "<" else ~close
+    raise MaskError(f"Unknown mask node {kind}")
+
+
+def _has_distance(node) -> bool:
+    if node[0] == "sel":
+        return False
+    if node[0] == "dist":
+        return True
+    return any(_has_distance(child) for child in node[1:] if isinstance(child, tuple))
+
+
+def parse_mask(mask: str):
+    """Parses a mask into its syntax tree (raises MaskError on syntax errors)."""
+    return _Parser(mask).parse()
+
+
+def select_mask(topology: Topology, mask: str, coordinates: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Evaluates an Amber mask.
+
+    Args:
+        topology: Topology from read_prmtop().
+        mask: Amber mask string (e.g. ':1011-1036&!@H=').
+        coordinates: (n_atoms, 3) coordinates, only needed for distance operators.
+
+    Returns:
+        np.ndarray: Sorted 0-based atom indices (read-only).
+    """
+    key = (topology.hash, mask)
+    if topology.hash and key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    tree = parse_mask(mask)
+    indices = np.flatnonzero(_evaluate(topology, tree, coordinates))
+    indices.setflags(write=False)
+
+    if topology.hash and not _has_distance(tree):
+        _cache[key] = indices
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return indices
+
+
+def select_residues(topology: Topology, mask: str, coordinates: Optional[np.ndarray] = None) -> np.ndarray:
+    """0-based indices of the residues with at least one selected atom."""
+    return np.unique(topology.atom_residues[select_mask(topology, mask, coordinates)])
+
+
+def validate_masks(topology: Topology, masks: Dict[str, str]) -> Dict[str, str]:
+    """
+    Checks masks before a long job starts.
+
+    Returns:
+        Dict[str, str]: Problem description per mask label (syntax error,
+        out-of-range number or empty selection); empty if all masks are fine.
+    """
+    problems = {}
+    for label, mask in masks.items():
+        try:
+            if select_mask(topology, mask).size == 0:
+                problems[label] = f"'{mask}' selects no atoms"
+        except MaskError as e:
+            problems[label] = f"'{mask}': {e}"
+    return problems
+
+
+def clear_mask_cache() -> None:
+    _cache.clear()
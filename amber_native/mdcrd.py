@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+ASCII Amber trajectories (.mdcrd / .crd, 10F8.3 lines).
+
+Layout: one title line, then per frame 3*NATOM coordinates in lines of ten
+8-character fields, optionally followed by a 3F8.3 box line. The format has
+no frame index, so a one-time indexer stores the byte offset of every frame
+in a small ``<trajectory>.idx`` sidecar. Frames are then decoded directly from
+those offsets with a vectorised fixed-width parse.
+"""
+
+import os
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+PathLike = Union[str, Path]
+
+FIELD_WIDTH = 8
+FIELDS_PER_LINE = 10
+INDEX_SUFFIX = ".idx"
+# Frames whose first line is checked when the fixed layout is assumed
+SPOT_CHECKS = 16
+
+
+class MdcrdIndex:
+    """Frame byte offsets of an ASCII trajectory (offsets[n_frames] is the end of the last frame)."""
+
+    def __init__(self, offsets: np.ndarray, n_atoms: int, has_box: bool, file_size: int, mtime_ns: int):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.n_atoms = n_atoms
+        self.has_box = has_box
+        self.file_size = file_size
+        self.mtime_ns = mtime_ns
+
+    @property
+    def n_frames(self) -> int:
+        return len(self.offsets) - 1
+
+    def save(self, index_file: PathLike) -> None:
+        """Writes the sidecar; a regular layout is stored as (first offset, frame size) only."""
+        frame_sizes = np.diff(self.offsets)
+        regular = len(frame_sizes) > 0 and np.all(frame_sizes == frame_sizes[0])
+        payload = {
+            "n_atoms": np.int64(self.n_atoms),
+            "has_box": np.bool_(self.has_box),
+            "file_size": np.int64(self.file_size),
+            "mtime_ns": np.int64(self.mtime_ns),
+            "n_frames": np.int64(self.n_frames),
+            "first_offset": np.int64(self.offsets[0]),
+            "frame_size": np.int64(frame_sizes[0] if regular else 0),
+            "offsets": np.empty(0, dtype=np.int64) if regular else self.offsets,
+        }
+        index_path = Path(index_file)
+        partial = index_path.with_name(f"{index_path.name}.{os.getpid()}.part")
+        with open(partial, "wb") as f:
+            np.savez(f, **payload)
+        os.replace(partial, index_path)
+
+    @classmethod
+    def load(cls, index_file: PathLike) -> "MdcrdIndex":
+        with np.load(index_file) as data:
+            frame_size = int(data["frame_size"])
+            if frame_size:
+                offsets = int(data["first_offset"]) + frame_size * np.arange(int(data["n_frames"]) + 1, dtype=np.int64)
+            else:
+                offsets = data["offsets"]
+            return cls(offsets, int(data["n_atoms"]), bool(data["has_box"]),
+                       int(data["file_size"]), int(data["mtime_ns"]))
+
+
+def _frame_layout(n_atoms: int, has_box: bool, newline: int = 1) -> int:
+    """Byte size of one frame written by Amber (10F8.3 lines + optional 3F8.3 box line)."""
+    n_values = 3 * n_atoms
+    full_lines, remainder = divmod(n_values, FIELDS_PER_LINE)
+    size = full_lines * (FIELDS_PER_LINE * FIELD_WIDTH + newline)
+    if remainder:
+        size += remainder * FIELD_WIDTH + newline
+    if has_box:
+        size += 3 * FIELD_WIDTH + newline
+    return size
+
+
+def _line_fields(line: bytes) -> int:
+    return -(-len(line.rstrip(b"\r\n")) // FIELD_WIDTH)
+
+
+def _index_by_arithmetic(f, title_size: int, file_size: int, n_atoms: int, has_box: Optional[bool]):
+    """Fixed-layout offsets, or None if the file does not follow the Amber layout exactly."""
+    candidates = [has_box] if has_box is not None else [True, False]
+    for box in candidates:
+        frame_size = _frame_layout(n_atoms, box)
+        body = file_size - title_size
+        if body <= 0 or body % frame_size:
+            continue
+        n_frames = body // frame_size
+        offsets = title_size + frame_size * np.arange(n_frames + 1, dtype=np.int64)
+
+        # Every checked frame must start right after a newline with a full coordinate line
+        expected_first = min(3 * n_atoms, FIELDS_PER_LINE)
+        checks = np.unique(np.linspace(0, n_frames - 1, min(SPOT_CHECKS, n_frames)).astype(np.int64))
+        consistent = True
+        for frame in checks:
+            f.seek(int(offsets[frame]) - 1)
+            previous = f.read(1)
+            first_line = f.readline()
+            if previous != b"\n" or _line_fields(first_line) != expected_first:
+                consistent = False
+                break
+        if consistent and box:
+            # The box line of the first frame has exactly three fields
+            f.seek(int(offsets[1]) - (3 * FIELD_WIDTH + 1))
+            consistent = _line_fields(f.readline()) == 3
+        if consistent:
+            return offsets, box
+    return None
+
+
+def _index_by_scan(f, title_size: int, n_atoms: int, has_box: Optional[bool]):
+    """Line-by-line fallback for files with CRLF endings or irregular line lengths."""
+    n_values = 3 * n_atoms
+    offsets = []
+    f.seek(title_size)
+    position = title_size
+    values = 0
+    detected_box = has_box
+    awaiting_box = False
+
+    for line in f:
+        n_fields = _line_fields(line)
+        if n_fields == 0:
+            position += len(line)
+            continue
+        if awaiting_box:
+            awaiting_box = False
+            if detected_box is None:
+                # A box line has 3 fields, the first line of a frame has min(3N, 10)
+                detected_box = n_fields == 3 and n_values > 3
+            if detected_box:
+                position += len(line)
+                continue
+        if values == 0:
+            offsets.append(position)
+        values += n_fields
+        position += len(line)
+        if values >= n_values:
+            if values != n_values:
+                raise ValueError(f"Frame {len(offsets)} holds {values} values instead of {n_values}; wrong atom count?")
+            values = 0
+            awaiting_box = detected_box is not False
+
+    if values:
+        # Truncated last frame (trajectory still being written): drop it
+        position = offsets.pop()
+    elif awaiting_box and detected_box:
+        # The box line of the last frame is missing: treat that frame as truncated
+        position = offsets.pop()
+    offsets.append(position)
+    return np.asarray(offsets, dtype=np.int64), bool(detected_box)
+
+
+def build_mdcrd_index(trajectory_file: PathLike, n_atoms: int, has_box: Optional[bool] = None) -> MdcrdIndex:
+    """
+    Computes the frame offsets of an ASCII trajectory.
+
+    The fixed Amber layout is tried first (pure arithmetic plus a few spot
+    checks); if the file does not match it, every line is scanned once.
+
+    Args:
+        trajectory_file: Path to the .mdcrd file.
+        n_atoms: Number of atoms (e.g. read_prmtop(...).n_atoms).
+        has_box: Whether frames carry a box line; None to detect it.
+
+    Returns:
+        MdcrdIndex: Offsets of every frame.
+    """
+    path = Path(trajectory_file)
+    stat = path.stat()
+    with open(path, "rb") as f:
+        title_size = len(f.readline())
+        arithmetic = _index_by_arithmetic(f, title_size, stat.st_size, n_atoms, has_box)
+        if arithmetic is not None:
+            offsets, box = arithmetic
+        else:
+            offsets, box = _index_by_scan(f, title_size, n_atoms, has_box)
+    return MdcrdIndex(offsets, n_atoms, box, stat.st_size, stat.st_mtime_ns)
+
+
+def load_mdcrd_index(trajectory_file: PathLike, n_atoms: int, has_box: Optional[bool] = None) -> MdcrdIndex:
+    """Returns the sidecar index if it is up to date, otherwise builds (and saves) a new one."""
+    path = Path(trajectory_file)
+    index_file = path.with_name(path.name + INDEX_SUFFIX)
+    stat = path.stat()
+    if index_file.exists():
+        try:
+            index = MdcrdIndex.load(index_file)
+            if (index.n_atoms == n_atoms and index.file_size == stat.st_size
+                    and index.mtime_ns == stat.st_mtime_ns and (has_box is None or index.has_box == has_box)):
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+
+    index = build_mdcrd_index(path, n_atoms, has_box)
+    try:
+        index.save(index_file)
+    except OSError:
+        pass  # Read-only directory: keep the index in memory only
+    return index
+
+
+class MdcrdReader:
+    """Random-access reader for ASCII trajectories backed by a frame-offset index."""
+
+    def __init__(self, trajectory_file: PathLike, n_atoms: int, has_box: Optional[bool] = None):
+        self.path = Path(trajectory_file)
+        self.index = load_mdcrd_index(self.path, n_atoms, has_box)
+        self.n_atoms = n_atoms
+        self.n_frames = self.index.n_frames
+        self.has_box = self.index.has_box
+        self._values_per_frame = 3 * n_atoms + (3 if self.has_box else 0)
+
+    def __len__(self) -> int:
+        return self.n_frames
+
+    def __getitem__(self, key) -> np.ndarray:
+        """Coordinates (n, n_atoms, 3) of an int, slice or array of frame indices."""
+        xyz, _ = self.read_frames(key)
+        return xyz[0] if np.isscalar(key) or isinstance(key, (int, np.integer)) else xyz
+
+    def _decode(self, start: int, stop: int) -> np.ndarray:
+        """Parses the consecutive frames [start, stop) into a (n, values_per_frame) array."""
+        with open(self.path, "rb") as f:
+            f.seek(int(self.index.offsets[start]))
+            raw = f.read(int(self.index.offsets[stop] - self.index.offsets[start]))
+        chars = np.frombuffer(raw, dtype=np.uint8)
+        chars = chars[(chars != 10) & (chars != 13)]
+        if chars.size % FIELD_WIDTH:
+            raise ValueError(f"{self.path.name}: frames {start + 1}-{stop} are not 8-character fields")
+        cells = chars.view(f"S{FIELD_WIDTH}")
+        try:
+            values = cells.astype(np.float64)
+        except ValueError:
+            raise ValueError(f"{self.path.name}: unreadable value in frames {start + 1}-{stop} "
+                             f"(coordinates overflowing F8.3 are written as '********')")
+        return values.reshape(stop - start, self._values_per_frame)
+
+    def read_frames(self, key=slice(None)):
+        """
+        Decodes the selected frames.
+
+        Args:
+            key: int, slice (start:stop:stride) or array of 0-based frame indices.
+
+        Returns:
+            Tuple[np.ndarray, Optional[np.ndarray]]: coordinates (n, n_atoms, 3) and
+            box lengths (n, 3), or None if the trajectory has no box.
+        """
+        if isinstance(key, slice):
+            frames = np.arange(self.n_frames)[key]
+        else:
+            frames = np.atleast_1d(np.arange(self.n_frames)[key])
+        if frames.size == 0:
+            return np.empty((0, self.n_atoms, 3), dtype=np.float32), (np.empty((0, 3)) if self.has_box else None)
+
+        # Decode maximal runs of consecutive frames with a single read each
+        blocks = []
+        breaks = np.flatnonzero(np.diff(frames) != 1) + 1
+        for run in np.split(frames, breaks):
+            blocks.append(self._decode(int(run[0]), int(run[-1]) + 1))
+        values = np.concatenate(blocks) if len(blocks) > 1 else blocks[0]
+
+        xyz = values[:, :3 * self.n_atoms].astype(np.float32).reshape(-1, self.n_atoms, 3)
+        boxes = values[:, 3 * self.n_atoms:] if self.has_box else None
+        return xyz, boxes
+
+    def iter_chunks(self, chunk_size: int = 512, start: int = 0, stop: Optional[int] = None, stride: int = 1):
+        """Yields (frame_indices, xyz, boxes) blocks of at most `chunk_size` frames."""
+        frames = np.arange(self.n_frames)[start:stop:stride]
+        for first in range(0, len(frames), chunk_size):
+            block = frames[first:first + chunk_size]
+            xyz, boxes = self.read_frames(block)
+            yield block, xyz, boxes
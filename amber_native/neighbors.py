@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Cell-list neighbour search with periodic minimum image.
+
+Points are binned on a grid of cells that is at least `cutoff` wide in every
+direction (in fractional coordinates for periodic boxes, so triclinic and
+truncated octahedron cells are handled exactly). Only the 27 neighbouring
+cells of each point are searched, which turns O(N*M) scans into near-linear
+cutoff queries. Results are sparse: arrays of (i, j, distance) for the pairs
+within the cutoff.
+"""
+
+from typing import Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .pbc import box_vectors, minimum_image
+
+# Upper bound for the number of grid cells (cells are merged above it)
+MAX_CELLS = 4_000_000
+# Pairs per block in the brute-force fallback
+BRUTE_BLOCK = 1 << 20
+
+_OFFSETS = np.array([[i, j, k] for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)], dtype=np.int64)
+
+Pairs = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def _empty_pairs() -> Pairs:
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+
+def _grid_shape(widths: np.ndarray, cutoff: float, n_points: int) -> np.ndarray:
+    """Cells per direction, each at least `cutoff` wide, capped at MAX_CELLS in total."""
+    n_cells = np.maximum(np.floor(widths / cutoff), 1).astype(np.int64)
+    limit = min(MAX_CELLS, max(27, 8 * n_points))
+    while np.prod(n_cells) > limit:
+        n_cells = np.maximum(n_cells // 2, 1)
+    return n_cells
+
+
+def _brute_force(a: np.ndarray, b: np.ndarray, cutoff: float, box: Optional[np.ndarray]) -> Pairs:
+    """All-pairs fallback for boxes too small for a 3x3x3 cell grid."""
+    boxes = None if box is None else np.asarray(box, dtype=np.float64)[None, :]
+    rows = max(1, BRUTE_BLOCK // max(1, len(b)))
+    found_i, found_j, found_d = [], [], []
+    for start in range(0, len(a), rows):
+        block = a[start:start + rows]
+        delta = (b[None, :, :] - block[:, None, :]).reshape(1, -1, 3)
+        delta = minimum_image(delta, boxes).reshape(len(block), len(b), 3)
+        distances = np.sqrt(np.einsum("ijk,ijk->ij", delta, delta))
+        i, j = np.nonzero(distances <= cutoff)
+        found_i.append(i + start)
+        found_j.append(j)
+        found_d.append(distances[i, j])
+    if not found_i:
+        return _empty_pairs()
+    return np.concatenate(found_i), np.concatenate(found_j), np.concatenate(found_d)
+
+
+def find_pairs(points: np.ndarray, cutoff: float, box: Optional[Sequence[float]] = None,
+               others: Optional[np.ndarray] = None) -> Pairs:
+    """
+    Pairs of points closer than `cutoff` in one frame.
+
+    Args:
+        points: (N, 3) coordinates.
+        cutoff: Distance cutoff (Å).
+        box: Optional (a, b, c, alpha, beta, gamma) for minimum imaging.
+        others: Optional (M, 3) second set; if None, pairs within `points`
+            are returned once each (i < j).
+
+    Returns:
+        Tuple: (i, j, distances), i indexing `points` and j `others` (or `points`).
+    """
+    if cutoff <= 0:
+        raise ValueError("The neighbour-search cutoff must be positive")
+    self_search = others is None
+    a = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    b = a if self_search else np.asarray(others, dtype=np.float64).reshape(-1, 3)
+    if len(a) == 0 or len(b) == 0:
+        return _empty_pairs()
+
+    if box is not None:
+        cell = box_vectors(np.asarray(box, dtype=np.float64))
+        inverse = np.linalg.inv(cell)
+        volume = abs(np.linalg.det(cell))
+        widths = volume / np.linalg.norm(np.cross(cell[[1, 2, 0]], cell[[2, 0, 1]]), axis=1)
+        n_cells = _grid_shape(widths, cutoff, len(b))
+        if np.any(n_cells < 3):
+            i, j, d = _brute_force(a, b, cutoff, box)
+            if self_search:
+                keep = i < j
+                return i[keep], j[keep], d[keep]
+            return i, j, d
+        frac_a = a @ inverse
+        frac_a -= np.floor(frac_a)
+        frac_b = frac_a if self_search else b @ inverse
+        if not self_search:
+            frac_b -= np.floor(frac_b)
+        cells_a = np.minimum((frac_a * n_cells).astype(np.int64), n_cells - 1)
+        cells_b = cells_a if self_search else np.minimum((frac_b * n_cells).astype(np.int64), n_cells - 1)
+    else:
+        low = np.minimum(a.min(axis=0), b.min(axis=0))
+        span = np.maximum(a.max(axis=0), b.max(axis=0)) - low
+        n_cells = _grid_shape(span, cutoff, len(b))
+        cell_size = np.where(span > 0, span / n_cells, 1.0)
+        cells_a = np.minimum(((a - low) / cell_size).astype(np.int64), n_cells - 1)
+        cells_b = cells_a if self_search else np.minimum(((b - low) / cell_size).astype(np.int64), n_cells - 1)
+
+    # CSR layout of the second set over the grid
+    linear_b = np.ravel_multi_index(cells_b.T, n_cells)
+    order = np.argsort(linear_b, kind="stable")
+    counts = np.bincount(linear_b, minlength=int(np.prod(n_cells)))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    cutoff2 = cutoff * cutoff
+    found_i, found_j, found_d = [], [], []
+    for offset in _OFFSETS:
+        neighbour = cells_a + offset
+        if box is not None:
+            wraps = np.floor_divide(neighbour, n_cells)
+            neighbour -= wraps * n_cells
+            candidates = np.arange(len(a))
+        else:
+            valid = np.all((neighbour >= 0) & (neighbour < n_cells), axis=1)
+            candidates = np.flatnonzero(valid)
+            neighbour = neighbour[valid]
+        linear = np.ravel_multi_index(neighbour.T, n_cells)
+        per_point = counts[linear]
+        total = int(per_point.sum())
+        if total == 0:
+            continue
+
+        # Expand every point of `a` against the members of its neighbour cell
+        i = np.repeat(candidates, per_point)
+        first = np.repeat(starts[linear] - (np.cumsum(per_point) - per_point), per_point)
+        j = order[first + np.arange(total)]
+        if self_search:
+            keep = i < j
+            i, j = i[keep], j[keep]
+
+        if box is not None:
+            # The image is fixed by the wrapped cell offset: unique within cutoff (>= 3 cells per direction)
+            delta = (frac_b[j] + wraps[i] - frac_a[i]) @ cell
+        else:
+            delta = b[j] - a[i]
+        d2 = np.einsum("ij,ij->i", delta, delta)
+        inside = d2 <= cutoff2
+        found_i.append(i[inside])
+        found_j.append(j[inside])
+        found_d.append(np.sqrt(d2[inside]))
+
+    if not found_i:
+        return _empty_pairs()
+    i, j, d = np.concatenate(found_i), np.concatenate(found_j), np.concatenate(found_d)
+    order = np.lexsort((j, i))
+    return i[order], j[order], d[order]
+
+
+def find_pairs_frames(xyz: np.ndarray, cutoff: float, boxes: Optional[np.ndarray] = None,
+                      selection: Optional[Sequence[int]] = None,
+                      others: Optional[Sequence[int]] = None) -> Iterator[Tuple[int, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Runs find_pairs() on every frame of a chunk.
+
+    Args:
+        xyz: (n_frames, n_atoms, 3) coordinates.
+        cutoff: Distance cutoff (Å).
+        boxes: Optional (n_frames, 6) boxes.
+        selection: Atom indices of the first set (all atoms if None).
+        others: Atom indices of the second set; if None, pairs within `selection`.
+
+    Yields:
+        Tuple: (frame position in the chunk, i, j, distances) with i, j mapped
+        back to atom indices.
+    """
+    selection = np.arange(xyz.shape[1]) if selection is None else np.asarray(selection, dtype=np.int64)
+    others = None if others is None else np.asarray(others, dtype=np.int64)
+    for frame in range(xyz.shape[0]):
+        box = None if boxes is None else boxes[frame]
+        second = None if others is None else xyz[frame, others]
+        i, j, d = find_pairs(xyz[frame, selection], cutoff, box, second)
+        yield frame, selection[i], (selection if others is None else others)[j], d
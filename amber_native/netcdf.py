@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Streaming reader for AMBER NetCDF trajectories (.nc, as written by pmemd and
+cpptraj).
+
+AMBER trajectories use the NetCDF-3 classic / 64-bit offset layout, whose
+header is parsed here with the standard library: every frame is one record
+holding `coordinates` (frame, atom, spatial) and optionally `cell_lengths`,
+`cell_angles` and `time`. Frames are read in chunks with plain file reads, so
+memory use never exceeds one chunk whatever the size of the trajectory.
+NetCDF-4 (HDF5) files are delegated to the optional netCDF4 package.
+"""
+
+import struct
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+PathLike = Union[str, Path]
+
+NC_DIMENSION = 0x0A
+NC_VARIABLE = 0x0B
+NC_ATTRIBUTE = 0x0C
+STREAMING = 0xFFFFFFFF
+
+# nc_type -> (numpy dtype, size in bytes)
+NC_TYPES = {
+    1: (">i1", 1), 2: ("S1", 1), 3: (">i2", 2), 4: (">i4", 4), 5: (">f4", 4), 6: (">f8", 8),
+    7: (">u1", 1), 8: (">u2", 2), 9: (">u4", 4), 10: (">i8", 8), 11: (">u8", 8),
+}
+
+
+class NetCDFVariable:
+    """Layout of one NetCDF-3 variable inside the file."""
+
+    def __init__(self, name: str, dimensions: Tuple[str, ...], shape: Tuple[int, ...],
+                 dtype: str, begin: int, is_record: bool, attributes: Dict[str, object]):
+        self.name = name
+        self.dimensions = dimensions
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.begin = begin
+        self.is_record = is_record
+        self.attributes = attributes
+
+
+class _HeaderParser:
+    """Parses the NetCDF-3 (CDF-1, CDF-2 and CDF-5) header."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.position = 4
+        version = data[3]
+        if data[:3] != b"CDF" or version not in (1, 2, 5):
+            raise ValueError("Not a NetCDF-3 file")
+        self.size_format = ">q" if version == 5 else ">i"
+        self.offset_format = ">q" if version in (2, 5) else ">i"
+
+    def _unpack(self, fmt: str):
+        size = struct.calcsize(fmt)
+        if self.position + size > len(self.data):
+            raise EOFError
+        value = struct.unpack_from(fmt, self.data, self.position)[0]
+        self.position += size
+        return value
+
+    def _count(self) -> int:
+        return self._unpack(self.size_format)
+
+    def _padded(self, n_bytes: int) -> bytes:
+        if self.position + n_bytes > len(self.data):
+            raise EOFError
+        value = self.data[self.position:self.position + n_bytes]
+        self.position += n_bytes + (-n_bytes % 4)
+        return value
+
+    def _name(self) -> str:
+        return self._padded(self._count()).decode("utf-8")
+
+    def _list_header(self, tag: int) -> int:
+        found = self._unpack(">i")
+        n_elements = self._count()
+        if found == 0 and n_elements == 0:
+            return 0
+        if found != tag:
+            raise ValueError("Corrupted NetCDF header")
+        return n_elements
+
+    def _attributes(self) -> Dict[str, object]:
+        attributes = {}
+        for _ in range(self._list_header(NC_ATTRIBUTE)):
+            name = self._name()
+            nc_type = self._unpack(">i")
+            n_values = self._count()
+            dtype, size = NC_TYPES[nc_type]
+            raw = self._padded(n_values * size)
+            if nc_type == 2:
+                attributes[name] = raw.decode("utf-8", errors="replace").rstrip("\x00")
+            else:
+                values = np.frombuffer(raw, dtype=dtype)
+                attributes[name] = values[0] if n_values == 1 else values
+        return attributes
+
+    def parse(self):
+        numrecs = self._unpack(self.size_format)
+        dimensions = []
+        for _ in range(self._list_header(NC_DIMENSION)):
+            dimensions.append((self._name(), self._count()))
+        global_attributes = self._attributes()
+
+        variables = {}
+        for _ in range(self._list_header(NC_VARIABLE)):
+            name = self._name()
+            dim_ids = [self._count() for _ in range(self._count())]
+            attributes = self._attributes()
+            nc_type = self._unpack(">i")
+            self._count()  # vsize: recomputed below, it overflows for very large variables
+            begin = self._unpack(self.offset_format)
+            is_record = bool(dim_ids) and dimensions[dim_ids[0]][1] == 0
+            shape = tuple(dimensions[i][1] for i in dim_ids)
+            variables[name] = NetCDFVariable(name, tuple(dimensions[i][0] for i in dim_ids), shape,
+                                             NC_TYPES[nc_type][0], begin, is_record, attributes)
+        return numrecs, dict(dimensions), global_attributes, variables, self.position
+
+
+def _read_header(path: Path):
+    """Reads growing prefixes of the file until the whole header has been parsed."""
+    size = 64 * 1024
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(size)
+            try:
+                return _HeaderParser(data).parse()
+            except EOFError:
+                if len(data) < size:
+                    raise ValueError(f"{path}: truncated NetCDF header")
+                size *= 4
+                f.seek(0)
+
+
+class NetCDFTrajectory:
+    """
+    Chunked reader for AMBER NetCDF trajectories.
+
+    Example:
+        traj = NetCDFTrajectory("prod.nc")
+        for frames, xyz, boxes in traj.iter_chunks(512, atom_indices=ligand_atoms):
+            ...
+    """
+
+    def __init__(self, path: PathLike):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            magic = f.read(4)
+
+        self._dataset = None
+        if magic[:3] == b"CDF":
+            self._init_classic()
+        elif magic == b"\x89HDF":
+            if netCDF4 is None:
+                raise ValueError(f"{self.path} is a NetCDF-4/HDF5 file: install the netCDF4 package to read it")
+            self._init_hdf5()
+        else:
+            raise ValueError(f"{self.path} is not a NetCDF file")
+
+    # --- NetCDF-3: direct file reads ---
+    def _init_classic(self):
+        numrecs, dimensions, self.attributes, self.variables, _ = _read_header(self.path)
+        if "coordinates" not in self.variables:
+            raise ValueError(f"{self.path}: no 'coordinates' variable (not an AMBER trajectory?)")
+        coordinates = self.variables["coordinates"]
+        if not coordinates.is_record:
+            raise ValueError(f"{self.path}: 'coordinates' has no frame dimension (restart file?)")
+
+        self.n_atoms = dimensions["atom"]
+        record_vars = [v for v in self.variables.values() if v.is_record]
+        sizes = [v.dtype.itemsize * int(np.prod(v.shape[1:])) for v in record_vars]
+        # A single record variable is not padded; several are padded to 4-byte boundaries
+        self.record_size = sizes[0] if len(record_vars) == 1 else sum(s + (-s % 4) for s in sizes)
+
+        first_record = min(v.begin for v in record_vars)
+        file_size = self.path.stat().st_size
+        complete = (file_size - first_record) // self.record_size if self.record_size else 0
+        # Trust the file size if the writer did not update numrecs (crashed or still running)
+        self.n_frames = complete if numrecs in (STREAMING, -1) else min(numrecs, complete)
+        self.has_box = "cell_lengths" in self.variables and "cell_angles" in self.variables
+
+    # --- NetCDF-4: netCDF4 package ---
+    def _init_hdf5(self):
+        self._dataset = netCDF4.Dataset(self.path, "r")
+        self._dataset.set_auto_mask(False)
+        self.attributes = {name: self._dataset.getncattr(name) for name in self._dataset.ncattrs()}
+        self.variables = {}
+        self.n_atoms = len(self._dataset.dimensions["atom"])
+        self.n_frames = len(self._dataset.dimensions["frame"])
+        self.has_box = "cell_lengths" in self._dataset.variables and "cell_angles" in self._dataset.variables
+
+    def __len__(self) -> int:
+        return self.n_frames
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        if self._dataset is not None:
+            self._dataset.close()
+            self._dataset = None
+
+    def _record_view(self, buffer: bytearray, n_records: int, name: str, per_record_shape: Tuple[int, ...],
+                     first_begin: int) -> np.ndarray:
+        variable = self.variables[name]
+        item = variable.dtype.itemsize
+        strides = [self.record_size]
+        stride = item
+        for length in reversed(per_record_shape):
+            strides.insert(1, stride)
+            stride *= length
+        return np.ndarray((n_records,) + per_record_shape, dtype=variable.dtype, buffer=buffer,
+                          offset=variable.begin - first_begin, strides=tuple(strides))
+
+    def _read_records(self, f, first: int, count: int, atom_indices: Optional[np.ndarray]):
+        """Reads `count` consecutive records starting at frame `first`."""
+        first_begin = min(v.begin for v in self.variables.values() if v.is_record)
+        buffer = bytearray(count * self.record_size)
+        f.seek(first_begin + first * self.record_size)
+        n_read = f.readinto(buffer)
+        if n_read < (count - 1) * self.record_size:
+            raise ValueError(f"{self.path.name}: unexpected end of file at frame {first + 1}")
+
+        coordinates = self._record_view(buffer, count, "coordinates", (self.n_atoms, 3), first_begin)
+        if atom_indices is not None:
+            coordinates = coordinates[:, atom_indices]
+        xyz = coordinates.astype(np.float32)
+
+        boxes = None
+        if self.has_box:
+            lengths = self._record_view(buffer, count, "cell_lengths", (3,), first_begin)
+            angles = self._record_view(buffer, count, "cell_angles", (3,), first_begin)
+            boxes = np.hstack([lengths, angles]).astype(np.float64)
+        times = None
+        if "time" in self.variables:
+            times = self._record_view(buffer, count, "time", (), first_begin).astype(np.float64)
+        return xyz, boxes, times
+
+    def read_frames(self, frames: Sequence[int], atom_indices: Optional[Sequence[int]] = None):
+        """
+        Reads an arbitrary set of frames.
+
+        Args:
+            frames: 0-based frame indices.
+            atom_indices: Optional 0-based atom subset; only these atoms are decoded.
+
+        Returns:
+            Tuple: (xyz (n, n_sel, 3) float32, boxes (n, 6) or None, times (n,) or None).
+        """
+        frames = np.asarray(frames, dtype=np.int64)
+        subset = None if atom_indices is None else np.asarray(atom_indices, dtype=np.int64)
+        if frames.size and (frames.min() < 0 or frames.max() >= self.n_frames):
+            raise IndexError(f"{self.path.name}: frame index out of range (trajectory has {self.n_frames} frames)")
+
+        if self._dataset is not None:
+            ds = self._dataset.variables
+            xyz = ds["coordinates"][frames] if subset is None else ds["coordinates"][frames][:, subset]
+            boxes = np.hstack([ds["cell_lengths"][frames], ds["cell_angles"][frames]]) if self.has_box else None
+            times = np.asarray(ds["time"][frames], dtype=np.float64) if "time" in ds else None
+            return np.asarray(xyz, dtype=np.float32), boxes, times
+
+        n_sel = self.n_atoms if subset is None else len(subset)
+        xyz = np.empty((len(frames), n_sel, 3), dtype=np.float32)
+        boxes = np.empty((len(frames), 6)) if self.has_box else None
+        times = np.empty(len(frames)) if "time" in self.variables else None
+        with open(self.path, "rb") as f:
+            # One read per run of consecutive frames
+            breaks = np.flatnonzero(np.diff(frames) != 1) + 1
+            position = 0
+            for run in np.split(frames, breaks) if frames.size else []:
+                block_xyz, block_boxes, block_times = self._read_records(f, int(run[0]), len(run), subset)
+                xyz[position:position + len(run)] = block_xyz
+                if boxes is not None:
+                    boxes[position:position + len(run)] = block_boxes
+                if times is not None:
+                    times[position:position + len(run)] = block_times
+                position += len(run)
+        return xyz, boxes, times
+
+    def iter_chunks(self, chunk_size: int = 512, start: int = 0, stop: Optional[int] = None, stride: int = 1,
+                    atom_indices: Optional[Sequence[int]] = None) -> Iterator[tuple]:
+        """
+        Streams frames[start:stop:stride] in blocks of at most `chunk_size` frames.
+
+        Yields:
+            Tuple: (frame_indices, xyz (n, n_sel, 3) float32, boxes (n, 6) or None).
+        """
+        frames = np.arange(self.n_frames)[start:stop:stride]
+        for first in range(0, len(frames), chunk_size):
+            block = frames[first:first + chunk_size]
+            xyz, boxes, _ = self.read_frames(block, atom_indices)
+            yield block, xyz, boxes
+
+    def times(self) -> Optional[np.ndarray]:
+        """Simulation time (ps) of every frame, if the file stores it."""
+        if self._dataset is not None:
+            ds = self._dataset.variables
+            return np.asarray(ds["time"][:], dtype=np.float64) if "time" in ds else None
+        if "time" not in self.variables:
+            return None
+        if self.n_frames == 0:
+            return np.empty(0)
+        # One strided view over the record section: a single gather instead of a read per frame
+        mapped = np.memmap(self.path, dtype=np.uint8, mode="r")
+        values = self._record_view(mapped, self.n_frames, "time", (), 0).astype(np.float64)
+        del mapped
+        return values
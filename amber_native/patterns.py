@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Streaming grouping of per-frame 0/1 binding patterns.
+
+Each row is packed into a bitset with np.packbits (one bit per residue) and
+grouped chunk by chunk with np.unique(..., return_inverse=True). Only the
+distinct patterns and one small integer per frame are kept in memory.
+"""
+
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+
+def frame_ranges(frames: np.ndarray) -> str:
+    """Compresses frame numbers into '1-5,8,10-12' (input need not be sorted)."""
+    frames = np.unique(np.asarray(frames, dtype=np.int64))
+    if frames.size == 0:
+        return ""
+    breaks = np.flatnonzero(np.diff(frames) != 1)
+    starts = frames[np.concatenate([[0], breaks + 1])]
+    stops = frames[np.concatenate([breaks, [len(frames) - 1]])]
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in zip(starts, stops))
+
+
+class PatternGrouper:
+    """
+    Groups frames by identical 0/1 row patterns.
+
+    Args:
+        n_columns: Number of pattern columns (residues).
+    """
+
+    def __init__(self, n_columns: int):
+        self.n_columns = n_columns
+        self.n_bytes = max(1, (n_columns + 7) // 8)
+        self._row_dtype = np.dtype((np.void, self.n_bytes))
+        self._pattern_ids: Dict[bytes, int] = {}
+        self._patterns: List[bytes] = []
+        self._ids: List[np.ndarray] = []
+        self._frames: List[np.ndarray] = []
+
+    def add(self, frames: Sequence[int], matrix: np.ndarray) -> None:
+        """
+        Adds a chunk of rows.
+
+        Args:
+            frames: Frame number of every row.
+            matrix: (n_rows, n_columns) array of 0/1 (or booleans).
+        """
+        matrix = np.asarray(matrix)
+        if matrix.shape[1] != self.n_columns:
+            raise ValueError(f"Expected {self.n_columns} pattern columns, got {matrix.shape[1]}")
+        if matrix.dtype != bool and np.any((matrix != 0) & (matrix != 1)):
+            raise ValueError("Bit-packed grouping needs 0/1 values only")
+
+        packed = np.ascontiguousarray(np.packbits(matrix.astype(bool), axis=1))
+        unique, inverse = np.unique(packed.view(self._row_dtype).ravel(), return_inverse=True)
+
+        # Map the chunk's distinct patterns to global ids
+        chunk_ids = np.empty(len(unique), dtype=np.int64)
+        for k, pattern in enumerate(unique):
+            key = pattern.tobytes()
+            pattern_id = self._pattern_ids.get(key)
+            if pattern_id is None:
+                pattern_id = len(self._patterns)
+                self._pattern_ids[key] = pattern_id
+                self._patterns.append(key)
+            chunk_ids[k] = pattern_id
+        self._ids.append(chunk_ids[inverse.ravel()].astype(np.int32))
+        self._frames.append(np.asarray(frames, dtype=np.int64))
+
+    @property
+    def n_patterns(self) -> int:
+        return len(self._patterns)
+
+    def pattern(self, pattern_id: int) -> np.ndarray:
+        """Unpacked 0/1 vector of a pattern."""
+        bits = np.unpackbits(np.frombuffer(self._patterns[pattern_id], dtype=np.uint8))
+        return bits[:self.n_columns]
+
+    def groups(self) -> Iterator[Tuple[np.ndarray, int, np.ndarray]]:
+        """
+        Yields (pattern, population, frames) sorted by decreasing population
+        (ties: earliest first frame first).
+        """
+        if not self._ids:
+            return
+        ids = np.concatenate(self._ids)
+        frames = np.concatenate(self._frames)
+        order = np.argsort(ids, kind="stable")
+        populations = np.bincount(ids, minlength=self.n_patterns)
+        bounds = np.concatenate([[0], np.cumsum(populations)])
+        first_frames = np.array([frames[order[bounds[p]]] for p in range(self.n_patterns)])
+        ranking = np.lexsort((first_frames, -populations))
+        for pattern_id in ranking:
+            members = frames[order[bounds[pattern_id]:bounds[pattern_id + 1]]]
+            yield self.pattern(pattern_id), int(populations[pattern_id]), members
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Periodic box helpers: box vectors from (a, b, c, alpha, beta, gamma) and
+minimum-image displacements for orthorhombic, triclinic and truncated
+octahedron cells (tleap `solvateOct` boxes have all angles = 109.47).
+"""
+
+from typing import Optional
+
+import numpy as np
+
+# Displacements are imaged in blocks of this many vectors (27 images each)
+IMAGE_BLOCK = 65536
+ORTHO_TOLERANCE = 1e-3
+
+_SHIFTS = np.array([[i, j, k] for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)], dtype=np.float64)
+
+
+def box_vectors(boxes: np.ndarray) -> np.ndarray:
+    """
+    Cell vectors (rows a, b, c) in the Amber orientation: a along x, b in the xy plane.
+
+    Args:
+        boxes: (..., 6) array of (a, b, c, alpha, beta, gamma), angles in degrees.
+
+    Returns:
+        np.ndarray: (..., 3, 3) array of box vectors.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64)
+    a, b, c = boxes[..., 0], boxes[..., 1], boxes[..., 2]
+    alpha, beta, gamma = (np.radians(boxes[..., i]) for i in (3, 4, 5))
+    cos_a, cos_b, cos_g, sin_g = np.cos(alpha), np.cos(beta), np.cos(gamma), np.sin(gamma)
+
+    vectors = np.zeros(boxes.shape[:-1] + (3, 3))
+    vectors[..., 0, 0] = a
+    vectors[..., 1, 0] = b * cos_g
+    vectors[..., 1, 1] = b * sin_g
+    vectors[..., 2, 0] = c * cos_b
+    vectors[..., 2, 1] = c * (cos_a - cos_b * cos_g) / sin_g
+    vectors[..., 2, 2] = np.sqrt(np.maximum(c ** 2 - vectors[..., 2, 0] ** 2 - vectors[..., 2, 1] ** 2, 0.0))
+    return vectors
+
+
+def is_orthorhombic(boxes: np.ndarray) -> bool:
+    """True if every box has three right angles."""
+    angles = np.asarray(boxes, dtype=np.float64)[..., 3:]
+    return bool(np.all(np.abs(angles - 90.0) < ORTHO_TOLERANCE))
+
+
+def minimum_image(delta: np.ndarray, boxes: Optional[np.ndarray]) -> np.ndarray:
+    """
+    Minimum-image convention for displacement vectors.
+
+    Orthorhombic cells use the usual rounding of fractional coordinates. For
+    triclinic cells rounding alone is not exact, so the shortest of the 27
+    neighbouring images of the rounded vector is taken.
+
+    Args:
+        delta: (n_frames, M, 3) displacement vectors.
+        boxes: (n_frames, 6) boxes of the frames, or None for no periodicity.
+
+    Returns:
+        np.ndarray: Imaged displacements (same shape as `delta`).
+    """
+    if boxes is None:
+        return delta
+    boxes = np.asarray(boxes, dtype=np.float64)
+    delta = np.asarray(delta, dtype=np.float64)
+
+    if is_orthorhombic(boxes):
+        lengths = boxes[:, None, :3]
+        return delta - lengths * np.rint(delta / lengths)
+
+    vectors = box_vectors(boxes)
+    inverse = np.linalg.inv(vectors)
+    imaged = np.empty_like(delta)
+    for frame in range(delta.shape[0]):
+        cell = vectors[frame]
+        shifts = _SHIFTS @ cell
+        for start in range(0, delta.shape[1], IMAGE_BLOCK):
+            block = delta[frame, start:start + IMAGE_BLOCK]
+            fractional = block @ inverse[frame]
+            reduced = (fractional - np.rint(fractional)) @ cell
+            candidates = reduced[:, None, :] + shifts[None, :, :]
+            best = np.argmin(np.einsum("ijk,ijk->ij", candidates, candidates), axis=1)
+            imaged[frame, start:start + IMAGE_BLOCK] = candidates[np.arange(len(block)), best]
+    return imaged
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Native Amber topology (prmtop) reader.
+
+Only the ``%FLAG`` sections needed by the analysis scripts are decoded, with a
+vectorised fixed-width parse driven by each section's ``%FORMAT``. The result
+is cached as an uncompressed ``.npz`` keyed by the hash of the prmtop; cached
+arrays are memory-mapped straight out of the archive, so reopening a topology
+costs milliseconds instead of a cpptraj run.
+"""
+
+import hashlib
+import os
+import re
+import struct
+import zipfile
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import numpy as np
+
+PathLike = Union[str, Path]
+
+# Amber stores charges multiplied by sqrt(332.0522173) (electron charge -> kcal/mol units)
+AMBER_CHARGE_FACTOR = 18.2223
+
+# Bump when the set or meaning of cached arrays changes
+CACHE_VERSION = 1
+CACHE_DIR = Path(os.environ.get("AMBER_NATIVE_CACHE", Path.home() / ".cache" / "amber_native"))
+
+# %FLAG name -> cached array name
+FLAGS = {
+    "POINTERS": "pointers",
+    "ATOM_NAME": "atom_names",
+    "CHARGE": "charges_amber",
+    "ATOMIC_NUMBER": "atomic_numbers",
+    "MASS": "masses",
+    "ATOM_TYPE_INDEX": "atom_type_index",
+    "NONBONDED_PARM_INDEX": "nonbonded_parm_index",
+    "RESIDUE_LABEL": "residue_labels",
+    "RESIDUE_POINTER": "residue_pointers",
+    "LENNARD_JONES_ACOEF": "lj_acoef",
+    "LENNARD_JONES_BCOEF": "lj_bcoef",
+    "BONDS_INC_HYDROGEN": "bonds_inc_hydrogen",
+    "BONDS_WITHOUT_HYDROGEN": "bonds_without_hydrogen",
+    "AMBER_ATOM_TYPE": "atom_types",
+    "SOLVENT_POINTERS": "solvent_pointers",
+    "ATOMS_PER_MOLECULE": "atoms_per_molecule",
+    "BOX_DIMENSIONS": "box_dimensions",
+}
+
+FORMAT_RE = re.compile(r"\(\s*(\d*)\s*([aAiIeEfF])\s*(\d+)")
+
+
+def file_hash(path: PathLike, chunk_size: int = 1 << 20) -> str:
+    """Returns a short content hash used as cache key."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _parse_section(format_line: str, lines) -> np.ndarray:
+    """Decodes the data lines of one %FLAG section according to its %FORMAT."""
+    match = FORMAT_RE.search(format_line)
+    if not match:
+        raise ValueError(f"Unsupported prmtop format specifier: {format_line.strip()}")
+    kind = match.group(2).lower()
+    width = int(match.group(3))
+
+    # Pad every line to a whole number of fields so the block can be viewed as fixed-width cells
+    padded = []
+    for line in lines:
+        n_fields = -(-len(line) // width)
+        padded.append(line.ljust(n_fields * width))
+    cells = np.frombuffer("".join(padded).encode("ascii"), dtype=f"S{width}")
+
+    if kind == "a":
+        return np.char.strip(cells.astype(f"U{width}"))
+    if kind == "i":
+        return cells.astype(np.int64)
+    return cells.astype(np.float64)
+
+
+def parse_prmtop(path: PathLike) -> Dict[str, np.ndarray]:
+    """
+    Reads the supported %FLAG sections of a prmtop into NumPy arrays.
+
+    Args:
+        path: Path to the *.prmtop file.
+
+    Returns:
+        Dict[str, np.ndarray]: Arrays keyed by the names in FLAGS.
+    """
+    with open(path, "r") as f:
+        text = f.read()
+
+    arrays: Dict[str, np.ndarray] = {}
+    for block in text.split("%FLAG ")[1:]:
+        block_lines = block.splitlines()
+        flag = block_lines[0].strip()
+        if flag not in FLAGS:
+            continue
+        format_index = next((i for i, line in enumerate(block_lines) if line.startswith("%FORMAT")), None)
+        if format_index is None:
+            raise ValueError(f"{path}: %FLAG {flag} has no %FORMAT line")
+        data_lines = [line.rstrip("\r") for line in block_lines[format_index + 1:] if not line.startswith("%")]
+        arrays[FLAGS[flag]] = _parse_section(block_lines[format_index], data_lines)
+
+    for required in ("pointers", "atom_names", "residue_labels", "residue_pointers"):
+        if required not in arrays:
+            raise ValueError(f"{path}: missing required prmtop section for '{required}'")
+    return arrays
+
+
+def _load_npz_mmap(path: Path) -> Dict[str, np.ndarray]:
+    """Memory-maps every (uncompressed) member of an .npz archive."""
+    arrays: Dict[str, np.ndarray] = {}
+    with zipfile.ZipFile(path) as zf:
+        members = zf.infolist()
+    with open(path, "rb") as f:
+        for info in members:
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: member {name} is compressed and cannot be memory-mapped")
+            f.seek(info.header_offset)
+            local_header = f.read(30)
+            name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject:
+                raise ValueError(f"{path}: member {name} holds Python objects")
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                         order="F" if fortran_order else "C")
+    return arrays
+
+
+class Topology:
+    """Topology arrays of one prmtop (0-based atom and residue indices)."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], path: Optional[PathLike] = None, hash_key: str = ""):
+        self.arrays = arrays
+        self.path = Path(path) if path is not None else None
+        self.hash = hash_key
+
+        pointers = arrays["pointers"]
+        self.n_atoms = int(pointers[0])
+        self.n_residues = int(pointers[11])
+        self.ifbox = int(pointers[27]) if len(pointers) > 27 else 0
+
+    # --- atoms ---
+    @property
+    def atom_names(self) -> np.ndarray:
+        return self.arrays["atom_names"]
+
+    @property
+    def atom_types(self) -> np.ndarray:
+        return self.arrays.get("atom_types", np.full(self.n_atoms, "", dtype="U4"))
+
+    @property
+    def charges(self) -> np.ndarray:
+        """Partial charges in electron units."""
+        return np.asarray(self.arrays["charges_amber"]) / AMBER_CHARGE_FACTOR
+
+    @property
+    def charges_amber(self) -> np.ndarray:
+        """Partial charges in prmtop units (q_i * q_j / r gives kcal/mol)."""
+        return self.arrays["charges_amber"]
+
+    @property
+    def masses(self) -> np.ndarray:
+        return self.arrays["masses"]
+
+    @property
+    def atomic_numbers(self) -> np.ndarray:
+        """ATOMIC_NUMBER section (-1 for extra points); zeros if the prmtop predates it."""
+        return self.arrays.get("atomic_numbers", np.zeros(self.n_atoms, dtype=np.int64))
+
+    @property
+    def atom_type_index(self) -> np.ndarray:
+        return self.arrays["atom_type_index"]
+
+    @property
+    def nonbonded_parm_index(self) -> np.ndarray:
+        return self.arrays["nonbonded_parm_index"]
+
+    @property
+    def lj_acoef(self) -> np.ndarray:
+        return self.arrays["lj_acoef"]
+
+    @property
+    def lj_bcoef(self) -> np.ndarray:
+        return self.arrays["lj_bcoef"]
+
+    # --- residues ---
+    @property
+    def residue_labels(self) -> np.ndarray:
+        return self.arrays["residue_labels"]
+
+    @property
+    def residue_starts(self) -> np.ndarray:
+        """First atom of every residue plus a final n_atoms sentinel (length n_residues + 1)."""
+        if "residue_starts" not in self.arrays:
+            starts = np.empty(self.n_residues + 1, dtype=np.int64)
+            starts[:-1] = np.asarray(self.arrays["residue_pointers"]) - 1
+            starts[-1] = self.n_atoms
+            self.arrays["residue_starts"] = starts
+        return self.arrays["residue_starts"]
+
+    @property
+    def atom_residues(self) -> np.ndarray:
+        """Residue index of every atom."""
+        if "atom_residues" not in self.arrays:
+            self.arrays["atom_residues"] = np.repeat(np.arange(self.n_residues), np.diff(self.residue_starts))
+        return self.arrays["atom_residues"]
+
+    # --- connectivity and box ---
+    @property
+    def bonds(self) -> np.ndarray:
+        """All bonds as an (n_bonds, 2) array of atom indices."""
+        if "bonds" not in self.arrays:
+            blocks = [np.asarray(self.arrays[key]).reshape(-1, 3)[:, :2] // 3
+                      for key in ("bonds_inc_hydrogen", "bonds_without_hydrogen") if key in self.arrays]
+            self.arrays["bonds"] = np.concatenate(blocks) if blocks else np.empty((0, 2), dtype=np.int64)
+        return self.arrays["bonds"]
+
+    @property
+    def box(self) -> Optional[np.ndarray]:
+        """Box as (a, b, c, alpha, beta, gamma) from BOX_DIMENSIONS, or None."""
+        if self.ifbox == 0 or "box_dimensions" not in self.arrays:
+            return None
+        beta, a, b, c = np.asarray(self.arrays["box_dimensions"])[:4]
+        if self.ifbox == 2:
+            # Truncated octahedron: all angles are 109.4712206 degrees
+            return np.array([a, b, c, beta, beta, beta])
+        return np.array([a, b, c, 90.0, beta, 90.0])
+
+    def residue_name(self, residue_index: int) -> str:
+        return str(self.residue_labels[residue_index])
+
+
+def read_prmtop(path: PathLike, use_cache: bool = True, cache_dir: Optional[PathLike] = None) -> Topology:
+    """
+    Loads a prmtop, using (and refreshing) the binary cache when possible.
+
+    Args:
+        path: Path to the *.prmtop file.
+        use_cache: Read/write the memory-mapped .npz cache.
+        cache_dir: Cache location (default: $AMBER_NATIVE_CACHE or ~/.cache/amber_native).
+
+    Returns:
+        Topology: Parsed topology.
+    """
+    path = Path(path)
+    hash_key = file_hash(path)
+    if not use_cache:
+        return Topology(parse_prmtop(path), path, hash_key)
+
+    cache_root = Path(cache_dir) if cache_dir is not None else CACHE_DIR
+    cache_file = cache_root / f"prmtop_v{CACHE_VERSION}_{hash_key}.npz"
+    if cache_file.exists():
+        try:
+            return Topology(_load_npz_mmap(cache_file), path, hash_key)
+        except (ValueError, OSError, zipfile.BadZipFile):
+            pass  # Stale or damaged cache: rebuild below
+
+    arrays = parse_prmtop(path)
+    try:
+        cache_root.mkdir(parents=True, exist_ok=True)
+        partial = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.part")
+        with open(partial, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(partial, cache_file)
+    except OSError:
+        pass  # Read-only home or full disk: the parsed topology is still usable
+    return Topology(arrays, path, hash_key)
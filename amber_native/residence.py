@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Residence times and exchange of molecules (waters, ions) near a target.
+
+Per-frame in-range sets are turned into run-length-encoded occupancy
+intervals [start, end] per molecule, chunk by chunk: only the runs that may
+still continue are carried between chunks, so memory grows with the number
+of molecules in range, not with the trajectory length. Absences of up to
+`gap` frames are bridged (Impey's tolerance t*; gap=0 gives strict continuous
+residence).
+
+The survival correlation C(t) (probability that a molecule in range at t0 is
+still there, without leaving, at t0 + t) follows from interval arithmetic:
+an interval of L frames contributes max(L - t, 0) origins, so
+C(t) = sum(max(L - t, 0)) / sum(L), accumulated from a length histogram.
+"""
+
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Lags of the survival function kept by default (frames)
+MAX_LAG = 1000
+
+
+class ResidenceTracker:
+    """
+    Streaming run-length encoder of per-item presence.
+
+    Args:
+        gap: Longest absence (frames) bridged inside one interval.
+    """
+
+    def __init__(self, gap: int = 0):
+        self.gap = gap
+        self.n_frames = 0
+        # Runs that may continue into the next chunk (item, start, last)
+        self._items = np.empty(0, dtype=np.int64)
+        self._starts = np.empty(0, dtype=np.int64)
+        self._lasts = np.empty(0, dtype=np.int64)
+
+    @property
+    def n_active(self) -> int:
+        return len(self._items)
+
+    def add(self, n_frames: int, rows: np.ndarray, items: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """
+        Adds the next block of consecutive frames.
+
+        Args:
+            n_frames: Frames in the block.
+            rows: Block row (0-based) of every presence entry.
+            items: Item column of every presence entry.
+
+        Returns:
+            Tuple: (items, starts, ends) of the intervals closed in this block
+            (0-based frame positions, `end` inclusive).
+        """
+        first = self.n_frames
+        self.n_frames += n_frames
+        positions = np.asarray(rows, dtype=np.int64) + first
+        items = np.asarray(items, dtype=np.int64)
+
+        # Carried runs enter as one entry at their last frame, remembering their start
+        all_items = np.concatenate([self._items, items])
+        all_positions = np.concatenate([self._lasts, positions])
+        run_starts = np.concatenate([self._starts, positions])
+        order = np.lexsort((all_positions, all_items))
+        all_items, all_positions, run_starts = all_items[order], all_positions[order], run_starts[order]
+
+        # A new run begins at every item change or absence longer than `gap`
+        new_run = np.ones(len(all_items), dtype=bool)
+        new_run[1:] = (all_items[1:] != all_items[:-1]) | (np.diff(all_positions) > self.gap + 1)
+        heads = np.flatnonzero(new_run)
+        tails = np.concatenate([heads[1:], [len(all_items)]]) - 1
+        run_items, starts, lasts = all_items[heads], run_starts[heads], all_positions[tails]
+
+        # Runs within `gap` of the block end may still continue
+        open_run = lasts >= self.n_frames - 1 - self.gap
+        self._items, self._starts, self._lasts = run_items[open_run], starts[open_run], lasts[open_run]
+        closed = ~open_run
+        return run_items[closed], starts[closed], lasts[closed]
+
+    def finish(self) -> Tuple[np.ndarray, ...]:
+        """Closes the runs still open at the end of the trajectory (right-censored)."""
+        result = self._items, self._starts, self._lasts
+        self._items = np.empty(0, dtype=np.int64)
+        self._starts = np.empty(0, dtype=np.int64)
+        self._lasts = np.empty(0, dtype=np.int64)
+        return result
+
+
+class SurvivalAccumulator:
+    """
+    Interval statistics per group (e.g. residue name).
+
+    Args:
+        n_groups: Number of groups.
+        max_lag: Largest lag (frames) of the survival function.
+    """
+
+    def __init__(self, n_groups: int, max_lag: int = MAX_LAG):
+        self.n_groups = n_groups
+        self.max_lag = max_lag
+        # Lengths up to max_lag are histogrammed; longer ones only need their count and sum
+        self.histogram = np.zeros((n_groups, max_lag + 1), dtype=np.int64)
+        self.long_count = np.zeros(n_groups, dtype=np.int64)
+        self.long_sum = np.zeros(n_groups, dtype=np.int64)
+        self.n_intervals = np.zeros(n_groups, dtype=np.int64)
+        # Interval lengths (bridged absences included) vs frames actually in range
+        self.total_frames = np.zeros(n_groups, dtype=np.int64)
+        self.present_frames = np.zeros(n_groups, dtype=np.int64)
+        self.n_exits = np.zeros(n_groups, dtype=np.int64)
+        self.n_entries = np.zeros(n_groups, dtype=np.int64)
+
+    def add(self, groups: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+            left_censored: np.ndarray, right_censored: np.ndarray) -> None:
+        """Adds intervals; censored flags mark intervals touching the first/last frame."""
+        groups = np.asarray(groups, dtype=np.int64)
+        lengths = np.asarray(ends, dtype=np.int64) - np.asarray(starts, dtype=np.int64) + 1
+        short = lengths <= self.max_lag
+        np.add.at(self.histogram, (groups[short], lengths[short]), 1)
+        self.long_count += np.bincount(groups[~short], minlength=self.n_groups)
+        self.long_sum += np.bincount(groups[~short], weights=lengths[~short], minlength=self.n_groups).astype(np.int64)
+        self.n_intervals += np.bincount(groups, minlength=self.n_groups)
+        self.total_frames += np.bincount(groups, weights=lengths, minlength=self.n_groups).astype(np.int64)
+        self.n_exits += np.bincount(groups[~right_censored], minlength=self.n_groups)
+        self.n_entries += np.bincount(groups[~left_censored], minlength=self.n_groups)
+
+    def add_presence(self, groups: np.ndarray) -> None:
+        """Counts in-range (item, frame) entries per group (-1: ignored), independent of `gap`."""
+        groups = np.asarray(groups, dtype=np.int64)
+        self.present_frames += np.bincount(groups[groups >= 0], minlength=self.n_groups)
+
+    def survival(self) -> np.ndarray:
+        """(n_groups, max_lag + 1) continuous survival C(t), C(0) = 1 (NaN for empty groups)."""
+        lengths = np.arange(self.max_lag + 1)
+        # Number of intervals longer than t and their summed lengths, for every t
+        count_above = np.cumsum(self.histogram[:, ::-1], axis=1)[:, ::-1]
+        sum_above = np.cumsum((self.histogram * lengths)[:, ::-1], axis=1)[:, ::-1]
+        count_gt = np.zeros_like(count_above)
+        sum_gt = np.zeros_like(sum_above)
+        count_gt[:, :-1], sum_gt[:, :-1] = count_above[:, 1:], sum_above[:, 1:]
+        count_gt += self.long_count[:, None]
+        sum_gt += self.long_sum[:, None]
+        origins = sum_gt - lengths[None, :] * count_gt
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return origins / origins[:, :1]
+
+    def summary(self, n_frames: int, dt_ps: float = 1.0) -> Dict[str, np.ndarray]:
+        """
+        Per-group residence statistics.
+
+        Args:
+            n_frames: Trajectory length in frames.
+            dt_ps: Time between frames (ps).
+
+        Returns:
+            Dict: intervals, mean interval length (ps), survival integral
+            tau (ps, truncated at max_lag), mean number of molecules in range,
+            and exits / entries per ns.
+        """
+        survival = self.survival()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_length = self.total_frames / self.n_intervals
+            # Trapezoidal integral of C(t) over the computed lags
+            tau = (np.nansum(survival, axis=1) - 0.5 * (survival[:, 0] + survival[:, -1])) * dt_ps
+        tau[self.n_intervals == 0] = np.nan
+        total_ns = n_frames * dt_ps / 1000.0
+        return {
+            "intervals": self.n_intervals,
+            "mean_residence_ps": mean_length * dt_ps,
+            "tau_ps": tau,
+            "mean_in_range": self.present_frames / max(n_frames, 1),
+            "exits_per_ns": self.n_exits / total_ns if total_ns > 0 else np.full(self.n_groups, np.nan),
+            "entries_per_ns": self.n_entries / total_ns if total_ns > 0 else np.full(self.n_groups, np.nan),
+        }
+
+
+def residence_intervals(matrices, groups: np.ndarray, n_groups: int, gap: int = 0,
+                        max_lag: int = MAX_LAG, sink=None) -> Tuple[SurvivalAccumulator, int]:
+    """
+    Runs the tracker over a sequence of frame chunks.
+
+    Args:
+        matrices: Iterable of FrameSparseMatrix chunks (consecutive frames).
+        groups: Group of every item column (-1: ignored); may be a list that
+            grows while `matrices` is consumed.
+        n_groups: Number of groups.
+        gap: Longest absence (frames) bridged inside one interval.
+        max_lag: Largest survival lag (frames).
+        sink: Optional callable(items, starts, ends, right_censored) receiving
+            every batch of closed intervals (e.g. a CSV writer).
+
+    Returns:
+        Tuple: (SurvivalAccumulator, number of frames).
+    """
+    tracker = ResidenceTracker(gap)
+    accumulator = SurvivalAccumulator(n_groups, max_lag)
+
+    def _emit(items, starts, ends, final):
+        item_groups = np.asarray(groups, dtype=np.int64)
+        keep = item_groups[items] >= 0
+        items, starts, ends = items[keep], starts[keep], ends[keep]
+        right_censored = np.full(len(items), final) & (ends >= tracker.n_frames - 1 - gap)
+        accumulator.add(item_groups[items], starts, ends, starts == 0, right_censored)
+        if sink is not None and len(items):
+            sink(items, starts, ends, right_censored)
+
+    for chunk in matrices:
+        accumulator.add_presence(np.asarray(groups, dtype=np.int64)[chunk.indices])
+        _emit(*tracker.add(chunk.n_frames, chunk.row_ids(), chunk.indices), final=False)
+    _emit(*tracker.finish(), final=True)
+    return accumulator, tracker.n_frames
+
+
+def label_groups(names: Sequence[str], selected: Optional[Sequence[str]] = None) -> Tuple[np.ndarray, list]:
+    """Group index of every item from its residue name (only `selected` names if given)."""
+    names = np.asarray(names, dtype=str)
+    group_names = list(dict.fromkeys(selected)) if selected else list(dict.fromkeys(names.tolist()))
+    lookup = {name: k for k, name in enumerate(group_names)}
+    unique, inverse = np.unique(names, return_inverse=True)
+    return np.array([lookup.get(str(name), -1) for name in unique], dtype=np.int64)[inverse], group_names
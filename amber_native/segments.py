@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Virtual trajectory stitched from several segment files (e.g. the trajectories
+of STEP_10_PROD ... STEP_19_PROD) without writing a merged copy.
+
+Segments may mix formats (.mdcrd, .nc, .dcd). Every global frame maps exactly
+to (segment file, local frame, simulation time); readers are only opened when
+one of their frames is requested. The layout can be saved to a small JSON
+manifest so later runs do not need to re-count frames.
+"""
+
+import json
+import os
+import re
+import struct
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .dcd import DCDHeader, DCDReader
+from .mdcrd import MdcrdReader
+from .netcdf import NetCDFTrajectory
+
+PathLike = Union[str, Path]
+
+MANIFEST_VERSION = 1
+# One AKMA time unit (DCD DELTA) in ps
+AKMA_TIME_PS = 0.04888821
+FORMAT_SUFFIXES = {
+    ".dcd": "dcd",
+    ".nc": "netcdf", ".ncdf": "netcdf", ".netcdf": "netcdf",
+    ".mdcrd": "mdcrd", ".crd": "mdcrd", ".trj": "mdcrd", ".x": "mdcrd",
+}
+# Trajectory names looked for inside a step directory, in order
+STEP_TRAJECTORY_NAMES = ["{step}.nc", "{step}.mdcrd", "{step}.dcd", "prod.nc", "mdcrd"]
+
+_MDIN_INT = r"\b{}\s*=\s*(\d+)"
+_MDIN_FLOAT = r"\b{}\s*=\s*([-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)"
+
+
+def detect_format(path: PathLike) -> str:
+    """Returns 'dcd', 'netcdf' or 'mdcrd' from the suffix, or from the first bytes of the file."""
+    path = Path(path)
+    fmt = FORMAT_SUFFIXES.get(path.suffix.lower())
+    if fmt is not None:
+        return fmt
+    with open(path, "rb") as f:
+        probe = f.read(12)
+    if probe[:3] == b"CDF" or probe[:4] == b"\x89HDF":
+        return "netcdf"
+    if b"CORD" in probe[4:12] and struct.unpack("<i", probe[:4])[0] in (84, 0):
+        return "dcd"
+    return "mdcrd"
+
+
+def read_md_timing(out_file: PathLike) -> Optional[float]:
+    """
+    Time between saved frames (ps) from the input echoed in an Amber .out file.
+
+    Args:
+        out_file: pmemd/sander output of the step.
+
+    Returns:
+        Optional[float]: ntwx * dt, or None if the file does not state both.
+    """
+    try:
+        with open(out_file, "r", errors="ignore") as f:
+            text = f.read(256 * 1024)
+    except OSError:
+        return None
+    ntwx = re.search(_MDIN_INT.format("ntwx"), text)
+    dt = re.search(_MDIN_FLOAT.format("dt"), text)
+    if not ntwx or not dt or int(ntwx.group(1)) <= 0:
+        return None
+    return int(ntwx.group(1)) * float(dt.group(1))
+
+
+class TrajectorySegment:
+    """
+    One trajectory file of a segmented run.
+
+    Args:
+        path: Trajectory file.
+        fmt: 'dcd', 'netcdf' or 'mdcrd'; detected if None.
+        n_atoms: Number of atoms (needed for .mdcrd files).
+        dt_ps: Time between frames; if None it is taken from the NetCDF time
+            variable, the Amber .out file (ntwx * dt) or the DCD header.
+        start_ps: Simulation time at the start of the segment; if None the
+            file's own time axis is used (NetCDF `time`, DCD ISTART/NSAVC),
+            or else the segment starts where the previous one ends.
+        out_file: Amber .out file of the step, used for the frame timing.
+        box_angles: Box angles for .mdcrd files, which only store lengths.
+        n_frames: Known frame count (from a manifest); counted if None.
+    """
+
+    def __init__(self, path: PathLike, fmt: Optional[str] = None, n_atoms: Optional[int] = None,
+                 dt_ps: Optional[float] = None, start_ps: Optional[float] = None,
+                 out_file: Optional[PathLike] = None, box_angles: Optional[Sequence[float]] = None,
+                 n_frames: Optional[int] = None):
+        self.path = Path(path)
+        self.format = fmt or detect_format(self.path)
+        self.n_atoms = n_atoms
+        self.dt_ps = dt_ps
+        self.start_ps = start_ps
+        self.out_file = Path(out_file) if out_file else None
+        self.box_angles = np.asarray(box_angles if box_angles is not None else (90.0, 90.0, 90.0), dtype=np.float64)
+        self._n_frames = n_frames
+        self._reader = None
+
+    @property
+    def n_frames(self) -> int:
+        if self._n_frames is None:
+            self._n_frames = self._count_frames()
+        return self._n_frames
+
+    def _count_frames(self) -> int:
+        if self.format == "dcd":
+            header = DCDHeader(self.path)
+            self._check_atoms(header.n_atoms)
+            return header.n_frames
+        return len(self.reader)
+
+    def _check_atoms(self, n_atoms: int) -> None:
+        """Takes the atom count stored in the file; it must match the one given (topology)."""
+        if self.n_atoms is not None and n_atoms != self.n_atoms:
+            raise ValueError(f"{self.path.name}: {n_atoms} atoms in the trajectory, {self.n_atoms} in the topology")
+        self.n_atoms = n_atoms
+
+    @property
+    def reader(self):
+        """The underlying reader, opened on first use."""
+        if self._reader is None:
+            if self.format == "dcd":
+                self._reader = DCDReader(self.path)
+            elif self.format == "netcdf":
+                self._reader = NetCDFTrajectory(self.path)
+            elif self.format == "mdcrd":
+                if self.n_atoms is None:
+                    raise ValueError(f"{self.path.name}: the number of atoms is needed to read an ASCII trajectory")
+                self._reader = MdcrdReader(self.path, self.n_atoms)
+            else:
+                raise ValueError(f"{self.path.name}: unknown trajectory format '{self.format}'")
+            self._check_atoms(self._reader.n_atoms)
+        return self._reader
+
+    def resolve_dt(self) -> Optional[float]:
+        """Fills in dt_ps from the file itself when it was not given."""
+        if self.dt_ps is not None:
+            return self.dt_ps
+        if self.format == "netcdf":
+            if len(self.reader) > 1:
+                _, _, times = self.reader.read_frames([0, 1], atom_indices=[0])
+                if times is not None:
+                    self.dt_ps = float(times[1] - times[0])
+        if self.dt_ps is None and self.out_file is not None:
+            self.dt_ps = read_md_timing(self.out_file)
+        if self.dt_ps is None and self.format == "dcd":
+            header = DCDHeader(self.path)
+            if header.delta > 0 and header.nsavc > 0:
+                self.dt_ps = header.nsavc * header.delta * AKMA_TIME_PS
+        return self.dt_ps
+
+    def resolve_times(self) -> Optional[np.ndarray]:
+        """
+        Simulation time (ps) of every local frame from the file's own time axis.
+
+        NetCDF files give their `time` variable; DCD files give
+        (ISTART + k * NSAVC) * DELTA when that spacing agrees with dt_ps.
+
+        Returns:
+            Optional[np.ndarray]: Increasing times, or None if start_ps was
+            given or the file has no usable time axis.
+        """
+        if self.start_ps is not None:
+            return None
+        times = None
+        if self.format == "netcdf":
+            times = self.reader.times()
+        elif self.format == "dcd" and self.resolve_dt() is not None:
+            header = DCDHeader(self.path)
+            step_ps = header.delta * AKMA_TIME_PS
+            if header.nsavc > 0 and np.isclose(header.nsavc * step_ps, self.dt_ps):
+                times = (header.istart + header.nsavc * np.arange(self.n_frames)) * step_ps
+        # Writers that store no real time (all zeros) give no axis
+        if times is None or len(times) == 0 or np.any(np.diff(times) <= 0) or not np.all(np.isfinite(times)):
+            return None
+        return times
+
+    def read(self, frames: np.ndarray, atom_indices: Optional[np.ndarray] = None):
+        """Coordinates (n, n_sel, 3) and boxes (n, 6) or None of local frames."""
+        reader = self.reader
+        if self.format == "dcd":
+            if atom_indices is None:
+                xyz = reader[frames]
+            else:
+                xyz = np.asarray(reader.xyz[np.ix_(frames, atom_indices)], dtype=np.float32)
+            return xyz, reader.unit_cells(frames)
+        if self.format == "netcdf":
+            xyz, boxes, _ = reader.read_frames(frames, atom_indices)
+            return xyz, boxes
+        xyz, lengths = reader.read_frames(frames)
+        if atom_indices is not None:
+            xyz = xyz[:, atom_indices]
+        boxes = None
+        if lengths is not None:
+            boxes = np.hstack([lengths, np.broadcast_to(self.box_angles, lengths.shape)])
+        return xyz, boxes
+
+    def close(self) -> None:
+        if self._reader is not None and hasattr(self._reader, "close"):
+            self._reader.close()
+        self._reader = None
+
+
+class SegmentedTrajectory:
+    """
+    Several trajectory segments seen as one logical frame sequence.
+
+    Example:
+        traj = SegmentedTrajectory.from_steps(["STEP_10_PROD", "STEP_11_PROD"], topology=top)
+        segment, local, time_ps = traj.locate_frame(12000)
+        for frames, xyz, boxes in traj.iter_chunks(512, atom_indices=ligand):
+            ...
+    """
+
+    def __init__(self, segments: Sequence[TrajectorySegment]):
+        if not segments:
+            raise ValueError("A segmented trajectory needs at least one segment")
+        self.segments = list(segments)
+
+        # Binary formats know their atom count; ASCII segments borrow it from them
+        for segment in self.segments:
+            if segment.format != "mdcrd":
+                segment.n_frames
+        atom_counts = {s.n_atoms for s in self.segments if s.n_atoms is not None}
+        if len(atom_counts) > 1:
+            raise ValueError(f"Segments have different numbers of atoms: {sorted(atom_counts)}")
+        self.n_atoms = atom_counts.pop() if atom_counts else None
+        for segment in self.segments:
+            if segment.n_atoms is None:
+                segment.n_atoms = self.n_atoms
+
+        lengths = np.array([s.n_frames for s in self.segments], dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+        # Exact time axis: the file's own times when it has them; otherwise each segment starts
+        # where the last known time ends unless stated otherwise (unknown timing does not advance it)
+        self.dt_ps = np.full(len(self.segments), np.nan)
+        self.start_ps = np.zeros(len(self.segments))
+        self._times = []
+        clock = 0.0
+        for i, segment in enumerate(self.segments):
+            dt = segment.resolve_dt()
+            self.dt_ps[i] = np.nan if dt is None else dt
+            times = segment.resolve_times()
+            self._times.append(times)
+            if times is not None:
+                self.start_ps[i] = times[0] - (self.dt_ps[i] if dt is not None else 0.0)
+                clock = times[-1]
+            else:
+                self.start_ps[i] = clock if segment.start_ps is None else segment.start_ps
+                clock = self.start_ps[i] + (segment.n_frames * self.dt_ps[i] if dt is not None else 0.0)
+
+    @property
+    def n_frames(self) -> int:
+        return int(self.offsets[-1])
+
+    def __len__(self) -> int:
+        return self.n_frames
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
+
+    def locate(self, frames) -> Tuple[np.ndarray, np.ndarray]:
+        """Maps 0-based global frames to (segment index, local frame) arrays."""
+        frames = np.asarray(frames, dtype=np.int64)
+        if frames.size and (frames.min() < 0 or frames.max() >= self.n_frames):
+            raise IndexError(f"Frame index out of range (trajectory has {self.n_frames} frames)")
+        segment_ids = np.searchsorted(self.offsets, frames, side="right") - 1
+        return segment_ids, frames - self.offsets[segment_ids]
+
+    def locate_frame(self, frame: int) -> Tuple[Path, int, float]:
+        """(segment file, local 0-based frame, simulation time in ps) of one global frame."""
+        segment_ids, local = self.locate([frame])
+        return self.segments[segment_ids[0]].path, int(local[0]), float(self.frame_times([frame])[0])
+
+    def global_frame(self, segment_index: int, local_frame: int) -> int:
+        """Inverse of locate(): global frame of a local frame of a segment."""
+        if not 0 <= local_frame < self.segments[segment_index].n_frames:
+            raise IndexError(f"{self.segments[segment_index].path.name} has no frame {local_frame}")
+        return int(self.offsets[segment_index] + local_frame)
+
+    def frame_times(self, frames=None) -> np.ndarray:
+        """Simulation time (ps) of global frames; NaN for segments with unknown timing."""
+        frames = np.arange(self.n_frames) if frames is None else np.asarray(frames, dtype=np.int64)
+        segment_ids, local = self.locate(frames)
+        times = self.start_ps[segment_ids] + (local + 1) * self.dt_ps[segment_ids]
+        for segment_id in np.unique(segment_ids):
+            if self._times[segment_id] is not None:
+                rows = segment_ids == segment_id
+                times[rows] = self._times[segment_id][local[rows]]
+        return times
+
+    def read_frames(self, frames, atom_indices: Optional[Sequence[int]] = None):
+        """
+        Reads global frames, opening only the segments they belong to.
+
+        Args:
+            frames: 0-based global frame indices.
+            atom_indices: Optional 0-based atom subset.
+
+        Returns:
+            Tuple: (xyz (n, n_sel, 3) float32, boxes (n, 6) or None).
+        """
+        frames = np.atleast_1d(np.asarray(frames, dtype=np.int64))
+        subset = None if atom_indices is None else np.asarray(atom_indices, dtype=np.int64)
+        segment_ids, local = self.locate(frames)
+
+        n_sel = self.n_atoms if subset is None else len(subset)
+        xyz = np.empty((len(frames), n_sel, 3), dtype=np.float32)
+        boxes = None
+        for segment_id in np.unique(segment_ids):
+            rows = np.flatnonzero(segment_ids == segment_id)
+            block_xyz, block_boxes = self.segments[segment_id].read(local[rows], subset)
+            xyz[rows] = block_xyz
+            if block_boxes is not None:
+                if boxes is None:
+                    boxes = np.full((len(frames), 6), np.nan)
+                boxes[rows] = block_boxes
+        return xyz, boxes
+
+    def iter_chunks(self, chunk_size: int = 512, start: int = 0, stop: Optional[int] = None, stride: int = 1,
+                    atom_indices: Optional[Sequence[int]] = None) -> Iterator[tuple]:
+        """Yields (global_frames, xyz, boxes) blocks of at most `chunk_size` frames."""
+        frames = np.arange(self.n_frames)[start:stop:stride]
+        for first in range(0, len(frames), chunk_size):
+            block = frames[first:first + chunk_size]
+            xyz, boxes = self.read_frames(block, atom_indices)
+            yield block, xyz, boxes
+
+    # --- Manifest ---
+    def save_manifest(self, manifest_file: PathLike) -> None:
+        """Writes the segment list, frame counts and timing to a JSON manifest."""
+        manifest_path = Path(manifest_file)
+        base = manifest_path.resolve().parent
+        entries = []
+        for i, segment in enumerate(self.segments):
+            stat = segment.path.stat()
+            path = segment.path.resolve()
+            entries.append({
+                "path": os.path.relpath(path, base),
+                "format": segment.format,
+                "n_frames": segment.n_frames,
+                "first_frame": int(self.offsets[i]),
+                "dt_ps": None if np.isnan(self.dt_ps[i]) else float(self.dt_ps[i]),
+                # Segments timed by their own file re-read it instead of a fixed start
+                "start_ps": None if self._times[i] is not None else float(self.start_ps[i]),
+                "out_file": os.path.relpath(segment.out_file.resolve(), base) if segment.out_file else None,
+                "file_size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+            })
+        payload = {"version": MANIFEST_VERSION, "n_atoms": self.n_atoms, "n_frames": self.n_frames,
+                   "segments": entries}
+        partial = manifest_path.with_name(f"{manifest_path.name}.{os.getpid()}.part")
+        with open(partial, "w") as f:
+            json.dump(payload, f, indent=2)
+        os.replace(partial, manifest_path)
+
+    @classmethod
+    def from_manifest(cls, manifest_file: PathLike, topology=None) -> "SegmentedTrajectory":
+        """
+        Rebuilds the trajectory from a manifest; frame counts of segments that
+        changed on disk since it was written are counted again.
+        """
+        manifest_path = Path(manifest_file)
+        with open(manifest_path) as f:
+            payload = json.load(f)
+        if payload.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"{manifest_path}: unsupported manifest version {payload.get('version')}")
+
+        base = manifest_path.resolve().parent
+        n_atoms = payload.get("n_atoms")
+        if topology is not None:
+            if n_atoms is not None and n_atoms != topology.n_atoms:
+                raise ValueError(f"{manifest_path.name}: {n_atoms} atoms in the trajectory, "
+                                 f"{topology.n_atoms} in the topology")
+            n_atoms = topology.n_atoms
+        box_angles = _box_angles(topology)
+        segments = []
+        for entry in payload["segments"]:
+            path = base / entry["path"]
+            stat = path.stat()
+            unchanged = stat.st_size == entry.get("file_size") and stat.st_mtime_ns == entry.get("mtime_ns")
+            segments.append(TrajectorySegment(
+                path, fmt=entry.get("format"), n_atoms=n_atoms, dt_ps=entry.get("dt_ps"),
+                start_ps=entry.get("start_ps"),
+                out_file=base / entry["out_file"] if entry.get("out_file") else None,
+                box_angles=box_angles, n_frames=entry["n_frames"] if unchanged else None,
+            ))
+        return cls(segments)
+
+    @classmethod
+    def from_steps(cls, step_dirs: Sequence[PathLike], topology=None) -> "SegmentedTrajectory":
+        """
+        Collects the trajectory of every step directory that has one, in order.
+
+        Each directory is searched for STEP_TRAJECTORY_NAMES; its `<step>.out`
+        file, if present, provides the frame timing.
+        """
+        segments = []
+        for step_dir in step_dirs:
+            step_dir = Path(step_dir)
+            trajectory = find_step_trajectory(step_dir)
+            if trajectory is None:
+                continue
+            out_file = step_dir / f"{step_dir.name}.out"
+            segments.append(TrajectorySegment(
+                trajectory, n_atoms=topology.n_atoms if topology is not None else None,
+                out_file=out_file if out_file.exists() else None, box_angles=_box_angles(topology),
+            ))
+        return cls(segments)
+
+
+def find_step_trajectory(step_dir: PathLike) -> Optional[Path]:
+    """First trajectory file found in a step directory, or None."""
+    step_dir = Path(step_dir)
+    for name in STEP_TRAJECTORY_NAMES:
+        candidate = step_dir / name.format(step=step_dir.name)
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def _box_angles(topology) -> Optional[List[float]]:
+    if topology is None or topology.box is None:
+        return None
+    return list(np.asarray(topology.box)[3:])
+
+
+def open_trajectory(path: PathLike, topology=None) -> SegmentedTrajectory:
+    """
+    Opens a single trajectory file or a JSON manifest as a SegmentedTrajectory.
+
+    Args:
+        path: .mdcrd, .nc or .dcd file, or a manifest written by save_manifest().
+        topology: Parsed prmtop; gives the atom count and box angles of .mdcrd files.
+
+    Raises:
+        ValueError: If the trajectory and the topology have different numbers of atoms.
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".json":
+        return SegmentedTrajectory.from_manifest(path, topology)
+    segment = TrajectorySegment(path, n_atoms=topology.n_atoms if topology is not None else None,
+                                box_angles=_box_angles(topology))
+    return SegmentedTrajectory([segment])
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Sparse frame x item matrices (CSR) stored as NPZ.
+
+distance_analyzer.py keeps only the (frame, item, distance) triples inside the
+requested range instead of dense CSVs that are mostly empty cells. Row k
+holds the items of frame k: indices[indptr[k]:indptr[k + 1]] with their
+values in data[...]. Dense CSVs and the per-frame summary are generated from
+this on demand.
+"""
+
+import csv
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+PathLike = Union[str, Path]
+
+SPARSE_FORMAT_VERSION = 1
+# Rows written per block when expanding to dense CSV
+CSV_BLOCK = 256
+
+
+class FrameSparseMatrix:
+    """
+    Frames x items matrix in CSR layout.
+
+    Args:
+        indptr: (n_frames + 1,) row pointers.
+        indices: (nnz,) item column of every stored value.
+        data: (nnz,) values, or None for a boolean (presence) matrix.
+        labels: Name of every item column.
+        frames: Frame number of every row (1-based by default).
+        metadata: JSON-serialisable description (mode, target, range, ...).
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: Optional[np.ndarray],
+                 labels: Sequence[str], frames: Optional[np.ndarray] = None, metadata: Optional[Dict] = None):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = None if data is None else np.asarray(data)
+        self.labels = np.asarray(labels, dtype=str)
+        n_frames = len(self.indptr) - 1
+        self.frames = np.arange(1, n_frames + 1) if frames is None else np.asarray(frames, dtype=np.int64)
+        self.metadata = dict(metadata or {})
+
+    @property
+    def n_frames(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def n_items(self) -> int:
+        return len(self.labels)
+
+    @property
+    def nnz(self) -> int:
+        return int(self.indptr[-1])
+
+    def row(self, k: int) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Item indices and values of row k."""
+        start, stop = self.indptr[k], self.indptr[k + 1]
+        return self.indices[start:stop], None if self.data is None else self.data[start:stop]
+
+    def row_ids(self) -> np.ndarray:
+        """Row of every stored value (COO expansion of indptr)."""
+        return np.repeat(np.arange(self.n_frames), np.diff(self.indptr))
+
+    def to_dense(self, rows: slice = slice(None), fill=np.nan) -> np.ndarray:
+        """Dense (n_rows, n_items) block; missing entries are `fill` (False for boolean matrices)."""
+        selected = np.arange(self.n_frames)[rows]
+        if self.data is None:
+            dense = np.zeros((len(selected), self.n_items), dtype=bool)
+        else:
+            dense = np.full((len(selected), self.n_items), fill, dtype=np.result_type(self.data.dtype, type(fill)))
+        if len(selected) == 0:
+            return dense
+        first, last = selected[0], selected[-1] + 1
+        start, stop = self.indptr[first], self.indptr[last]
+        local_rows = np.repeat(np.arange(last - first), np.diff(self.indptr[first:last + 1]))
+        dense[local_rows, self.indices[start:stop]] = True if self.data is None else self.data[start:stop]
+        return dense
+
+    def item_counts(self) -> np.ndarray:
+        """Number of rows in which every item is present."""
+        return np.bincount(self.indices, minlength=self.n_items)
+
+    def save(self, output_file: PathLike) -> None:
+        """Writes the matrix to a compressed NPZ (atomically)."""
+        path = Path(output_file)
+        payload = {
+            "version": np.int64(SPARSE_FORMAT_VERSION),
+            "indptr": self.indptr,
+            "indices": self.indices.astype(np.int32 if self.n_items < 2 ** 31 else np.int64),
+            "labels": self.labels,
+            "frames": self.frames,
+            "metadata": np.array(json.dumps(self.metadata)),
+        }
+        if self.data is not None:
+            payload["data"] = self.data
+        partial = path.with_name(f"{path.name}.{os.getpid()}.part")
+        with open(partial, "wb") as f:
+            np.savez_compressed(f, **payload)
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, input_file: PathLike) -> "FrameSparseMatrix":
+        with np.load(input_file, allow_pickle=False) as f:
+            if int(f["version"]) != SPARSE_FORMAT_VERSION:
+                raise ValueError(f"{input_file}: unsupported sparse format version {int(f['version'])}")
+            return cls(f["indptr"], f["indices"], f["data"] if "data" in f else None, f["labels"],
+                       f["frames"], json.loads(str(f["metadata"])))
+
+
+class SparseFrameWriter:
+    """
+    Accumulates a FrameSparseMatrix chunk by chunk from dense blocks.
+
+    Only the selected entries of every block are kept, so memory grows with
+    the number of stored values, not with frames x items.
+    """
+
+    def __init__(self, labels: Sequence[str], metadata: Optional[Dict] = None, store_values: bool = True):
+        self.labels = list(labels)
+        self.metadata = metadata
+        self.store_values = store_values
+        self._counts: List[np.ndarray] = []
+        self._indices: List[np.ndarray] = []
+        self._data: List[np.ndarray] = []
+        self._frames: List[np.ndarray] = []
+
+    def append(self, frames: np.ndarray, mask: np.ndarray, values: Optional[np.ndarray] = None) -> None:
+        """
+        Adds a block of rows.
+
+        Args:
+            frames: Frame numbers of the rows.
+            mask: (n_rows, n_items) boolean selection of the entries to keep.
+            values: (n_rows, n_items) values (ignored for boolean matrices).
+        """
+        rows, columns = np.nonzero(mask)
+        self._frames.append(np.asarray(frames, dtype=np.int64))
+        self._counts.append(np.bincount(rows, minlength=mask.shape[0]))
+        self._indices.append(columns)
+        if self.store_values:
+            self._data.append(values[rows, columns].astype(np.float32))
+
+    def append_rows(self, frames: np.ndarray, rows: np.ndarray, columns: np.ndarray,
+                    values: Optional[np.ndarray] = None) -> None:
+        """Adds a block of rows given as COO triples (rows are 0-based within the block, sorted)."""
+        self._frames.append(np.asarray(frames, dtype=np.int64))
+        self._counts.append(np.bincount(rows, minlength=len(frames)))
+        self._indices.append(np.asarray(columns, dtype=np.int64))
+        if self.store_values:
+            self._data.append(np.asarray(values, dtype=np.float32))
+
+    def finish(self) -> FrameSparseMatrix:
+        counts = np.concatenate(self._counts) if self._counts else np.empty(0, dtype=np.int64)
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+        indices = np.concatenate(self._indices) if self._indices else np.empty(0, dtype=np.int64)
+        data = None
+        if self.store_values:
+            data = np.concatenate(self._data) if self._data else np.empty(0, dtype=np.float32)
+        frames = np.concatenate(self._frames) if self._frames else np.empty(0, dtype=np.int64)
+        return FrameSparseMatrix(indptr, indices, data, self.labels, frames, self.metadata)
+
+
+def iter_dense_rows(matrix: FrameSparseMatrix, value_format: str = "%.4f",
+                    block: int = CSV_BLOCK) -> Iterator[List[str]]:
+    """Dense CSV rows ([frame, cell, ...]) with empty cells for missing entries."""
+    for first in range(0, matrix.n_frames, block):
+        rows = slice(first, min(first + block, matrix.n_frames))
+        dense = matrix.to_dense(rows)
+        if matrix.data is None:
+            text = np.where(dense, "1", "")
+        else:
+            text = np.where(np.isnan(dense), "", np.char.mod(value_format, np.nan_to_num(dense)))
+        for frame, cells in zip(matrix.frames[rows], text):
+            yield [frame, *cells]
+
+
+def write_dense_csv(matrix: FrameSparseMatrix, output_file: PathLike, value_format: str = "%.4f") -> None:
+    """Expands the matrix to the dense `Frame,item_1,item_2,...` CSV layout."""
+    with open(output_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Frame", *matrix.labels])
+        writer.writerows(iter_dense_rows(matrix, value_format))
+
+
+def write_summary_csv(matrix: FrameSparseMatrix, output_file: PathLike,
+                      header: Sequence[str] = ("Frame", "Items_in_range")) -> None:
+    """Per-frame list of the items present in every row (distance_analyzer summary layout)."""
+    with open(output_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(list(header))
+        for k, frame in enumerate(matrix.frames):
+            columns, _ = matrix.row(k)
+            writer.writerow([frame, ",".join(matrix.labels[columns])])
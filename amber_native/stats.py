@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+"""
+Streaming, mergeable statistics.
+
+Accumulators keep the count, the mean and M2 (sum of squared deviations from
+the mean) of arrays of any shape, and the co-moment of paired streams. A batch of frames is reduced to its own
+(count, mean, M2) and combined with the running values by the pairwise update
+of Chan, Golub and LeVeque, which is exact: accumulators built on separate
+frame blocks (e.g. in worker processes) merge into the same result as a
+single pass, without keeping per-frame series.
+"""
+
+from typing import Tuple, Union
+
+import numpy as np
+
+Shape = Union[int, Tuple[int, ...]]
+
+
+class RunningMoments:
+    """
+    Count, mean and M2 of a stream of arrays.
+
+    Args:
+        shape: Shape of one sample (e.g. (n_ligand_residues, n_receptor_residues)).
+    """
+
+    def __init__(self, shape: Shape = ()):
+        self.count = 0
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.m2 = np.zeros(shape, dtype=np.float64)
+
+    def __getitem__(self, index) -> "RunningMoments":
+        """Accumulator of a subset of the elements (e.g. one residue pair of a matrix)."""
+        part = RunningMoments()
+        part.count, part.mean, part.m2 = self.count, self.mean[index], self.m2[index]
+        return part
+
+    def _combine(self, count: int, mean: np.ndarray, m2: np.ndarray) -> "RunningMoments":
+        if count == 0:
+            return self
+        total = self.count + count
+        delta = mean - self.mean
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.count * count / total)
+        self.mean = self.mean + delta * (count / total)
+        self.count = total
+        return self
+
+    def update(self, batch: np.ndarray) -> "RunningMoments":
+        """Adds a batch of samples stacked along axis 0."""
+        batch = np.asarray(batch, dtype=np.float64)
+        if len(batch) == 0:
+            return self
+        mean = batch.mean(axis=0)
+        return self._combine(len(batch), mean, ((batch - mean) ** 2).sum(axis=0))
+
+    def merge(self, other: "RunningMoments") -> "RunningMoments":
+        """Adds the samples summarised by another accumulator."""
+        return self._combine(other.count, other.mean, other.m2)
+
+    def variance(self, ddof: int = 0) -> np.ndarray:
+        """Variance (population by default, as np.var); NaN with too few samples."""
+        if self.count <= ddof:
+            return np.full_like(self.m2, np.nan)
+        return self.m2 / (self.count - ddof)
+
+    def std(self, ddof: int = 0) -> np.ndarray:
+        return np.sqrt(self.variance(ddof))
+
+
+class RunningCovariance:
+    """
+    Running moments of two paired streams plus their co-moment.
+
+    The co-moment C = sum((x - mean_x) * (y - mean_y)) merges like M2, so the
+    variance of x + y (e.g. EELEC + EVDW) is exact: var_x + var_y + 2 cov_xy.
+
+    Args:
+        shape: Shape of one sample of x (and of y).
+    """
+
+    def __init__(self, shape: Shape = ()):
+        self.x = RunningMoments(shape)
+        self.y = RunningMoments(shape)
+        self.comoment = np.zeros(shape, dtype=np.float64)
+
+    @property
+    def count(self) -> int:
+        return self.x.count
+
+    def __getitem__(self, index) -> "RunningCovariance":
+        """Accumulator of a subset of the elements."""
+        part = RunningCovariance()
+        part.x, part.y, part.comoment = self.x[index], self.y[index], self.comoment[index]
+        return part
+
+    def _combine(self, count: int, mean_x: np.ndarray, mean_y: np.ndarray, comoment: np.ndarray) -> None:
+        if count == 0:
+            return
+        weight = self.count * count / (self.count + count)
+        self.comoment = self.comoment + comoment + (mean_x - self.x.mean) * (mean_y - self.y.mean) * weight
+
+    def update(self, batch_x: np.ndarray, batch_y: np.ndarray) -> "RunningCovariance":
+        """Adds paired batches of samples stacked along axis 0."""
+        batch_x = np.asarray(batch_x, dtype=np.float64)
+        batch_y = np.asarray(batch_y, dtype=np.float64)
+        if len(batch_x) == 0:
+            return self
+        mean_x, mean_y = batch_x.mean(axis=0), batch_y.mean(axis=0)
+        self._combine(len(batch_x), mean_x, mean_y, ((batch_x - mean_x) * (batch_y - mean_y)).sum(axis=0))
+        self.x.update(batch_x)
+        self.y.update(batch_y)
+        return self
+
+    def merge(self, other: "RunningCovariance") -> "RunningCovariance":
+        """Adds the samples summarised by another accumulator."""
+        self._combine(other.count, other.x.mean, other.y.mean, other.comoment)
+        self.x.merge(other.x)
+        self.y.merge(other.y)
+        return self
+
+    def covariance(self, ddof: int = 0) -> np.ndarray:
+        if self.count <= ddof:
+            return np.full_like(self.comoment, np.nan)
+        return self.comoment / (self.count - ddof)
+
+    def sum_mean(self) -> np.ndarray:
+        """Mean of x + y."""
+        return self.x.mean + self.y.mean
+
+    def sum_std(self, ddof: int = 0) -> np.ndarray:
+        """Standard deviation of x + y, with the covariance term."""
+        variance = self.x.variance(ddof) + self.y.variance(ddof) + 2 * self.covariance(ddof)
+        return np.sqrt(np.maximum(variance, 0.0))
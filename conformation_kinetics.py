@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+import csv
+import os
+import sys
+import readline
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from amber_native.kinetics import (connected_sets, dwell_times, implied_timescales, lifetimes,
+                                   mean_first_passage_times, reversible_transition_matrix, split_segments,
+                                   transition_counts)
+
+readline.parse_and_bind("tab: complete")
+
+# Request parameters from the user
+classification_files = [name.strip() for name in input(
+    "Classification files (dihedrals_summary_with_classification.csv), one per replica, comma separated: "
+).split(",") if name.strip()]
+segment_frames = int(input("Frames per independent segment inside each file (0 = continuous) [0]: ").strip() or 0)
+dt_ps = float(input("Time between frames (ps) [1.0]: ").strip() or 1.0)
+lag = int(input("Lag time (frames) for the transition matrix [1]: ").strip() or 1)
+its_lags = [int(value) for value in
+            (input("Lag times (frames) for the implied timescales [1,2,5,10,20,50,100]: ").strip()
+             or "1,2,5,10,20,50,100").split(",")]
+skip_unassigned = input("Treat conformations with unassigned dihedrals (X) as missing frames? (yes/no): ").strip().lower() == "yes"
+output_dir = "conformation_kinetics"  # Directory to save results
+os.makedirs(output_dir, exist_ok=True)
+
+
+def read_classification(csv_file):
+    """Conformation label of every frame (last column of the classification CSV)."""
+    csv.field_size_limit(sys.maxsize)
+    with open(csv_file, newline="") as f:
+        reader = csv.reader(f)
+        next(reader)  # Skip the header row
+        return [row[-1] for row in reader if row]
+
+
+# Integer state sequences: conformations numbered over all replicas, segments kept apart
+per_file = [read_classification(csv_file) for csv_file in classification_files]
+labels, states = np.unique(np.concatenate([np.asarray(frames, dtype=str) for frames in per_file]), return_inverse=True)
+labels = [str(label) for label in labels]
+states = states.ravel().astype(np.int64)
+if skip_unassigned:
+    states[np.isin(states, [k for k, label in enumerate(labels) if "X" in label])] = -1
+bounds = np.cumsum([0] + [len(frames) for frames in per_file])
+sequences = [segment for first, last in zip(bounds[:-1], bounds[1:])
+             for segment in split_segments(states[first:last], segment_frames)]
+n_states = len(labels)
+
+
+def estimate(lag_frames):
+    """Reversible transition matrix on the largest connected set at a lag time."""
+    counts = transition_counts(sequences, n_states, lag_frames)
+    connected = connected_sets(counts)[0]
+    if len(connected) == 1:
+        return counts, connected, np.ones((1, 1)), np.ones(1)
+    matrix, stationary = reversible_transition_matrix(counts[np.ix_(connected, connected)])
+    return counts, connected, matrix, stationary
+
+
+counts, connected, matrix, stationary = estimate(lag)
+connected_labels = [labels[k] for k in connected]
+
+# Per-conformation summary: populations, stationary weights and lifetimes
+frames_per_state = np.bincount(states[states >= 0], minlength=n_states)
+runs, mean_dwell = dwell_times(sequences, n_states)
+model_lifetimes = np.full(n_states, np.nan)
+model_lifetimes[connected] = lifetimes(matrix, lag)
+weights = np.full(n_states, np.nan)
+weights[connected] = stationary
+with open(os.path.join(output_dir, "conformation_summary.csv"), "w", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow(["Conformation", "Frames", "Population", "Connected", "Stationary_Population",
+                     "Dwell_Runs", "Mean_Dwell_ps", "Model_Lifetime_ps"])
+    for k in np.argsort(-frames_per_state, kind="stable"):
+        writer.writerow([labels[k], frames_per_state[k], f"{frames_per_state[k] / max(frames_per_state.sum(), 1):.6f}",
+                         "yes" if k in connected else "no", f"{weights[k]:.6f}", runs[k],
+                         f"{mean_dwell[k] * dt_ps:.3f}", f"{model_lifetimes[k] * dt_ps:.3f}"])
+
+# Transition counts (all conformations) and transition matrix / MFPTs (connected set)
+with open(os.path.join(output_dir, "transition_counts.csv"), "w", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow([f"From\\To (lag {lag})", *labels])
+    for label, row in zip(labels, counts):
+        writer.writerow([label, *row])
+
+with open(os.path.join(output_dir, "transition_matrix.csv"), "w", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow([f"From\\To (lag {lag})", *connected_labels])
+    for label, row in zip(connected_labels, matrix):
+        writer.writerow([label, *[f"{value:.6f}" for value in row]])
+
+passage = mean_first_passage_times(matrix, stationary, lag) * dt_ps
+with open(os.path.join(output_dir, "mfpt_ps.csv"), "w", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow(["From\\To", *connected_labels])
+    for label, row in zip(connected_labels, passage):
+        writer.writerow([label, *[f"{value:.3f}" for value in row]])
+
+# Implied timescales versus lag time (flat curves = Markovian model)
+n_timescales = max(1, min(5, len(connected) - 1))
+with open(os.path.join(output_dir, "implied_timescales.csv"), "w", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow(["Lag_frames", "Lag_ps", "Connected_States",
+                     *[f"ITS_{k + 1}_ps" for k in range(n_timescales)]])
+    for its_lag in its_lags:
+        _, its_connected, its_matrix, _ = estimate(its_lag)
+        timescales = implied_timescales(its_matrix, its_lag, n_timescales) * dt_ps
+        writer.writerow([its_lag, f"{its_lag * dt_ps:.3f}", len(its_connected),
+                         *[f"{value:.3f}" for value in timescales]])
+
+print(f"{n_states} conformations over {len(sequences)} sequences ({len(connected)} connected at lag {lag}). "
+      f"Results saved in '{output_dir}'.")
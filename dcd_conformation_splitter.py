@@ -7,6 +7,14 @@
 import csv
 import os
 import subprocess
+import sys
+
+# Native DCD tools shared with the rest of the repository (optional)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+try:
+    from amber_native.dcd import extract_dcd_frames
+except ImportError:
+    extract_dcd_frames = None
 
 #############################################################################################################################################
 # Input -> dihedrals_grouped_by_conformation.csv | REVIEW EACH SECTION CAREFULLY. #
@@ -71,9 +79,17 @@ subprocess.run(["cp", os.path.join("..", traj_file), "."])
 subprocess.run(["cp", os.path.join("..", dihedrals_grouped_by_conformation_csv), "."])
 
 
+# DCD frames can be copied straight out of the trajectory, no cpptraj needed
+
+use_native = extract_dcd_frames is not None and traj_file.lower().endswith(".dcd")
+
 # Generate the function to create the cpptraj input files and execute cpptraj
 
 for conf in all_conformations:
+    if use_native:
+        extract_dcd_frames(traj_file, [item - 1 for item in conf[2]], f"{conf[0]}_{conf[1]}frames.dcd")
+        continue
+
     trajin_lines = "\n".join([f"trajin {traj_file} {item} {item}" for item in conf[2]])
     input_filename = f"dcd_splitter_input_{conf[0]}_{conf[1]}frames.in"
     with open(f"{input_filename}", "w") as f:
@@ -103,7 +119,8 @@ print("""#######################################################################
 ############################################################################################################################################################
 ############################################################################################################################################################""")
 file_count = len([f for f in os.listdir() if os.path.isfile(f)])
-file_expected = len(all_conformations)*2 + 4  # Each conformation generates 2 files (input and output dcd) + 4 other files (script, parm, traj, csv)
+files_per_conformation = 1 if use_native else 2  # Output dcd (+ cpptraj input file when cpptraj is used)
+file_expected = len(all_conformations)*files_per_conformation + 4  # + 4 other files (script, parm, traj, csv)
 
 all_ok = True
 
@@ -120,13 +137,15 @@ suffix_dcd = ".dcd"
 for conf in all_conformations:
     input_file = f"{prefix_cpptraj_input}{conf[0]}_{conf[1]}frames{suffix_cpptraj_input}"
     dcd_file = f"{conf[0]}_{conf[1]}frames{suffix_dcd}"
-    if not os.path.isfile(input_file):
+    if not use_native and not os.path.isfile(input_file):
         print(f"Error: Expected cpptraj input file {input_file} not found.")
         all_ok = False
     if not os.path.isfile(dcd_file):
         print(f"Error: Expected output DCD file {dcd_file} not found.")
         all_ok = False
-    if os.path.isfile(input_file) and os.path.isfile(dcd_file):
+    if use_native and os.path.isfile(dcd_file):
+        print(f"Successfully checked: Output file '{dcd_file}' written natively.")
+    elif os.path.isfile(input_file) and os.path.isfile(dcd_file):
         print(f"Successfully checked: Input file '{input_file}' matches output file '{dcd_file}'.")
 print("""############################################################################################################################################################
 ############################################################################################################################################################
@@ -1,8 +1,25 @@
 from pathlib import Path
 import csv
+import sys
 import readline
 readline.parse_and_bind("tab: complete")
 
+# Bit-packed streaming grouping (optional, needs pandas and amber_native)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+try:
+    import numpy as np
+    import pandas as pd
+    from amber_native.patterns import PatternGrouper, frame_ranges
+except ImportError:
+    PatternGrouper = None
+try:
+    from amber_native.contacts import ContactStore, is_contact_store
+except ImportError:
+    is_contact_store = None
+
+# Rows read per chunk in streaming mode
+CHUNK_ROWS = 100000
+
 
 def frames_to_ranges(frames):
     if not frames:
@@ -28,35 +45,91 @@ def frames_to_ranges(frames):
     return ",".join(ranges)
 
 
-document = input("Please enter the path to the csv file: ")
+def group_streaming(path, result_name):
+    """Groups frames chunk by chunk with bit-packed patterns; output sorted by population."""
+    header = pd.read_csv(path, nrows=0).columns
+    grouper = PatternGrouper(len(header) - 1)
+    for chunk in pd.read_csv(path, chunksize=CHUNK_ROWS):
+        values = chunk.to_numpy()
+        grouper.add(values[:, 0], values[:, 1:])
+
+    with open(result_name, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["binding_pattern", "frames", "population"])
+        for binding_pattern, population, frames in grouper.groups():
+            pattern_str = ",".join(str(x) for x in binding_pattern)
+            writer.writerow([pattern_str, frame_ranges(frames), population])
+    print(f"{grouper.n_patterns} distinct binding patterns.")
+
+
+def group_contact_store(path, result_name, names=None):
+    """Groups frames by the set of residues in contact (columns: residues ever in contact)."""
+    store = ContactStore(path)
+    columns = store.contacted_items(names)
+    position = np.full(store.n_items, -1)
+    position[columns] = np.arange(len(columns))
+    grouper = PatternGrouper(len(columns))
+    for chunk in store.iter_chunks():
+        keep = position[chunk.indices] >= 0
+        matrix = np.zeros((chunk.n_frames, len(columns)), dtype=bool)
+        matrix[chunk.row_ids()[keep], position[chunk.indices[keep]]] = True
+        grouper.add(chunk.frames, matrix)
+
+    labels = store.labels[columns]
+    with open(result_name, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["binding_pattern", "residues", "frames", "population"])
+        for binding_pattern, population, frames in grouper.groups():
+            pattern_str = ",".join(str(x) for x in binding_pattern)
+            writer.writerow([pattern_str, ",".join(labels[binding_pattern.astype(bool)]),
+                             frame_ranges(frames), population])
+    print(f"{len(columns)} residues in contact, {grouper.n_patterns} distinct binding patterns.")
+
+
+document = input("Please enter the path to the csv file (or a *_contacts store): ")
 result_name = f"{document.split('.')[0]}_grouped_frames.csv"
 path = Path(document)
 
+if is_contact_store is not None and PatternGrouper is not None and is_contact_store(path):
+    store_path = path.parent if path.is_file() else path
+    result_name = str(store_path.parent / f"{store_path.name}_grouped_frames.csv")
+    names = input("Residue names to include (e.g., WAT,K+; empty = all): ").strip()
+    group_contact_store(path, result_name, [n.strip() for n in names.split(",") if n.strip()] or None)
+    print(f"File {result_name} generated successfully.")
+    sys.exit(0)
+
+mode = input("Grouping mode (1 = classic, 2 = streaming bit-packed for very large files) [1]: ").strip() or "1"
+if mode == "2" and PatternGrouper is None:
+    print("Streaming mode needs pandas and amber_native; using classic mode.")
+    mode = "1"
+
 
-groups = {}
+if mode == "2":
+    group_streaming(path, result_name)
+else:
+    groups = {}
+
+    with open(path, 'r', newline='') as f:
+        csv_reader = csv.reader(f)
+        header = next(csv_reader, None)
+        
+        for row in csv_reader:
+            frame = row[0]
+            binding_pattern = tuple(int(x) for x in row[1:])
+            
+            if binding_pattern not in groups:
+                groups[binding_pattern] = []
+            groups[binding_pattern].append(frame)
 
 
-with open(path, 'r', newline='') as f:
-    csv_reader = csv.reader(f)
-    header = next(csv_reader, None)
-    
-    for row in csv_reader:
-        frame = row[0]
-        binding_pattern = tuple(int(x) for x in row[1:])
+    with open(result_name, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["binding_pattern", "frames"])
         
-        if binding_pattern not in groups:
-            groups[binding_pattern] = []
-        groups[binding_pattern].append(frame)
-
-
-with open(result_name, "w", newline="") as f:
-    writer = csv.writer(f)
-    writer.writerow(["binding_pattern", "frames"])
-    
-    for binding_pattern, frames in groups.items():
-        pattern_str = ",".join(str(x) for x in binding_pattern)
-        frames_str = frames_to_ranges(frames)  
-        writer.writerow([pattern_str, frames_str])
+        for binding_pattern, frames in groups.items():
+            pattern_str = ",".join(str(x) for x in binding_pattern)
+            frames_str = frames_to_ranges(frames)  
+            writer.writerow([pattern_str, frames_str])
 
 if Path(result_name).exists():
     print(f"File {result_name} generated successfully.")
@@ -11,6 +11,21 @@ import readline
 import sys
 import logging
 
+import numpy as np
+
+# Native readers and distance engine shared with the rest of the repository (optional)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+try:
+    from amber_native.prmtop import read_prmtop
+    from amber_native.segments import open_trajectory
+    from amber_native.distances import TargetDistanceEngine
+    from amber_native.sparse import SparseFrameWriter, write_summary_csv
+    from amber_native.contacts import ITEM_ATOM, ITEM_RESIDUE, ContactStoreWriter
+except ImportError:
+    read_prmtop = None
+    open_trajectory = None
+    TargetDistanceEngine = None
+
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
@@ -21,7 +36,7 @@ readline.parse_and_bind("tab: complete")
 
 try:
     topology_file = input("Topology file (*.prmtop): ")
-    trajectory_file = input("Trajectory file (*.mdcrd or *.dcd): ")
+    trajectory_file = input("Trajectory file (*.mdcrd, *.nc, *.dcd or manifest *.json): ")
     computing_mode = int(
         input(
             """
@@ -29,15 +44,29 @@ try:
     1. residue - residue 
     2. atom - residue 
     3. atom - atom
+    4. residue - residue (minimum heavy-atom distance)
 
     > """
         ).strip()
     )
 
+    # Residue positions are centres of mass, as in cpptraj `distance`; geometric centres (`geom`) on request
+    geometric_centers = computing_mode in [1, 2] and input(
+        "Use geometric centres instead of centres of mass for residues? (yes/no) [no]: "
+    ).strip().lower() == "yes"
+
     target = int(input("Target residue or atom (i) (e.g., 55): "))
     min_distance = float(input("Minimum distance range (Å) (e.g., 0.0): "))
     max_distance = float(input("Maximum distance range (Å) (e.g., 5.0): "))
     output_folder_name = input("Output folder name: ")
+    output_format = input(
+        """
+    Output format:
+    1. CSV (complete, filtered and summary)
+    2. Sparse (in-range distances as NPZ + summary CSV)
+
+    > [1] """
+    ).strip() or "1"
 except ValueError:
     logger.error("Error: Please enter valid numbers for mode, target, and distances.")
     sys.exit(1)
@@ -51,6 +80,8 @@ base_name = output_folder_name
 complete_distances_file = output_path / f"{base_name}_complete.csv"
 filtered_distances_file = output_path / f"{base_name}_filtered.csv"
 summary_distances_file = output_path / f"{base_name}_summary.csv"
+sparse_distances_file = output_path / f"{base_name}_inrange.npz"
+contact_store_dir = output_path / f"{base_name}_contacts"
 
 # Validate input files existence
 try:
@@ -60,8 +91,26 @@ except FileNotFoundError as e:
     logger.error(f"Error: {e}. Make sure the files exist.")
     sys.exit(1)
 
-# Generate temporary PDB file of the first frame
-cpptraj_pdb_script = f"""
+# Read residue/atom names (Amber numbering) straight from the topology
+residue_names = {}
+atom_names = {}
+
+topology = None
+if read_prmtop is not None:
+    try:
+        topology = read_prmtop(topology_file)
+    except (ValueError, OSError) as e:
+        logger.warning(f"Native prmtop reader not available ({e}). Reading names with cpptraj.")
+
+if topology is not None:
+    for residue_index, residue_name in enumerate(topology.residue_labels):
+        residue_names[str(residue_index + 1)] = str(residue_name)
+    for atom_index, (atom_name, residue_index) in enumerate(zip(topology.atom_names, topology.atom_residues)):
+        adjusted_residue_key = str(residue_index + 1)
+        atom_names[str(atom_index + 1)] = (str(atom_name), residue_names[adjusted_residue_key], adjusted_residue_key)
+else:
+    # Generate temporary PDB file of the first frame
+    cpptraj_pdb_script = f"""
 parm {topology_file}
 trajin {trajectory_file} 1 1 1
 trajout temp_first_frame.pdb include_ep
@@ -69,50 +118,48 @@ run
 quit
 """
 
-with open("cpptraj_pdb.in", "w") as f:
-    f.write(cpptraj_pdb_script)
+    with open("cpptraj_pdb.in", "w") as f:
+        f.write(cpptraj_pdb_script)
 
-# Execute cpptraj to generate the temporary PDB file
-subprocess.run(["cpptraj", "-i", "cpptraj_pdb.in"], check=True)
+    # Execute cpptraj to generate the temporary PDB file
+    subprocess.run(["cpptraj", "-i", "cpptraj_pdb.in"], check=True)
 
-# Read and adjust residue/atom numbers from PDB
-residue_names = {}
-atom_names = {}
-prev_pdb_res_id = None
-amber_residue_index = 0
-amber_atom_index = 0
+    # Read and adjust residue/atom numbers from PDB
+    prev_pdb_res_id = None
+    amber_residue_index = 0
+    amber_atom_index = 0
 
-with open("temp_first_frame.pdb", "r") as pdb:
-    for line in pdb:
-        if line.startswith(("ATOM", "HETATM")):
-            amber_atom_index += 1
-            atom_key = str(amber_atom_index)
+    with open("temp_first_frame.pdb", "r") as pdb:
+        for line in pdb:
+            if line.startswith(("ATOM", "HETATM")):
+                amber_atom_index += 1
+                atom_key = str(amber_atom_index)
 
-            raw_res = line[22:27]  # includes insertion code
-            raw_chain = line[21]
-            residue_name = line[17:20].strip()
+                raw_res = line[22:27]  # includes insertion code
+                raw_chain = line[21]
+                residue_name = line[17:20].strip()
 
-            current_pdb_res_id = (raw_res, raw_chain, residue_name)
+                current_pdb_res_id = (raw_res, raw_chain, residue_name)
 
-            # Adjust on Amber numeration (strictly sequential)
-            if current_pdb_res_id != prev_pdb_res_id:
-                amber_residue_index += 1
-                prev_pdb_res_id = current_pdb_res_id
+                # Adjust on Amber numeration (strictly sequential)
+                if current_pdb_res_id != prev_pdb_res_id:
+                    amber_residue_index += 1
+                    prev_pdb_res_id = current_pdb_res_id
 
-            adjusted_residue_key = str(amber_residue_index)
-            atom_name = line[12:16].strip()
+                adjusted_residue_key = str(amber_residue_index)
+                atom_name = line[12:16].strip()
 
-            if adjusted_residue_key not in residue_names:
-                residue_names[adjusted_residue_key] = residue_name
-            if atom_key not in atom_names:
-                atom_names[atom_key] = (atom_name, residue_name, adjusted_residue_key)
+                if adjusted_residue_key not in residue_names:
+                    residue_names[adjusted_residue_key] = residue_name
+                if atom_key not in atom_names:
+                    atom_names[atom_key] = (atom_name, residue_name, adjusted_residue_key)
 
 total_residues = len(residue_names)
 logger.info(f"Total residues detected: {total_residues}")
 total_atoms = len(atom_names)
 logger.info(f"Total atoms detected: {total_atoms}")
 
-if computing_mode == 1:
+if computing_mode in [1, 4]:
     target_atom = None
     target_residue = str(target)
     items_to_process = [
@@ -131,142 +178,228 @@ elif computing_mode == 3:
         str(i) for i in range(1, total_atoms + 1) if str(i) != target_atom
     ]
 
-# Generate cpptraj script to calculate distances
-cpptraj_script = [
-    f"parm {topology_file}",
-    f"trajin {trajectory_file}",
-]  # Se añadiría aquí
-
-# Ej: cpptraj_script = [f"parm {topology_file}", f"trajin {trajectory_file}", f"autoimage :1-100,101-174", f"image familiar"]
-
-if computing_mode == 1:
-    cpptraj_script.extend(
-        [
-            f"distance :{target_residue} :{res} out temp_{res}.dat"
-            for res in items_to_process
-        ]
-    )
-elif computing_mode == 2:
-    cpptraj_script.extend(
-        [
-            f"distance @{target_atom} :{res} out temp_{res}.dat"
-            for res in items_to_process
-        ]
-    )
-elif computing_mode == 3:
-    cpptraj_script.extend(
-        [
-            f"distance @{target_atom} @{atom} out temp_{atom}.dat"
-            for atom in items_to_process
-        ]
-    )
+# Column headers based on mode
+header_names = []
+for item in items_to_process:
+    if computing_mode in [1, 2, 4]:
+        res_name = residue_names.get(item, "UNK")
+        header_names.append(f"{res_name}_{item}")
+    else:
+        atom_info = atom_names.get(item, ("Atom", "UNK", "UNK"))
+        atom_name = atom_info[0]
+        residue_name = atom_info[1]
+        adjusted_res_key = atom_info[2]
+        header_names.append(f"{atom_name}@{residue_name}_{adjusted_res_key}_atom_{item}")
 
-cpptraj_script.append("run")
+# Native engine: one pass over the trajectory, no cpptraj datasets or temp files
+use_native = TargetDistanceEngine is not None and topology is not None
+if use_native:
+    try:
+        trajectory = open_trajectory(trajectory_file, topology)
+        engine = TargetDistanceEngine(topology, computing_mode, target, mass_weighted=not geometric_centers)
+    except (ValueError, OSError) as e:
+        logger.warning(f"Native distance engine not available ({e}). Falling back to cpptraj.")
+        use_native = False
 
-with open("cpptraj.in", "w") as f:
-    f.write("\n".join(cpptraj_script))
+if output_format == "2" and not use_native:
+    logger.warning("Sparse output needs the native engine: writing CSV files instead.")
 
-# Execute cpptraj to calculate distances
-try:
-    result = subprocess.run(
-        ["cpptraj", "-i", "cpptraj.in"],
-        check=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
-    logger.info("cpptraj finished calculating distances.")
-except subprocess.CalledProcessError as e:
-    logger.error(f"Error executing cpptraj: {e}")
-    logger.error(e.stderr)
+if computing_mode == 4 and not use_native:
+    logger.error("Error: Mode 4 (minimum heavy-atom distance) needs the native engine (amber_native).")
     sys.exit(1)
 
-# Process distance data dynamically
-distances_data = {}
-for item in items_to_process:
-    temp_file = Path(f"temp_{item}.dat")
+if use_native:
+    # Per-frame contact store over all topology columns (read by the other distance_tools)
+    metadata = {
+        "mode": computing_mode,
+        "target": target,
+        "min_distance": min_distance,
+        "max_distance": max_distance,
+        "topology": str(topology_file),
+        "trajectory": str(trajectory_file),
+    }
+    # Frame spacing (ps) when all segments agree, for residence_time.py
+    dt_values = np.unique(trajectory.dt_ps[~np.isnan(trajectory.dt_ps)])
+    metadata["dt_ps"] = float(dt_values[0]) if len(dt_values) == 1 else None
+    contact_writer = ContactStoreWriter(contact_store_dir, topology,
+                                        ITEM_ATOM if computing_mode == 3 else ITEM_RESIDUE, metadata)
+
+if use_native and output_format == "2":
+    # Only the (frame, item, distance) triples inside the range are kept
+    sparse_writer = SparseFrameWriter(header_names, metadata)
+    num_frames = 0
+    # Mode 4 only searches neighbours within the maximum distance
+    for frames, distances in engine.run(trajectory, cutoff=max_distance if computing_mode == 4 else None):
+        distances = np.round(distances, 4)
+        in_range = (distances >= min_distance) & (distances <= max_distance)
+        sparse_writer.append(frames + 1, in_range, distances)
+        contact_writer.append(frames + 1, engine.items, in_range, distances)
+        num_frames += len(frames)
+        logger.info(f"Processed {num_frames}/{trajectory.n_frames} frames.")
+    in_range_matrix = sparse_writer.finish()
+    in_range_matrix.save(sparse_distances_file)
+    write_summary_csv(in_range_matrix, summary_distances_file)
+    logger.info(f"{in_range_matrix.nnz} in-range distances stored in {sparse_distances_file.name} "
+                f"(dense CSV: python3 sparse_to_csv.py).")
+elif use_native:
+    header_array = np.array(header_names, dtype=object)
+    num_frames = 0
+    with open(complete_distances_file, "w", newline="") as complete_f, \
+            open(filtered_distances_file, "w", newline="") as filtered_f, \
+            open(summary_distances_file, "w", newline="") as summary_f:
+        complete_writer = csv.writer(complete_f)
+        filtered_writer = csv.writer(filtered_f)
+        summary_writer = csv.writer(summary_f)
+        complete_writer.writerow(["Frame"] + header_names)
+        filtered_writer.writerow(["Frame"] + header_names)
+        summary_writer.writerow(["Frame", "Items_in_range"])
+
+        for frames, distances in engine.run(trajectory):
+            # Filter on the written (4-decimal) values, as the cpptraj path does
+            distances = np.round(distances, 4)
+            text = np.char.mod("%.4f", distances)
+            in_range = (distances >= min_distance) & (distances <= max_distance)
+            filtered_text = np.where(in_range, text, "")
+            contact_writer.append(frames + 1, engine.items, in_range, distances)
+            for frame, row, filtered_row, row_in_range in zip(frames + 1, text, filtered_text, in_range):
+                complete_writer.writerow([frame, *row])
+                filtered_writer.writerow([frame, *filtered_row])
+                summary_writer.writerow([frame, ",".join(header_array[row_in_range])])
+            num_frames += len(frames)
+            logger.info(f"Processed {num_frames}/{trajectory.n_frames} frames.")
+
+if use_native:
+    trajectory.close()
+    contact_store = contact_writer.close()
+    logger.info(f"Contact store: {contact_store_dir.name} ({contact_store.nnz} contacts).")
+else:
+    # Generate cpptraj script to calculate distances
+    cpptraj_script = [
+        f"parm {topology_file}",
+        f"trajin {trajectory_file}",
+    ]  # Se añadiría aquí
+    geom_keyword = " geom" if geometric_centers else ""
+
+    # Ej: cpptraj_script = [f"parm {topology_file}", f"trajin {trajectory_file}", f"autoimage :1-100,101-174", f"image familiar"]
+
+    if computing_mode == 1:
+        cpptraj_script.extend(
+            [
+                f"distance :{target_residue} :{res} out temp_{res}.dat{geom_keyword}"
+                for res in items_to_process
+            ]
+        )
+    elif computing_mode == 2:
+        cpptraj_script.extend(
+            [
+                f"distance @{target_atom} :{res} out temp_{res}.dat{geom_keyword}"
+                for res in items_to_process
+            ]
+        )
+    elif computing_mode == 3:
+        cpptraj_script.extend(
+            [
+                f"distance @{target_atom} @{atom} out temp_{atom}.dat"
+                for atom in items_to_process
+            ]
+        )
+
+    cpptraj_script.append("run")
+
+    with open("cpptraj.in", "w") as f:
+        f.write("\n".join(cpptraj_script))
+
+    # Execute cpptraj to calculate distances
     try:
-        with open(temp_file) as f:
-            distances = [line.split()[1] for line in f.readlines()[1:]]
-        distances_data[item] = distances
-    except Exception as e:
-        logger.error(f"Error: {e}")
+        result = subprocess.run(
+            ["cpptraj", "-i", "cpptraj.in"],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        logger.info("cpptraj finished calculating distances.")
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Error executing cpptraj: {e}")
+        logger.error(e.stderr)
         sys.exit(1)
 
-if not distances_data:
-    logger.error("Error: No distance data was collected. Check your cpptraj setup.")
-    sys.exit(1)
+    # Process distance data dynamically
+    distances_data = {}
+    for item in items_to_process:
+        temp_file = Path(f"temp_{item}.dat")
+        try:
+            with open(temp_file) as f:
+                distances = [line.split()[1] for line in f.readlines()[1:]]
+            distances_data[item] = distances
+        except Exception as e:
+            logger.error(f"Error: {e}")
+            sys.exit(1)
+
+    if not distances_data:
+        logger.error("Error: No distance data was collected. Check your cpptraj setup.")
+        sys.exit(1)
 
-# Prepare data for complete distances file
-num_frames = len(next(iter(distances_data.values())))
-transposed_data = [[""] * (len(items_to_process) + 1) for _ in range(num_frames + 1)]
+    # Prepare data for complete distances file
+    num_frames = len(next(iter(distances_data.values())))
+    transposed_data = [[""] * (len(items_to_process) + 1) for _ in range(num_frames + 1)]
 
-transposed_data[0][0] = "Frame"
+    transposed_data[0][0] = "Frame"
 
-# Set correct headers based on mode
-for i, item in enumerate(items_to_process):
-    if computing_mode in [1, 2]:
-        res_name = residue_names.get(item, "UNK")
-        header_name = f"{res_name}_{item}"
-    else:
-        atom_info = atom_names.get(item, ("Atom", "UNK", "UNK"))
-        atom_name = atom_info[0]
-        residue_name = atom_info[1]
-        adjusted_res_key = atom_info[2]
-        header_name = f"{atom_name}@{residue_name}_{adjusted_res_key}_atom_{item}"
-
-    transposed_data[0][i + 1] = header_name
-
-for i in range(num_frames):
-    transposed_data[i + 1][0] = i + 1
-    for j, item in enumerate(items_to_process):
-        # Prevent index errors if a file had fewer frames
-        if i < len(distances_data[item]):
-            transposed_data[i + 1][j + 1] = distances_data[item][i]
-        else:
-            transposed_data[i + 1][j + 1] = ""
-
-# Write complete distances to CSV file
-with open(complete_distances_file, "w", newline="") as f:
-    writer = csv.writer(f)
-    writer.writerows(transposed_data)
-
-# Prepare data for filtered and summary outputs
-filtered_data = [transposed_data[0]]
-summary_data = [["Frame", "Items_in_range"]]
-
-for row in transposed_data[1:]:
-    frame = row[0]
-    filtered_row = [frame]
-    items_in_range = []
-
-    for i, distance in enumerate(row[1:]):
-        try:
-            distance_float = float(distance) if distance.strip() else None
-            if (
-                distance_float is not None
-                and min_distance <= distance_float <= max_distance
-            ):
-                filtered_row.append(distance)
-                item_full_name = transposed_data[0][i + 1]
-                items_in_range.append(item_full_name)
+    # Set correct headers based on mode
+    for i, header_name in enumerate(header_names):
+        transposed_data[0][i + 1] = header_name
+
+    for i in range(num_frames):
+        transposed_data[i + 1][0] = i + 1
+        for j, item in enumerate(items_to_process):
+            # Prevent index errors if a file had fewer frames
+            if i < len(distances_data[item]):
+                transposed_data[i + 1][j + 1] = distances_data[item][i]
             else:
+                transposed_data[i + 1][j + 1] = ""
+
+    # Write complete distances to CSV file
+    with open(complete_distances_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerows(transposed_data)
+
+    # Prepare data for filtered and summary outputs
+    filtered_data = [transposed_data[0]]
+    summary_data = [["Frame", "Items_in_range"]]
+
+    for row in transposed_data[1:]:
+        frame = row[0]
+        filtered_row = [frame]
+        items_in_range = []
+
+        for i, distance in enumerate(row[1:]):
+            try:
+                distance_float = float(distance) if distance.strip() else None
+                if (
+                    distance_float is not None
+                    and min_distance <= distance_float <= max_distance
+                ):
+                    filtered_row.append(distance)
+                    item_full_name = transposed_data[0][i + 1]
+                    items_in_range.append(item_full_name)
+                else:
+                    filtered_row.append("")
+            except ValueError:
                 filtered_row.append("")
-        except ValueError:
-            filtered_row.append("")
 
-    filtered_data.append(filtered_row)
-    summary_data.append([frame, ",".join(items_in_range)])
+        filtered_data.append(filtered_row)
+        summary_data.append([frame, ",".join(items_in_range)])
 
-# Write filtered data to CSV
-with open(filtered_distances_file, "w", newline="") as f:
-    writer = csv.writer(f)
-    writer.writerows(filtered_data)
+    # Write filtered data to CSV
+    with open(filtered_distances_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerows(filtered_data)
 
-# Write summary data to CSV
-with open(summary_distances_file, "w", newline="") as f:
-    writer = csv.writer(f)
-    writer.writerows(summary_data)
+    # Write summary data to CSV
+    with open(summary_distances_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerows(summary_data)
 
 logger.info(f"\nAnalysis completed! Results in: {output_folder_name}")
 
@@ -5,15 +5,37 @@ Intersector Counter
 Utility to read multiple CSV files containing frame-by-frame
 residue/atom information, validate their structure and consistency, and compute the
 intersection of residues present across all files for each frame.
+
+With amber_native available, residue labels are mapped to integer IDs once and
+every file becomes a sparse frame x residue matrix; intersection, union,
+difference and "present in at least m of K files" are then vectorised bitset
+operations, and the input files are read in parallel. Contact stores written by
+distance_analyzer.py (the *_contacts folders) can be given instead of CSVs:
+their integer residue columns are combined directly, without string parsing.
 """
 
+import csv
+import os
 import sys
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
+import numpy as np
 import pandas as pd
 
+# Vectorised set engine (optional)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+try:
+    from amber_native.bitsets import OPERATIONS, combine
+    from amber_native.sparse import FrameSparseMatrix
+    from amber_native.contacts import ContactStore, is_contact_store
+except ImportError:
+    OPERATIONS = ("intersection",)
+    combine = None
+    is_contact_store = None
+
 # Attempt to import readline for input tab completion
 try:
     import readline
@@ -53,6 +75,9 @@ def prompt_for_csv_files() -> List[Path]:
         if not file_path.exists():
             print(f"Error: File '{user_input}' does not exist. Please try again.")
             continue
+        if is_contact_store is not None and is_contact_store(file_path):
+            csv_files.append(file_path)
+            continue
         if not file_path.is_file():
             print(f"Error: '{user_input}' is not a file. Please try again.")
             continue
@@ -150,6 +175,146 @@ def extract_appearances(csv_file: Path) -> Dict[int, List[str]]:
     return dict(data)
 
 
+def read_appearances(csv_file: Path) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Reads the first Residues_* column of a CSV without iterating over rows.
+    
+    Args:
+        csv_file: Path to the CSV file.
+        
+    Returns:
+        Tuple: frames, row position of every residue occurrence, residue labels.
+    """
+    header = pd.read_csv(csv_file, nrows=0).columns
+    residues_col = [col for col in header if col.startswith("Residues_")]
+    if not residues_col:
+        raise ValueError(f"No column starting with 'Residues_' found in '{csv_file.name}'.")
+    
+    df = pd.read_csv(csv_file, usecols=["Frame", residues_col[0]], dtype={residues_col[0]: str})
+    frames = df["Frame"].to_numpy(dtype=np.int64)
+    if len(np.unique(frames)) != len(frames):
+        raise ValueError(f"Repeated frame numbers in '{csv_file.name}'.")
+    
+    # One entry per residue occurrence, indexed by row position
+    cells = df[residues_col[0]].fillna("").reset_index(drop=True)
+    exploded = cells.str.split(",").explode().str.strip()
+    exploded = exploded[exploded != ""]
+    return frames, exploded.index.to_numpy(dtype=np.int64), exploded.to_numpy(dtype=str)
+
+
+def read_all_appearances(csv_files: List[Path]) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Reads every CSV file in a separate process."""
+    workers = min(len(csv_files), os.cpu_count() or 1)
+    if workers <= 1:
+        return [read_appearances(f) for f in csv_files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(read_appearances, csv_files))
+
+
+def encode_appearances(all_data: List[Tuple[np.ndarray, np.ndarray, np.ndarray]]) -> List["FrameSparseMatrix"]:
+    """
+    Maps residue labels to integer IDs (shared by all files) and builds one
+    sparse frame x residue matrix per file, with rows sorted by frame.
+    
+    Args:
+        all_data: Output of read_appearances() for every file.
+        
+    Returns:
+        List[FrameSparseMatrix]: Aligned boolean matrices.
+    """
+    vocabulary = pd.unique(np.concatenate([labels for _, _, labels in all_data]))
+    # Residue-number order (NAME_12 before NAME_101), as in the distance_analyzer summaries
+    numbers = pd.Series(vocabulary, dtype=object).str.extract(r"_(\d+)$")[0].astype(float).to_numpy()
+    vocabulary = vocabulary[np.lexsort((vocabulary.astype(str), np.nan_to_num(numbers, nan=np.inf)))]
+    label_index = pd.Index(vocabulary)
+    
+    reference_frames = np.sort(all_data[0][0])
+    matrices = []
+    for idx, (frames, rows, labels) in enumerate(all_data, start=1):
+        order = np.argsort(frames)
+        if not np.array_equal(frames[order], reference_frames):
+            print(f"Error: Frame mismatch between file 1 and file {idx}.")
+            print("Please ensure all input CSV files contain the exact same set of frames.")
+            sys.exit(1)
+        position = np.empty_like(order)
+        position[order] = np.arange(len(order))
+        
+        row_pos = position[rows]
+        ids = label_index.get_indexer(labels)
+        n_labels = max(len(vocabulary), 1)
+        keys = np.unique(row_pos * n_labels + ids)
+        row_pos, ids = np.divmod(keys, n_labels)
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(row_pos, minlength=len(frames)))])
+        matrices.append(FrameSparseMatrix(indptr, ids, None, vocabulary, reference_frames))
+    return matrices
+
+
+def load_contact_stores(store_paths: List[Path]) -> List["FrameSparseMatrix"]:
+    """
+    Loads contact stores as boolean frame x item matrices.
+    
+    Args:
+        store_paths: Contact store folders (or their contacts.json).
+        
+    Returns:
+        List[FrameSparseMatrix]: Matrices over the same topology columns.
+    """
+    stores = [ContactStore(path) for path in store_paths]
+    reference = stores[0]
+    for idx, store in enumerate(stores[1:], start=2):
+        if store.item_kind != reference.item_kind or not np.array_equal(store.labels, reference.labels):
+            raise ValueError(f"Contact store {idx} ('{store.path.name}') was built on different "
+                             f"{store.item_kind} columns than store 1 ('{reference.path.name}').")
+    return [store.to_matrix(values=False) for store in stores]
+
+
+def prompt_for_operation(n_files: int) -> Tuple[str, Optional[int]]:
+    """Asks which set operation to compute (intersection by default)."""
+    if combine is None:
+        return "intersection", None
+    print("\nOperation:")
+    print("1. Intersection (present in all files)")
+    print("2. Union (present in any file)")
+    print("3. Difference (present in file 1 but in none of the others)")
+    print("4. Present in at least m of the files")
+    choice = input("> [1] ").strip() or "1"
+    operation = {"1": "intersection", "2": "union", "3": "difference", "4": "at_least"}.get(choice, "intersection")
+    min_count = None
+    if operation == "at_least":
+        while True:
+            try:
+                min_count = int(input(f"m (1-{n_files}): ").strip())
+                if 1 <= min_count <= n_files:
+                    break
+            except ValueError:
+                pass
+            print("Invalid value. Please try again.")
+    return operation, min_count
+
+
+def save_matrix_results(result: "FrameSparseMatrix", base_residues: List[str], output_path: str) -> None:
+    """
+    Writes a combined matrix in the intersector_counter_results.csv layout.
+    
+    Args:
+        result: Boolean frame x residue matrix.
+        base_residues: Residues_* suffixes of the inputs.
+        output_path: Path where the output CSV will be saved.
+    """
+    counts = np.diff(result.indptr)
+    try:
+        with open(output_path, "w", newline="") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(["Frame", f"Residues_{base_residues[0]}", "Counter"])
+            for k, frame in enumerate(result.frames):
+                columns, _ = result.row(k)
+                writer.writerow([frame, str(result.labels[columns].tolist()), counts[k]])
+        print(f"\nResults successfully written to '{output_path}'")
+    except OSError as e:
+        print(f"Error writing to '{output_path}': {e}")
+        sys.exit(1)
+
+
 def compute_intersection(all_data: List[Dict[int, List[str]]]) -> Dict[int, Tuple[List[str], int]]:
     """
     Computes the intersection of residues present across all files for each frame.
@@ -224,8 +389,37 @@ def main() -> None:
     # 1. Prompt for files
     csv_files = prompt_for_csv_files()
     
+    # Contact stores: aligned integer columns, no CSV parsing at all
+    if is_contact_store is not None and any(is_contact_store(f) for f in csv_files):
+        if not all(is_contact_store(f) for f in csv_files):
+            print("Error: Contact stores and CSV files cannot be mixed.")
+            sys.exit(1)
+        operation, min_count = prompt_for_operation(len(csv_files))
+        try:
+            result = combine(load_contact_stores(csv_files), operation, min_count)
+        except (ValueError, OSError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        suffix = "" if operation == "intersection" else f"_{operation}"
+        save_matrix_results(result, ["in_range"], f"intersector_counter{suffix}_results.csv")
+        return
+    
     # 2. Validate residue columns match
     base_residues = validate_residue_headers(csv_files)
+    operation, min_count = prompt_for_operation(len(csv_files))
+    
+    if combine is not None:
+        # 3-5. Vectorised path: parallel reading, integer IDs, bitset operations
+        try:
+            all_data = read_all_appearances(csv_files)
+        except (ValueError, OSError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        matrices = encode_appearances(all_data)
+        result = combine(matrices, operation, min_count)
+        suffix = "" if operation == "intersection" else f"_{operation}"
+        save_matrix_results(result, base_residues, f"intersector_counter{suffix}_results.csv")
+        return
     
     # 3. Extract appearances
     all_data = [extract_appearances(f) for f in csv_files]
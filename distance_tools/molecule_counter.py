@@ -3,8 +3,17 @@
 import csv
 import re
 import readline  # For interactive autocompletion
+import sys
+from contextlib import nullcontext
 from pathlib import Path
 
+# Contact stores written by distance_analyzer.py (optional)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+try:
+    from amber_native.contacts import ContactStore, is_contact_store
+except ImportError:
+    ContactStore = None
+
 def get_validated_input(prompt, input_type=None):
     """Function for validating inputs with retries."""
     while True:
@@ -23,7 +32,11 @@ def get_validated_input(prompt, input_type=None):
 readline.parse_and_bind("tab: complete")
 
 # Interactive configuration
-input_csv_file = get_validated_input("CSV file to search in (e.g., distances_summary.csv): ")
+input_csv_file = get_validated_input("CSV file or contact store to search in (e.g., distances_summary.csv, run_contacts): ")
+use_store = ContactStore is not None and is_contact_store(input_csv_file)
+if use_store:
+    contact_store = ContactStore(input_csv_file)
+    input_csv_file = str(contact_store.path)
 
 # List to store molecule codes
 molecule_codes = []
@@ -37,8 +50,12 @@ while True:
     if add_another != 'yes':
         break
 
+# Optional compact matrix with only the per-frame counts
+write_count_matrix = input("Also write a compact per-frame count matrix? (yes/no): ").strip().lower() == 'yes'
+
 # Generate output CSV file name with all molecule codes
 output_csv_file = Path(input_csv_file).stem + f"_{'_'.join(molecule_codes)}_counts.csv"
+matrix_csv_file = Path(input_csv_file).stem + f"_{'_'.join(molecule_codes)}_count_matrix.csv"
 
 # Validate input CSV file existence
 try:
@@ -47,37 +64,77 @@ except FileNotFoundError:
     print(f"Error: The file {input_csv_file} does not exist.")
     exit(1)
 
-# Read the input CSV file
-with open(input_csv_file, 'r') as file:
-    reader = csv.reader(file)
-    data = list(reader)
+# One regex for all codes: every residue token is classified once.
+# Longest codes first, so 'NA' never shadows 'NAP' in the alternation.
+unique_codes = list(dict.fromkeys(molecule_codes))
+code_pattern = re.compile(
+    "(" + "|".join(re.escape(code) for code in sorted(unique_codes, key=len, reverse=True)) + ")_"
+)
+
+# Summary rows can be longer than the default csv field limit
+csv.field_size_limit(sys.maxsize)
 
-# Prepare the output data
+# Prepare the output header
 header_row = ["Frame"]
 for code in molecule_codes:
     header_row.extend([code, f"Residues_{code}", f"Number_{code}"])
 
-output_data = [header_row]
+if use_store:
+    # Counts come from the integer residue columns of the store: no string parsing
+    with open(output_csv_file, 'w', newline='') as output, \
+            (open(matrix_csv_file, 'w', newline='') if write_count_matrix else nullcontext()) as matrix_output:
+        writer = csv.writer(output)
+        matrix_writer = csv.writer(matrix_output) if write_count_matrix else None
+        writer.writerow(header_row)
+        if matrix_writer:
+            matrix_writer.writerow(["Frame", *molecule_codes])
 
-# Process each row (frame)
-for row in data[1:]:
-    frame = row[0]
-    residues = row[1].split(',')  # Split residues by comma
-    
-    output_row = [frame]
-    for code in molecule_codes:
-        # Count occurrences of the molecule code
-        molecule_matches = [res for res in residues if res.startswith(code + '_')]
-        molecule_count = len(molecule_matches)
-        
-        # Prepare output row
-        output_row.extend([code, ','.join(molecule_matches), molecule_count])
-    
-    output_data.append(output_row)
+        code_index = {code: k for k, code in enumerate(unique_codes)}
+        for chunk, codes, counts in contact_store.count_by_name(unique_codes):
+            for k, frame in enumerate(chunk.frames):
+                start, stop = chunk.indptr[k], chunk.indptr[k + 1]
+                members = chunk.labels[chunk.indices[start:stop]]
+                member_codes = codes[start:stop]
+                output_row = [frame]
+                for code in molecule_codes:
+                    index = code_index[code]
+                    output_row.extend([code, ','.join(members[member_codes == index]), counts[k, index]])
+                writer.writerow(output_row)
+                if matrix_writer:
+                    matrix_writer.writerow([frame, *(counts[k, code_index[code]] for code in molecule_codes)])
+
+    print(f"Completed! Results in: {output_csv_file}")
+    if write_count_matrix:
+        print(f"Count matrix in: {matrix_csv_file}")
+    sys.exit(0)
+
+# Stream the summary: one row in, one row out (memory does not grow with the number of frames)
+with open(input_csv_file, 'r', newline='') as file, open(output_csv_file, 'w', newline='') as output, \
+        (open(matrix_csv_file, 'w', newline='') if write_count_matrix else nullcontext()) as matrix_output:
+    reader = csv.reader(file)
+    writer = csv.writer(output)
+    matrix_writer = csv.writer(matrix_output) if write_count_matrix else None
+
+    next(reader, None)  # Skip header
+    writer.writerow(header_row)
+    if matrix_writer:
+        matrix_writer.writerow(["Frame", *molecule_codes])
+
+    for row in reader:
+        frame = row[0]
+        matches = {code: [] for code in unique_codes}
+        for residue in (row[1].split(',') if len(row) > 1 else []):
+            match = code_pattern.match(residue)
+            if match:
+                matches[match.group(1)].append(residue)
 
-# Write the output CSV file
-with open(output_csv_file, 'w', newline='') as file:
-    writer = csv.writer(file)
-    writer.writerows(output_data)
+        output_row = [frame]
+        for code in molecule_codes:
+            output_row.extend([code, ','.join(matches[code]), len(matches[code])])
+        writer.writerow(output_row)
+        if matrix_writer:
+            matrix_writer.writerow([frame, *(len(matches[code]) for code in molecule_codes)])
 
 print(f"Completed! Results in: {output_csv_file}")
+if write_count_matrix:
+    print(f"Count matrix in: {matrix_csv_file}")
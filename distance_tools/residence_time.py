@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+import csv
+import re
+import readline  # For interactive autocompletion
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from amber_native.contacts import ContactStore, is_contact_store
+from amber_native.residence import MAX_LAG, label_groups, residence_intervals
+from amber_native.sparse import FrameSparseMatrix
+
+# Summary rows read per chunk
+CHUNK_ROWS = 4096
+
+# Enable autocompletion
+readline.parse_and_bind("tab: complete")
+
+
+def summary_chunks(summary_file, code_pattern, group_index, item_ids, item_labels, item_groups):
+    """
+    Streams a distance_analyzer summary CSV as FrameSparseMatrix chunks.
+
+    Residue labels are classified by molecule code (as in molecule_counter.py)
+    and mapped to integer IDs the first time they appear.
+    """
+    csv.field_size_limit(sys.maxsize)
+    with open(summary_file, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Skip header
+        while True:
+            rows = [row for _, row in zip(range(CHUNK_ROWS), reader)]
+            if not rows:
+                return
+            counts, indices = [], []
+            for row in rows:
+                ids = set()
+                for residue in (row[1].split(",") if len(row) > 1 else []):
+                    match = code_pattern.match(residue)
+                    if not match:
+                        continue
+                    item = item_ids.get(residue)
+                    if item is None:
+                        item = item_ids[residue] = len(item_labels)
+                        item_labels.append(residue)
+                        item_groups.append(group_index[match.group(1)])
+                    ids.add(item)
+                counts.append(len(ids))
+                indices.extend(sorted(ids))
+            indptr = np.concatenate([[0], np.cumsum(counts)])
+            yield FrameSparseMatrix(indptr, np.asarray(indices, dtype=np.int64), None, [],
+                                    np.array([int(row[0]) for row in rows]))
+
+
+input_path = Path(input("Contact store or summary CSV (e.g., run/run_contacts, run_summary.csv): ").strip())
+codes = [c.strip() for c in input("Molecule codes (comma-separated, e.g., WAT,K+): ").split(",") if c.strip()]
+if not codes:
+    print("Error: at least one molecule code is needed.")
+    sys.exit(1)
+
+store = ContactStore(input_path) if is_contact_store(input_path) else None
+default_dt = store.metadata.get("dt_ps") if store is not None else None
+dt_text = input(f"Time between frames (ps) [{default_dt if default_dt else 1.0}]: ").strip()
+dt_ps = float(dt_text) if dt_text else float(default_dt or 1.0)
+gap = int(input("Tolerated absence (frames) before a molecule counts as gone [0]: ").strip() or 0)
+max_lag = int(input(f"Longest survival lag (frames) [{MAX_LAG}]: ").strip() or MAX_LAG)
+
+if store is not None:
+    base_path = store.path.parent / store.path.name.replace("_contacts", "")
+else:
+    base_path = input_path.with_name(input_path.stem.replace("_summary", ""))
+suffix = "_".join(codes)
+intervals_file = Path(f"{base_path}_{suffix}_residence_intervals.csv")
+survival_file = Path(f"{base_path}_{suffix}_survival.csv")
+summary_file = Path(f"{base_path}_{suffix}_residence_summary.csv")
+
+if store is not None:
+    item_groups, _ = label_groups(store.names, codes)
+    item_labels = store.labels
+    chunks = store.iter_chunks()
+else:
+    # Same classification as molecule_counter.py: one regex, longest code first
+    code_pattern = re.compile(
+        "(" + "|".join(re.escape(code) for code in sorted(codes, key=len, reverse=True)) + ")_"
+    )
+    group_index = {code: k for k, code in enumerate(codes)}
+    item_groups, item_labels = [], []
+    chunks = summary_chunks(input_path, code_pattern, group_index, {}, item_labels, item_groups)
+
+with open(intervals_file, "w", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow(["Residue", "Code", "Start_frame", "End_frame", "Frames", "Start_ps", "Residence_ps", "Censored"])
+
+    def write_intervals(items, starts, ends, censored):
+        groups = np.asarray(item_groups)[items]
+        labels = np.asarray(item_labels)[items]
+        for label, group, start, end, cut in zip(labels, groups, starts, ends, censored | (starts == 0)):
+            writer.writerow([label, codes[group], start + 1, end + 1, end - start + 1,
+                             f"{start * dt_ps:.3f}", f"{(end - start + 1) * dt_ps:.3f}", int(cut)])
+
+    accumulator, n_frames = residence_intervals(chunks, item_groups, len(codes), gap, max_lag,
+                                                sink=write_intervals)
+
+survival = accumulator.survival()
+with open(survival_file, "w", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow(["Lag_frames", "Lag_ps", *[f"C_{code}" for code in codes]])
+    for lag in range(survival.shape[1]):
+        writer.writerow([lag, f"{lag * dt_ps:.3f}", *[f"{value:.6f}" for value in survival[:, lag]]])
+
+summary = accumulator.summary(n_frames, dt_ps)
+with open(summary_file, "w", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow(["Code", "Intervals", "Mean_residence_ps", "Tau_survival_ps", "Mean_in_range",
+                     "Exits_per_ns", "Entries_per_ns"])
+    for k, code in enumerate(codes):
+        writer.writerow([code, summary["intervals"][k], f"{summary['mean_residence_ps'][k]:.3f}",
+                         f"{summary['tau_ps'][k]:.3f}", f"{summary['mean_in_range'][k]:.3f}",
+                         f"{summary['exits_per_ns'][k]:.3f}", f"{summary['entries_per_ns'][k]:.3f}"])
+        print(f"{code}: {summary['intervals'][k]} intervals, mean residence {summary['mean_residence_ps'][k]:.2f} ps, "
+              f"tau {summary['tau_ps'][k]:.2f} ps, {summary['exits_per_ns'][k]:.2f} exits/ns")
+
+print(f"Intervals: {intervals_file}\nSurvival: {survival_file}\nSummary: {summary_file}")
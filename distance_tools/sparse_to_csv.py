@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R
+
+import readline  # For interactive autocompletion
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from amber_native.sparse import FrameSparseMatrix, write_dense_csv, write_summary_csv
+
+# Enable autocompletion
+readline.parse_and_bind("tab: complete")
+
+input_file = Path(input("Sparse distance file (e.g., run_inrange.npz): ").strip())
+matrix = FrameSparseMatrix.load(input_file)
+
+base_name = input_file.name[:-len("_inrange.npz")] if input_file.name.endswith("_inrange.npz") else input_file.stem
+filtered_file = input_file.with_name(f"{base_name}_filtered.csv")
+summary_file = input_file.with_name(f"{base_name}_summary.csv")
+
+print(f"{matrix.n_frames} frames, {matrix.n_items} items, {matrix.nnz} in-range distances.")
+if matrix.metadata:
+    print(f"Range: {matrix.metadata.get('min_distance')} - {matrix.metadata.get('max_distance')} Å")
+
+# Same layout as the _filtered.csv of the CSV output (out-of-range cells are empty)
+write_dense_csv(matrix, filtered_file)
+print(f"Dense CSV written to: {filtered_file}")
+
+if not summary_file.exists():
+    write_summary_csv(matrix, summary_file)
+    print(f"Summary written to: {summary_file}")
@@ -6,33 +6,73 @@
 
 import os
 import subprocess
+import sys
 import tempfile
 import readline
 
+# Native H-bond engine (optional): no cpptraj needed
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+try:
+    import numpy as np
+    from amber_native.hbonds import atom_label, find_hbonds
+    from amber_native.prmtop import read_prmtop
+except ImportError:
+    find_hbonds = None
+
+
+def write_native_avgout(parm_file, traj_file, residues_range, include_intramol, output_file="avg_hbond.dat"):
+    """Writes cpptraj-style avgout averages (sorted by frames present) from the native engine."""
+    topology = read_prmtop(parm_file)
+    table = find_hbonds(parm_file, traj_file, mask=f":{residues_range.replace(' ', '')}",
+                        intramolecular=include_intramol, processes=os.cpu_count() or 1)
+    bonds, bond_of_row = table.bond_ids()
+    frames = np.bincount(bond_of_row, minlength=len(bonds))
+    avg_distance = np.bincount(bond_of_row, weights=table.distances, minlength=len(bonds)) / np.maximum(frames, 1)
+    avg_angle = np.bincount(bond_of_row, weights=table.angles, minlength=len(bonds)) / np.maximum(frames, 1)
+
+    with open(output_file, "w") as f:
+        f.write(f"{'#Acceptor':<14} {'DonorH':>14} {'Donor':>14} {'Frames':>8} {'Frac':>12} "
+                f"{'AvgDist':>12} {'AvgAng':>12}\n")
+        for bond in np.lexsort((np.arange(len(bonds)), -frames)):
+            donor, hydrogen, acceptor = bonds[bond]
+            f.write(f"{atom_label(topology, acceptor):<14} {atom_label(topology, hydrogen):>14} "
+                    f"{atom_label(topology, donor):>14} {frames[bond]:>8d} "
+                    f"{frames[bond] / max(table.n_frames, 1):>12.4f} {avg_distance[bond]:>12.4f} "
+                    f"{avg_angle[bond]:>12.4f}\n")
+
+
 # Request the user for the parameter files and other options
 parm_file = input("Enter the parameter file name (*.prmtop): ")  # Your parameter file
-traj_file = input("Enter the trajectory file name (*.dcd or *.mdcrd): ")  # Your trajectory file
+traj_file = input("Enter the trajectory file name (*.dcd, *.mdcrd, *.nc or manifest *.json): ")  # Your trajectory file
 residues_range = input("Enter the residue range for hydrogen bond contacts (e.g., 1-25), numbers separated by commas are also accepted (e.g., 1, 50, 75): ")  # Residue range for hydrogen bonds
 include_intramol = input("Do you want to include intramolecular hydrogen bonds? (y/n): ").lower() == 'y'  # Ask if user wants intramol included
 
-# Create a temporary file for cpptraj commands
-with tempfile.NamedTemporaryFile('w', delete=False) as tmpfile:
-    tmpfile_name = tmpfile.name
-    
-    # Write the cpptraj commands to the temporary file
-    intramol_option = "" if include_intramol else " nointramol"
-    tmpfile.write(f"""parm {parm_file}
+native_done = False
+if find_hbonds is not None:
+    try:
+        write_native_avgout(parm_file, traj_file, residues_range, include_intramol)
+        native_done = True
+    except (ValueError, OSError) as e:
+        print(f"[Warn] Native H-bond engine not possible ({e}). Falling back to cpptraj.")
+
+if not native_done:
+    # Create a temporary file for cpptraj commands
+    with tempfile.NamedTemporaryFile('w', delete=False) as tmpfile:
+        tmpfile_name = tmpfile.name
+
+        # Write the cpptraj commands to the temporary file
+        intramol_option = "" if include_intramol else " nointramol"
+        tmpfile.write(f"""parm {parm_file}
 trajin {traj_file}
 hbond contacts :{residues_range} avgout avg_hbond.dat{intramol_option}
 run
 quit
 """)
 
-# Execute cpptraj with the temporary command file
-subprocess.run(["cpptraj", "-i", tmpfile_name])
+    # Execute cpptraj with the temporary command file
+    subprocess.run(["cpptraj", "-i", tmpfile_name])
 
-# Remove the temporary file after execution
-os.remove(tmpfile_name)
+    # Remove the temporary file after execution
+    os.remove(tmpfile_name)
 
 print("Hydrogen bond analysis completed. Results saved in 'avg_hbond.dat'.")
-
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+import csv
+import os
+import sys
+import readline
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from amber_native.bitseries import BitSeries
+from amber_native.hbonds import atom_label, find_hbonds
+from amber_native.mask import select_mask
+from amber_native.prmtop import read_prmtop
+from amber_native.segments import open_trajectory
+
+readline.parse_and_bind("tab: complete")
+
+# Request parameters from the user
+parm_file = input("Enter the parameter file name (*.prmtop): ")
+traj_file = input("Enter the trajectory file name (*.dcd, *.mdcrd, *.nc or manifest *.json): ")
+ligand_mask = input("Ligand mask (e.g., :1): ").strip()
+receptor_mask = input("Receptor mask (e.g., :2-25): ").strip()
+max_lag = int(input("Longest autocorrelation lag (frames) [100]: ").strip() or 100)
+top_n = int(input("H-bonds in the co-occurrence matrix [20]: ").strip() or 20)
+output_dir = "hbond_lifetimes"  # Directory to save results
+os.makedirs(output_dir, exist_ok=True)
+
+topology = read_prmtop(parm_file)
+with open_trajectory(traj_file, topology) as trajectory:
+    known_dt = np.unique(trajectory.dt_ps[~np.isnan(trajectory.dt_ps)])
+default_dt = float(known_dt[0]) if len(known_dt) == 1 else 1.0
+dt_ps = float(input(f"Time between frames (ps) [{default_dt}]: ").strip() or default_dt)
+
+# One pass over the trajectory: every ligand/receptor H-bond with its geometry
+table = find_hbonds(parm_file, traj_file, mask=f"({ligand_mask})|({receptor_mask})",
+                    processes=os.cpu_count() or 1)
+table.save(os.path.join(output_dir, "hbond_table.npz"))
+table = table.between(select_mask(topology, ligand_mask), select_mask(topology, receptor_mask))
+ligand_atoms = set(select_mask(topology, ligand_mask).tolist())
+
+# One packed bitset per distinct H-bond (donor-H, acceptor)
+bonds, bond_of_row = table.bond_ids()
+series = BitSeries.from_events(bond_of_row, table.frames, len(bonds), table.n_frames)
+occupancy = series.occupancy()
+counts = series.counts()
+lifetimes = series.lifetimes()
+avg_distance = np.bincount(bond_of_row, weights=table.distances, minlength=len(bonds)) / np.maximum(counts, 1)
+avg_angle = np.bincount(bond_of_row, weights=table.angles, minlength=len(bonds)) / np.maximum(counts, 1)
+labels = [f"{atom_label(topology, a)}...{atom_label(topology, h)}-{atom_label(topology, d)}" for d, h, a in bonds]
+
+# Most persistent first: occupancy, then longest continuous lifetime
+ranking = np.lexsort((-lifetimes["max"], -occupancy))
+with open(os.path.join(output_dir, "ligand_receptor_hbonds.csv"), "w", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow(["Rank", "Acceptor", "DonorH", "Donor", "Ligand_Role", "Frames", "Occupancy",
+                     "Lifetimes", "Mean_Lifetime_ps", "Max_Lifetime_ps", "AvgDist", "AvgAng"])
+    for rank, bond in enumerate(ranking, start=1):
+        donor, hydrogen, acceptor = bonds[bond]
+        writer.writerow([rank, atom_label(topology, acceptor), atom_label(topology, hydrogen),
+                         atom_label(topology, donor), "donor" if donor in ligand_atoms else "acceptor",
+                         counts[bond], f"{occupancy[bond]:.4f}", lifetimes["runs"][bond],
+                         f"{lifetimes['mean'][bond] * dt_ps:.3f}", f"{lifetimes['max'][bond] * dt_ps:.3f}",
+                         f"{avg_distance[bond]:.4f}", f"{avg_angle[bond]:.4f}"])
+
+# Intermittent lifetime autocorrelation over all ligand-receptor H-bonds
+correlation = series.autocorrelation(max_lag)
+with open(os.path.join(output_dir, "hbond_autocorrelation.csv"), "w", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow(["Lag_frames", "Lag_ps", "C_intermittent"])
+    for lag, value in enumerate(correlation):
+        writer.writerow([lag, f"{lag * dt_ps:.3f}", f"{value:.6f}"])
+
+# Co-occurrence of the most persistent H-bonds: frames in which both are present
+top = ranking[:top_n]
+co_occurrence = series.co_occurrence(top)
+with open(os.path.join(output_dir, "hbond_cooccurrence.csv"), "w", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow(["HBond", *[labels[bond] for bond in top]])
+    for bond, row in zip(top, co_occurrence):
+        writer.writerow([labels[bond], *row])
+
+print(f"{len(bonds)} ligand-receptor H-bonds over {table.n_frames} frames. Results saved in '{output_dir}'.")
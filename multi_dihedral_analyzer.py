@@ -4,78 +4,36 @@
 # GitHub: github.com/richardloopez
 # Citation: If you use this code, please cite Lopez-Corbalan, R.
 
+import csv
 import os
 import subprocess
-import tempfile
+import sys
 import readline
 import shutil
-import pandas as pd
-import glob
 
-#############################################################################################################################################
-# Input -> Dihedrals, and parameters for analysis. REVIEEW EACH SECTION CAREFULLY. #
-#############################################################################################################################################
-
-################################## DIHEDRALS: DEFINITION ##################################
-
-all_dihedrals = [
-    
-("dihedral_1R1", [1, 2, 15, 16]),
-("dihedral_1R2", [11, 14, 25, 26]),
-
-("dihedral_2R1", [1, 15, 16, 17]),
-("dihedral_2R2", [14, 25, 26, 27]),
-
-("dihedral_3R1", [15, 16, 17, 19]),
-("dihedral_3R2", [25, 26, 27, 29]),
-
-("dihedral_4R1", [16, 17, 19, 21]),
-("dihedral_4R2", [26, 27, 29, 31])
-
-]
-
-################################## DIHEDRAL: GROUPING ##################################
-
-range_grouper_dihedral_1_A = [271, 90];        classification_grouper_dihedral_1_A = "A"
-range_grouper_dihedral_1_B = [91, 270];      classification_grouper_dihedral_1_B = "B"
+import numpy as np
 
-range_grouper_dihedral_2_K = [271, 90];        classification_grouper_dihedral_2_K = "K"
-range_grouper_dihedral_2_L = [91, 270];      classification_grouper_dihedral_2_L = "L"   
+# Dihedral state table and classifier (NumPy only)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from amber_native.dihedrals import StateTable, circular_histogram, iter_dihedrals
 
-range_grouper_dihedral_3_Q = [271, 90];        classification_grouper_dihedral_3_Q = "Q"      
-range_grouper_dihedral_3_R = [91, 270];      classification_grouper_dihedral_3_R = "R"
+# Native trajectory reader (optional): no cpptraj needed
+try:
+    from amber_native.prmtop import read_prmtop
+    from amber_native.segments import open_trajectory
+except ImportError:
+    open_trajectory = None
 
-range_grouper_dihedral_4_Y = [271, 90];        classification_grouper_dihedral_4_Y = "Y"
-range_grouper_dihedral_4_Z = [91, 270];      classification_grouper_dihedral_4_Z = "Z"
-
-
-# Function to create lists of atom identifiers for each dihedral (needed for cpptraj input)
-
-
-    
-def put_atom_in_dihedrals():
-    for name, dihedral in all_dihedrals:
-        globals()[f"{name}_at"] = []
-        for atom in dihedral:
-            globals()[f"{name}_at"].append(f"@{atom}")
-
-put_atom_in_dihedrals()
-
-
-
-################################## DIHEDRAL: MAKE SURE EACH COMBINATION IS CORRECT ##################################
+#############################################################################################################################################
+# Input -> Dihedrals, and parameters for analysis. REVIEEW EACH SECTION CAREFULLY. #
+#############################################################################################################################################
 
+################################## DIHEDRALS: DEFINITION AND GROUPING ##################################
 
-all_dihedrals_ranges = [
-    ("dihedral_1R1", dihedral_1R1_at, range_grouper_dihedral_1_A, classification_grouper_dihedral_1_A, range_grouper_dihedral_1_B, classification_grouper_dihedral_1_B),
-    ("dihedral_1R2", dihedral_1R2_at, range_grouper_dihedral_1_A, classification_grouper_dihedral_1_A, range_grouper_dihedral_1_B, classification_grouper_dihedral_1_B),
-    ("dihedral_2R1", dihedral_2R1_at, range_grouper_dihedral_2_K, classification_grouper_dihedral_2_K, range_grouper_dihedral_2_L, classification_grouper_dihedral_2_L),
-    ("dihedral_2R2", dihedral_2R2_at, range_grouper_dihedral_2_K, classification_grouper_dihedral_2_K, range_grouper_dihedral_2_L, classification_grouper_dihedral_2_L),
-    ("dihedral_3R1", dihedral_3R1_at, range_grouper_dihedral_3_Q, classification_grouper_dihedral_3_Q, range_grouper_dihedral_3_R, classification_grouper_dihedral_3_R),
-    ("dihedral_3R2", dihedral_3R2_at, range_grouper_dihedral_3_Q, classification_grouper_dihedral_3_Q, range_grouper_dihedral_3_R, classification_grouper_dihedral_3_R),
-    ("dihedral_4R1", dihedral_4R1_at, range_grouper_dihedral_4_Y, classification_grouper_dihedral_4_Y, range_grouper_dihedral_4_Z, classification_grouper_dihedral_4_Z),
-    ("dihedral_4R2", dihedral_4R2_at, range_grouper_dihedral_4_Y, classification_grouper_dihedral_4_Y, range_grouper_dihedral_4_Z, classification_grouper_dihedral_4_Z)
-]
+# JSON table with the dihedrals (1-based atoms) and the circular states of each one: any number of
+# [low, high) ranges per dihedral, or {"auto": {...}} to find the states at the minima of the angle
+# histogram. Dihedrals of symmetric arms can share a state set. See amber_native/dihedrals.py.
+state_table_file = "dihedral_states.json"
 
 ################################## CPPTRAJ INPUT ##################################
 
@@ -94,9 +52,11 @@ this_script_name = "Multi_dihedral_analyzer.py" # Only needed if you want to cop
 # Dihedral calculation
 #############################################################################################################################################
 
-# Move to a new directory
+state_table = StateTable(state_table_file)
+
+# Move to a new directory (the trajectory is read in place, not copied)
 
-dataset_name = destination_folder_name  
+dataset_name = destination_folder_name
 new_dir = (f"{dataset_name}")
 os.mkdir(new_dir)
 os.chdir(new_dir)
@@ -105,120 +65,95 @@ original_parm = os.path.join(os.pardir, parm_file)
 destination_parm = os.path.join(os.getcwd(), parm_file)
 shutil.copy(original_parm, destination_parm)
 
-
 original_traj = os.path.join(os.pardir, traj_file)
-destination_traj = os.path.join(os.getcwd(), traj_file)
-shutil.copy(original_traj, destination_traj)
 
 original_this_script = os.path.join(os.pardir, this_script_name)
 destination_this_script = os.path.join(os.getcwd(), this_script_name)
 shutil.copy(original_this_script, destination_this_script)
 
+shutil.copy(state_table.path if state_table.path.is_absolute() else os.path.join(os.pardir, state_table.path),
+            os.path.basename(state_table_file))
 
-#################################################################################################
-# Input preparation for cpptraj
 
-with open("dihedrals_input.txt", "w") as f:
-    f.write(f"""# Dihedral calculations
-parm {parm_file}
-trajin {traj_file}
-""")    
-    for name, dihedral, range1, class1, range2, class2 in all_dihedrals_ranges:
-        f.write(f"dihedral {name} {dihedral[0]} {dihedral[1]} {dihedral[2]} {dihedral[3]} out {name}.dat range360\n")
-    f.write(f"""run 
-quit
-            """)
-        
-        
-# Execute cpptraj
-subprocess.run(["cpptraj", "-i", "dihedrals_input.txt"])
+def native_angles():
+    """Yields (0-based frames, angles) of all dihedrals, chunk by chunk, straight from the trajectory."""
+    with open_trajectory(original_traj, read_prmtop(destination_parm)) as trajectory:
+        yield from iter_dihedrals(trajectory, state_table.quads)
 
-##############################################################################################
-##############################################################################################
-
-#############################################################################################################################################
-# CSV Generation (cpptraj dihedrals output)
-#############################################################################################################################################
 
+def cpptraj_angles():
+    """Yields (0-based frames, angles) of all dihedrals from one cpptraj run (used without amber_native)."""
+    if not all(os.path.exists(f"{name}.dat") for name in state_table.names):
+        with open("dihedrals_input.txt", "w") as f:
+            f.write("# Dihedral calculations\n")
+            f.write(f"parm {parm_file}\n")
+            f.write(f"trajin {original_traj}\n")
+            for name, quad in zip(state_table.names, state_table.quads + 1):
+                f.write(f"dihedral {name} @{quad[0]} @{quad[1]} @{quad[2]} @{quad[3]} out {name}.dat range360\n")
+            f.write("run\nquit\n")
+        subprocess.run(["cpptraj", "-i", "dihedrals_input.txt"], check=True)
 
-####################################################### Summary CSV #########################################################################
+    columns = [np.loadtxt(f"{name}.dat", comments="#", ndmin=2) for name in state_table.names]
+    yield columns[0][:, 0].astype(np.int64) - 1, np.column_stack([column[:, 1] for column in columns])
 
-dat_files = glob.glob("*.dat")
 
-dataframes = []
+angle_chunks = native_angles if open_trajectory is not None else cpptraj_angles
 
-for file in dat_files:
-    # Dihedral name is extracted from the header (position 1) of each .dat file
-    with open(file) as f:
-        header = f.readline()
-        dihedral_name = header.split()[1]
-    # Read the data, ignoring the first row (header) and using whitespace as delimiter
-    df = pd.read_csv(file, delim_whitespace=True, skiprows=1, names=["Frame", dihedral_name])
-    dataframes.append(df.set_index("Frame"))
 
-# Une todos los dataframes por el índice Frame
-result = pd.concat(dataframes, axis=1)
-
-# Guarda el resultado en un CSV
-result.to_csv("dihedrals_summary.csv")
-
-
-
-####################################################### Summary with classification CSV #########################################################################
+#############################################################################################################################################
+# State definitions (automatic state sets need one histogram pass first)
+#############################################################################################################################################
 
-summary_csv_df = pd.read_csv("dihedrals_summary.csv")
+histograms = {}
+auto_sets = state_table.auto_sets()
+if auto_sets:
+    for frames, angles in angle_chunks():
+        for state_set in auto_sets:
+            columns = [k for k, name in enumerate(state_table.state_sets) if name == state_set]
+            counts = circular_histogram(angles[:, columns], state_table.auto_bin_width(state_set)).sum(axis=0)
+            histograms[state_set] = histograms.get(state_set, 0) + counts
 
-# Function to check if a value is inside a circular angular range (degrees from 0 to 360)
-def in_circular_range(val, low, high):
-    if low <= high:
-        return low <= val < high
-    else:
-        # Circular range case: (e.g., 271, 90) means [271,360) U [0,90)
-        return val >= low or val < high
+classifier = state_table.classifier(histograms)
 
-# Add a blank column for classification
-summary_csv_df["classification"] = ""
+with open("dihedral_state_definitions.csv", "w", newline="") as f:
+    writer = csv.writer(f, lineterminator="\n")
+    writer.writerow(["dihedral", "state_set", "label", "low", "high"])
+    for name, state_set, bins in zip(state_table.names, state_table.state_sets, classifier.bins):
+        for label, (low, high) in zip(bins.labels, bins.ranges):
+            writer.writerow([name, state_set, label, f"{low:.2f}", f"{high:.2f}"])
 
-# Assign classification for each frame and dihedral using circular ranges
-for idx, row in summary_csv_df.iterrows():
-    frame_classifications = []
-    for name in all_dihedrals_ranges:
-        col = name[0]
-        if col in summary_csv_df.columns:
-            val = row[col]
-            # Use in_circular_range instead of basic if condition
-            if in_circular_range(val, name[2][0], name[2][1]):
-                frame_classifications.append(name[3])
-            elif in_circular_range(val, name[4][0], name[4][1]):
-                frame_classifications.append(name[5])
-            else:
-                frame_classifications.append("X")  # "X" for out-of-range
-    # Join all classifications for this frame
-    summary_csv_df.at[idx, "classification"] = "".join(frame_classifications)
 
-# Save the updated DataFrame to CSV
-summary_csv_df.to_csv("dihedrals_summary_with_classification.csv", index=False)
+#############################################################################################################################################
+# CSV Generation: one integer conformation code per frame
+#############################################################################################################################################
 
+# Angles are written chunk by chunk; only one conformation code per frame is kept
+codes = []
+with open("dihedrals_summary.csv", "w", newline="") as summary_file, \
+        open("dihedrals_summary_with_classification.csv", "w", newline="") as classified_file:
+    summary_file.write(",".join(["Frame", *state_table.names]) + "\n")
+    classified_file.write(",".join(["Frame", *state_table.names, "classification"]) + "\n")
+    for frames, angles in angle_chunks():
+        chunk_codes = classifier.encode(angles)
+        labels, inverse = classifier.labels(chunk_codes)
+        rows = [f"{frame}," + ",".join(f"{angle:.4f}" for angle in row) for frame, row in zip(frames + 1, angles)]
+        summary_file.write("".join(row + "\n" for row in rows))
+        classified_file.write("".join(f"{row},{labels[label]}\n" for row, label in zip(rows, inverse)))
+        codes.append(chunk_codes)
 
 
 ####################################################### classification grouped by conformation CSV #########################################################################
 
-
-# Group frames by unique set of classification characters (order-dependent, keep repeats)
-# Here, we treat the classification string as a unique conformation label
-
-# Create a new DataFrame grouping by the full classification string
-grouped = summary_csv_df.groupby("classification")
-
-# Prepare a summary DataFrame: classification, number of frames, frame indices (starting from 1)
-group_summary = pd.DataFrame({
-    "classification": grouped.groups.keys(),
-    "num_frames": [len(grouped.groups[key]) for key in grouped.groups.keys()],
-    "frame_indices": [[i + 1 for i in grouped.groups[key]] for key in grouped.groups.keys()]
-})
-
-# Save the summary DataFrame to CSV
-group_summary.to_csv("dihedrals_grouped_by_conformation.csv", index=False)
-
-
-
+# Frames grouped by conformation: np.unique over the codes, then one split of the sorted frames
+codes = np.concatenate(codes) if codes else np.empty(0, dtype=np.int64)
+np.save("conformation_codes.npy", codes)
+labels, inverse = classifier.labels(codes)
+order = np.argsort(inverse, kind="stable")
+groups = np.split(order + 1, np.cumsum(np.bincount(inverse, minlength=len(labels)))[:-1])
+with open("dihedrals_grouped_by_conformation.csv", "w", newline="") as f:
+    writer = csv.writer(f, lineterminator="\n")
+    writer.writerow(["classification", "num_frames", "frame_indices"])
+    for group in sorted(range(len(labels)), key=labels.__getitem__):
+        writer.writerow([labels[group], len(groups[group]), "[" + ", ".join(map(str, groups[group])) + "]"])
+
+print(f"{len(codes)} frames, {len(labels)} conformations. Results saved in '{destination_folder_name}'.")
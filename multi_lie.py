@@ -4,17 +4,31 @@
 # GitHub: github.com/richardloopez
 # Citation: If you use this code, please cite Lopez-Corbalan, R.
 
-import os
+import concurrent.futures
 import csv
 import os
-import shutil
 import subprocess
+import sys
 import tempfile
 import readline
 import numpy as np
-import re
 
-# Inputs from the user 
+# Mergeable running statistics (NumPy only): no per-frame series are kept
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from amber_native.stats import RunningCovariance
+
+# Native LIE engine and trajectory reader (optional): no cpptraj needed
+try:
+    from amber_native.energy import interaction_energies
+    from amber_native.prmtop import read_prmtop
+    from amber_native.segments import open_trajectory
+except ImportError:
+    interaction_energies = open_trajectory = None
+
+# Memory all concurrent cpptraj passes together may spend on LIE datasets (two doubles per pair and frame)
+MEMORY_BUDGET = 1024 ** 3
+
+# Inputs from the user
 
 parm_file = input("Enter the parameter file name (*.prmtop): ")  # Your parameter file
 traj_file = input("Enter the trajectory file name (*.dcd or *.mdcrd): ")  # Your trajectory file
@@ -39,169 +53,118 @@ ranger_expander(ligand_inp, ligand_definitive)
 ranger_expander(receptor_inp, receptor_definitive)
 
 
-# Change to the final dir
+# Change to the final dir (cpptraj reads the inputs in place, nothing is copied)
 
-base_folder = os.getcwd()
+parm_file_path = os.path.abspath(parm_file)
+traj_file_path = os.path.abspath(traj_file)
 
 os.makedirs("multi_lie_analysis", exist_ok=True)
 os.chdir("multi_lie_analysis")
-cwd = os.getcwd()
-
-parm_file_path = os.path.join(base_folder, parm_file)
-parm_file_destination = os.path.join(cwd, parm_file)
-
-traj_file_path = os.path.join(base_folder, traj_file)
-traj_file_destination = os.path.join(cwd, traj_file)
-
-shutil.copy2(parm_file_path, parm_file_destination)
-shutil.copy2(traj_file_path, traj_file_destination)
-
-
-
-
-# Cpptraj lie
-
-for resid_l in ligand_definitive:
-    for resid_r in receptor_definitive:
-
-
-        # Create a temporary file for cpptraj commands
-        with tempfile.NamedTemporaryFile('w', delete=False) as tmpfile:
-            tmpfile_name = tmpfile.name
-            # Write the cpptraj commands to the temporary file
-            tmpfile.write(f"""
-parm {parm_file}
-trajin {traj_file}
-lie out lie_LR{resid_l}_RR{resid_r}.dat :{resid_l} :{resid_r}
-run
-quit
-""")
-        # Execute cpptraj with the temporary command file
-        subprocess.run(["cpptraj", "-i", tmpfile_name])
-
-        # Remove the temporary file after execution
-        os.remove(tmpfile_name)
-
-        print(f"Lie analysis completed. Results saved in 'lie_LR{resid_l}_RR{resid_r}.dat'.")
-        
-        
-# Manage the data from lie.dat
-
-
-
-def process_lie_file(filepath):
-    with open(filepath, "r") as file:
-        lines = file.readlines()
 
-    # Extract numeric data (skip headers or malformed lines)
-    data = []
-    for line in lines:
-        parts = line.strip().split()
-        if len(parts) == 3:
-            try:
-                data.append([float(parts[0]), float(parts[1]), float(parts[2])])
-            except ValueError:
-                continue  # skip lines that are not numeric
 
-    data = np.array(data)
+# cpptraj fallback: residue pairs into passes that fit MEMORY_BUDGET, frames into blocks
+
+def count_frames(parm_file, traj_file):
+    """Frames in the trajectory, or None when the native reader is not available."""
+    if open_trajectory is None:
+        return None
+    with open_trajectory(traj_file, read_prmtop(parm_file)) as trajectory:
+        return trajectory.n_frames
+
+
+def frame_blocks(n_frames, n_blocks):
+    """1-based inclusive (first, last) frame ranges for cpptraj trajin; one open range if n_frames is unknown."""
+    if not n_frames:
+        return [(None, None)]
+    edges = np.linspace(0, n_frames, min(n_blocks, n_frames) + 1).astype(int)
+    return [(int(first) + 1, int(last)) for first, last in zip(edges[:-1], edges[1:])]
+
+
+def run_lie_pass(pairs, first, last):
+    """
+    Runs one cpptraj pass with a `lie` dataset per (ligand, receptor) pair over frames first..last.
+
+    Returns:
+        RunningCovariance: EELEC (x) and EVDW (y) statistics of every pair, in pair order.
+    """
+    frames = "" if first is None else f" {first} {last}"
+    with tempfile.TemporaryDirectory(dir=".") as tmpdir:
+        input_file = os.path.join(tmpdir, "lie.in")
+        output_file = os.path.join(tmpdir, "lie.dat")
+        with open(input_file, "w") as f:
+            f.write(f"parm {parm_file_path}\n")
+            f.write(f"trajin {traj_file_path}{frames}\n")
+            for resid_l, resid_r in pairs:
+                f.write(f"lie LR{resid_l}_RR{resid_r} :{resid_l} :{resid_r} out {output_file}\n")
+            f.write("run\nquit\n")
+        subprocess.run(["cpptraj", "-i", input_file], check=True, stdout=subprocess.DEVNULL)
+        data = np.loadtxt(output_file, comments="#", ndmin=2)[:, 1:]
+    return RunningCovariance(len(pairs)).update(data[:, 0::2], data[:, 1::2])
+
+
+def cpptraj_lie(pairs):
+    """
+    Per-pair LIE statistics from cpptraj.
+
+    Pairs are batched into passes and the trajectory is split into frame
+    blocks; every (pass, block) is an independent cpptraj process reduced to
+    running statistics, merged exactly afterwards. Up to one process per core
+    runs at a time, so each pass gets its share of MEMORY_BUDGET.
+    """
+    workers = os.cpu_count() or 1
+    n_frames = count_frames(parm_file_path, traj_file_path)
+    blocks = frame_blocks(n_frames, workers)
+    block_frames = max(last - first + 1 for first, last in blocks) if n_frames else 1
+    pairs_per_pass = len(pairs) if not n_frames else max(1, MEMORY_BUDGET // (workers * 16 * block_frames))
+    passes = [pairs[i:i + pairs_per_pass] for i in range(0, len(pairs), pairs_per_pass)]
+    moments = [RunningCovariance(len(chunk)) for chunk in passes]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_lie_pass, chunk, first, last): (index, block)
+                   for index, chunk in enumerate(passes) for block, (first, last) in enumerate(blocks)}
+        for future in concurrent.futures.as_completed(futures):
+            index, block = futures[future]
+            moments[index].merge(future.result())
+            print(f"Lie pass completed: {len(passes[index])} residue pairs, frame block {block + 1}/{len(blocks)}.")
+
+    return {pair: moments[index][k] for index, chunk in enumerate(passes) for k, pair in enumerate(chunk)}
+
+
+def native_lie(pairs):
+    """Per-pair LIE statistics from the native energy engine: one trajectory pass, frame blocks over all cores."""
+    # Pairs with a residue missing from the topology stay empty (reported as invalid, like cpptraj)
+    energies = {pair: RunningCovariance() for pair in pairs}
+    n_residues = read_prmtop(parm_file_path).n_residues
+    ligand = sorted({resid_l for resid_l, _ in pairs if 1 <= resid_l <= n_residues})
+    receptor = sorted({resid_r for _, resid_r in pairs if 1 <= resid_r <= n_residues})
+    if not ligand or not receptor:
+        return energies
+    statistics = interaction_energies(parm_file_path, traj_file_path, ":" + ",".join(map(str, ligand)),
+                                      ":" + ",".join(map(str, receptor)), processes=os.cpu_count() or 1)
+
+    requested_l = np.array([resid_l - 1 for resid_l, _ in pairs])
+    requested_r = np.array([resid_r - 1 for _, resid_r in pairs])
+    rows = np.minimum(np.searchsorted(statistics.residues_a, requested_l), len(statistics.residues_a) - 1)
+    columns = np.minimum(np.searchsorted(statistics.residues_b, requested_r), len(statistics.residues_b) - 1)
+    found = (statistics.residues_a[rows] == requested_l) & (statistics.residues_b[columns] == requested_r)
+    for pair, row, column in zip(np.array(pairs)[found].tolist(), rows[found], columns[found]):
+        energies[tuple(pair)] = statistics.moments[row, column]
+    print(f"Native lie analysis completed: {int(found.sum())} residue pairs, {statistics.n_frames} frames.")
+    return energies
+
+pairs = [(resid_l, resid_r) for resid_l in ligand_definitive for resid_r in receptor_definitive]
+if interaction_energies is not None and not set(ligand_definitive) & set(receptor_definitive):
+    energies = native_lie(pairs)
+else:
+    energies = cpptraj_lie(pairs)
 
-    if data.shape[0] == 0:
-        print(f"Empty or invalid file: {filepath}")
-        return
-
-    # Calculate averages and standard deviations
-    eelec_avg = np.mean(data[:, 1])
-    eelec_std = np.std(data[:, 1])
-    evdw_avg = np.mean(data[:, 2])
-    evdw_std = np.std(data[:, 2])
-
-    summary_line = (
-        f"""
-        # EELEC_AV: {eelec_avg:.4f}
-        # EELEC_STDDEV: {eelec_std:.4f}
-        # EVDW_AV: {evdw_avg:.4f}
-        # EVDW_STDDEV: {evdw_std:.4f}
-        """
-    )
-
-    # Prepend the summary line to the file
-    with open(filepath, "w") as file:
-        file.write(summary_line)
-        file.writelines(lines)
-
-    print(f"Processed: {filepath}")
-
-
-
-
-for filename in os.listdir(cwd):
-    if filename.endswith(".dat"):
-        filepath = os.path.join(cwd, filename)
-        process_lie_file(filepath)
-
-
-        
-        
-        
-# Take the final data form lie.dat        
-
-
-def take_data_for_final_csv(filepath):
-    data_dict = {}
-    filename = os.path.basename(filepath)
-    
-    with open(filepath, "r") as file:
-        lines = file.readlines()
-
-    # Temporary variables to store values for the current file
-    EELEC_AV = None
-    EELEC_STDDEV = None
-    EVDW_AV = None
-    EVDW_STDDEV = None
-
-    for line in lines:
-        parts = line.split()
-
-        # Look for tags and extract the last element which should be the value
-        if "EELEC_AV:" in line:
-            EELEC_AV = float(parts[-1])
-        elif "EELEC_STDDEV:" in line:
-            EELEC_STDDEV = float(parts[-1])
-        elif "EVDW_AV:" in line:
-            EVDW_AV = float(parts[-1])
-        elif "EVDW_STDDEV:" in line:
-            EVDW_STDDEV = float(parts[-1])
-
-    # Store the extracted values in a dictionary with filename as key
-    data_dict[filename] = {
-        "EELEC_AV": EELEC_AV,
-        "EELEC_STDDEV": EELEC_STDDEV,
-        "EVDW_AV": EVDW_AV,
-        "EVDW_STDDEV": EVDW_STDDEV
-    }
-
-    return data_dict
-
-
-# Dictionary to accumulate data from all files
-all_data = {}
-
-for filename in os.listdir(cwd):
-    if filename.endswith(".dat"):
-        filepath = os.path.join(cwd, filename)
-        file_data = take_data_for_final_csv(filepath)
-
-        # Update the main dictionary with data from this file
-        all_data.update(file_data)
-        
-        
 
 # Write ultimate csv
 
-def write_data_to_csv(data_dict, output_filename):
+def write_data_to_csv(energies, output_filename):
     headers = [
-        "filename", "R1", "R2", 
-        "EELEC_AV", "EELEC_STDDEV", 
+        "filename", "R1", "R2",
+        "EELEC_AV", "EELEC_STDDEV",
         "EVDW_AV", "EVDW_STDDEV",
         "TOTAL_AV", "TOTAL_STDDEV"
     ]
@@ -210,44 +173,24 @@ def write_data_to_csv(data_dict, output_filename):
         writer = csv.DictWriter(csvfile, fieldnames=headers)
         writer.writeheader()
 
-        for filename, values in data_dict.items():
-            # Extract R1 and R2 from filename using regex
-            match = re.match(r"lie_LR(\d+)_RR(\d+)\.dat", filename)
-            if match:
-                R1 = int(match.group(1))
-                R2 = int(match.group(2))
-            else:
-                R1 = ""
-                R2 = ""
-
-            # Get values, defaulting to inf if missing
-            EELEC_AV = values.get("EELEC_AV", "inf")
-            EELEC_STDDEV = values.get("EELEC_STDDEV", "inf")
-            EVDW_AV = values.get("EVDW_AV", "inf")
-            EVDW_STDDEV = values.get("EVDW_STDDEV", "inf")
-
-            # Calculate TOTAL_AV and TOTAL_STDDEV
-            TOTAL_AV = EELEC_AV + EVDW_AV
-            TOTAL_STDDEV = (EELEC_STDDEV ** 2 + EVDW_STDDEV ** 2) ** 0.5
+        for (R1, R2), moments in energies.items():
+            if moments.count == 0:
+                print(f"Empty or invalid LIE data for residues {R1} and {R2}")
+                continue
 
+            # TOTAL_STDDEV includes the EELEC-EVDW covariance (the terms are not independent)
             row = {
-                "filename": filename,
+                "filename": f"lie_LR{R1}_RR{R2}.dat",
                 "R1": R1,
                 "R2": R2,
-                "EELEC_AV": EELEC_AV,
-                "EELEC_STDDEV": EELEC_STDDEV,
-                "EVDW_AV": EVDW_AV,
-                "EVDW_STDDEV": EVDW_STDDEV,
-                "TOTAL_AV": TOTAL_AV,
-                "TOTAL_STDDEV": TOTAL_STDDEV
+                "EELEC_AV": round(float(moments.x.mean), 4),
+                "EELEC_STDDEV": round(float(moments.x.std()), 4),
+                "EVDW_AV": round(float(moments.y.mean), 4),
+                "EVDW_STDDEV": round(float(moments.y.std()), 4),
+                "TOTAL_AV": round(float(moments.sum_mean()), 4),
+                "TOTAL_STDDEV": round(float(moments.sum_std()), 4)
             }
             writer.writerow(row)
 
-write_data_to_csv(all_data, "final_results_with_residues.csv")
+write_data_to_csv(energies, "final_results_with_residues.csv")
 print("Data saved to final_results_with_residues.csv")
-
-        
-        
-        
-        
-        
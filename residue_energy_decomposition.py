@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# Author: Richard Lopez Corbalan
+# GitHub: github.com/richardloopez
+# Citation: If you use this code, please cite Lopez-Corbalan, R.
+
+import csv
+import os
+import sys
+import readline
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from amber_native.energy import DIELECTRIC, ELEC_CUTOFF, VDW_CUTOFF, interaction_energies
+from amber_native.prmtop import read_prmtop
+
+readline.parse_and_bind("tab: complete")
+
+# Request parameters from the user
+parm_file = input("Enter the parameter file name (*.prmtop): ")
+traj_file = input("Enter the trajectory file name (*.dcd, *.mdcrd, *.nc or manifest *.json): ")
+ligand_mask = input("Ligand mask (e.g., :1): ").strip()
+receptor_mask = input("Receptor mask (e.g., :2-25): ").strip()
+elec_cutoff = float(input(f"Electrostatic cutoff (Å) [{ELEC_CUTOFF}]: ").strip() or ELEC_CUTOFF)
+vdw_cutoff = float(input(f"Lennard-Jones cutoff (Å) [{VDW_CUTOFF}]: ").strip() or VDW_CUTOFF)
+dielectric = float(input(f"Dielectric constant [{DIELECTRIC}]: ").strip() or DIELECTRIC)
+save_frames = input("Also save the per-frame energy matrices? (yes/no): ").strip().lower() == "yes"
+output_dir = "energy_decomposition"  # Directory to save results
+os.makedirs(output_dir, exist_ok=True)
+
+# One pass over the trajectory, frame blocks spread over all cores
+topology = read_prmtop(parm_file)
+frames_file = os.path.join(output_dir, "residue_pair_energies_per_frame.npy") if save_frames else None
+statistics = interaction_energies(parm_file, traj_file, ligand_mask, receptor_mask, elec_cutoff=elec_cutoff,
+                                  vdw_cutoff=vdw_cutoff, dielectric=dielectric,
+                                  processes=os.cpu_count() or 1, frames_file=frames_file)
+
+labels_a = [f"{topology.residue_name(r)}_{r + 1}" for r in statistics.residues_a]
+labels_b = [f"{topology.residue_name(r)}_{r + 1}" for r in statistics.residues_b]
+elec_mean, elec_std = statistics.elec.mean, statistics.elec.std()
+vdw_mean, vdw_std = statistics.vdw.mean, statistics.vdw.std()
+total_mean, total_std = statistics.total_mean(), statistics.total_std()
+
+# Residue pairs that interact at some point, most favourable first
+rows, columns = np.nonzero((statistics.elec.m2 > 0) | (statistics.vdw.m2 > 0) | (total_mean != 0))
+order = np.argsort(total_mean[rows, columns], kind="stable")
+with open(os.path.join(output_dir, "residue_pair_energies.csv"), "w", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow(["Ligand_Residue", "Receptor_Residue", "EELEC_AV", "EELEC_STDDEV",
+                     "EVDW_AV", "EVDW_STDDEV", "TOTAL_AV", "TOTAL_STDDEV"])
+    for a, b in zip(rows[order], columns[order]):
+        writer.writerow([labels_a[a], labels_b[b], f"{elec_mean[a, b]:.4f}", f"{elec_std[a, b]:.4f}",
+                         f"{vdw_mean[a, b]:.4f}", f"{vdw_std[a, b]:.4f}", f"{total_mean[a, b]:.4f}",
+                         f"{total_std[a, b]:.4f}"])
+
+# Full matrix of average total interaction energies (ligand residues x receptor residues)
+with open(os.path.join(output_dir, "residue_energy_matrix.csv"), "w", newline="") as f:
+    writer = csv.writer(f)
+    writer.writerow(["Residue", *labels_b])
+    for a, label in enumerate(labels_a):
+        writer.writerow([label, *[f"{value:.4f}" for value in total_mean[a]]])
+
+print(f"{len(rows)} interacting residue pairs over {statistics.n_frames} frames. Results saved in '{output_dir}'.")
@@ -6,12 +6,21 @@
 
 import os
 import subprocess
+import sys
 import readline
 
+# Native H-bond engine (optional): no cpptraj needed
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+try:
+    import numpy as np
+    from amber_native.hbonds import atom_label, find_hbonds
+    from amber_native.prmtop import read_prmtop
+except ImportError:
+    find_hbonds = None
+
 # Request parameters from the user
 parm_file = input("Enter the parameter file name (*.prmtop): ")  # Your parameter file
-traj_file = input("Enter the trajectory file name (*.dcd or *.mdcrd): ")  # Your trajectory file
-num_frames = int(input("Enter the total number of frames: "))  # Total number of frames (adjust as per your file)
+traj_file = input("Enter the trajectory file name (*.dcd, *.mdcrd, *.nc or manifest *.json): ")  # Your trajectory file
 residues = input("Enter the number of the residues to study: ")  # Number of the resiudes to consider
 include_intramol = input("Do you want to include intramolecular hydrogen bonds? (y/n): ").lower() == 'y'  # Ask if user wants to include intramol interactions
 output_dir = "hbond_results"  # Directory to save results
@@ -19,43 +28,97 @@ output_dir = "hbond_results"  # Directory to save results
 # Create output directory if it doesn't exist
 os.makedirs(output_dir, exist_ok=True)
 
-# Initialize results table
+
+def read_avgout(avg_file):
+    """Maps every H-bond legend (Acceptor-Donor-H, as in cpptraj series) to its avgout row."""
+    averages = {}
+    with open(avg_file, "r") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            fields = line.split()
+            acceptor, donor_h, donor = fields[0], fields[1], fields[2]
+            averages[f"{acceptor}-{donor}-{donor_h.split('@')[-1]}"] = fields
+    return averages
+
+
+def read_series(series_file, averages):
+    """
+    Yields (frame, interactions) from a cpptraj `uuseries` file, one line at a time.
+
+    The series only stores presence (0/1), so every interaction carries the
+    distance and angle averaged over the frames in which that H-bond exists.
+    """
+    with open(series_file, "r") as f:
+        legends = f.readline().split()[1:]  # Skip '#Frame'
+        rows = [averages.get(legend) for legend in legends]
+        for line in f:
+            values = line.split()
+            if not values:
+                continue
+            interactions = []
+            for row, present in zip(rows, values[1:]):
+                if row is not None and float(present) > 0:
+                    acceptor, donor_h, donor, avg_distance, avg_angle = row[0], row[1], row[2], row[5], row[6]
+                    interactions.append(f"{acceptor} {donor_h} {donor} 1 1.0000 {avg_distance} {avg_angle}")
+            yield int(float(values[0])), interactions
+
+
+def native_frames(topology, table):
+    """Yields (frame, interactions) from a native H-bond table, with per-frame distances and angles."""
+    bounds = np.searchsorted(table.frames, np.arange(table.n_frames + 1))
+    labels = {}
+    for frame in range(table.n_frames):
+        interactions = []
+        for row in range(bounds[frame], bounds[frame + 1]):
+            atoms = (table.acceptors[row], table.hydrogens[row], table.donors[row])
+            for atom in atoms:
+                if atom not in labels:
+                    labels[atom] = atom_label(topology, atom)
+            interactions.append(f"{labels[atoms[0]]} {labels[atoms[1]]} {labels[atoms[2]]} 1 1.0000 "
+                                f"{table.distances[row]:.4f} {table.angles[row]:.4f}")
+        yield frame + 1, interactions
+
+
+# Initialize results table (number of frames comes from the trajectory itself)
 results = []
 interactions_per_frame = []  # List to store number of interactions per frame and the interactions
 
-# Loop through each frame of the trajectory
-for frame in range(1, num_frames + 1):
-    # Create cpptraj input file for this frame
-    input_file = f"cpptraj_input_{frame}.in"
+frame_source = None
+if find_hbonds is not None:
+    try:
+        table = find_hbonds(parm_file, traj_file, mask=f":{residues.replace(' ', '')}",
+                            intramolecular=include_intramol, processes=os.cpu_count() or 1)
+        frame_source = native_frames(read_prmtop(parm_file), table)
+        temp_files = ()
+    except (ValueError, OSError) as e:
+        print(f"[Warn] Native H-bond engine not possible ({e}). Falling back to cpptraj.")
+
+if frame_source is None:
+    # One cpptraj pass over the whole trajectory: per-H-bond time series plus averages
+    input_file = "cpptraj_hbond_series.in"
+    avg_file = "avg_hbond.dat"
+    series_file = "hbond_series.dat"
+    intramol_option = "" if include_intramol else " nointramol"
     with open(input_file, "w") as f:
         f.write(f"parm {parm_file}\n")
-        f.write(f"trajin {traj_file} {frame} {frame}\n")
-        # Add or exclude intramolecular option based on user input
-        intramol_option = "" if include_intramol else " nointramol"
-        f.write(f"hbond contacts :{residues} avgout avg_hbond.dat{intramol_option}\n")
-
-    # Run cpptraj for this frame
-    subprocess.run(["cpptraj", "-i", input_file])
-
-    # Read the output file and extract the interactions
-    output_file = "avg_hbond.dat"
-    with open(output_file, "r") as f:
-        lines = f.readlines()
-
-    # Extract hydrogen bond interactions and store them
-    interactions = []
-    for line in lines:
-        if not line.startswith("#Acceptor"):  # Add lines that don't start with "#Acceptor"
-            interactions.append(line.strip())
-
-    # Count the interactions and store them in the results
+        f.write(f"trajin {traj_file}\n")
+        f.write(f"hbond contacts :{residues} avgout {avg_file} series uuseries {series_file}{intramol_option}\n")
+        f.write("run\nquit\n")
+
+    subprocess.run(["cpptraj", "-i", input_file], check=True)
+    frame_source = read_series(series_file, read_avgout(avg_file))
+    temp_files = (input_file, avg_file, series_file)
+
+for frame, interactions in frame_source:
     num_interactions = len(interactions)
     results.append((frame, num_interactions, interactions))
     interactions_per_frame.append((frame, num_interactions, interactions))  # Store interactions per frame
 
-    # Clean up temporary files
-    os.remove(input_file)
-    os.remove(output_file)
+# Clean up temporary files
+for temp_file in temp_files:
+    if os.path.exists(temp_file):
+        os.remove(temp_file)
 
 # Write results to a CSV file with column headers
 with open(os.path.join(output_dir, "hbond_summary.csv"), "w") as f:
@@ -78,5 +141,4 @@ with open(os.path.join(output_dir, "interactions_per_frame.csv"), "w") as f:
         interactions_str = " | ".join([",".join(interaction.split()) for interaction in interactions])
         f.write(f"{frame},{num_interactions},{interactions_str}\n")
 
-print("Analysis complete. Results saved in 'hbond_summary.csv' and 'interactions_per_frame.csv'.")
-
+print(f"Analysis complete ({len(results)} frames). Results saved in 'hbond_summary.csv' and 'interactions_per_frame.csv'.")